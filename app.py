@@ -1,16 +1,34 @@
 # app.py
 import json
 import os
+import time
 from datetime import datetime
 import logging
 from functools import wraps
 
-from flask import Flask, request, jsonify, render_template, flash, session, redirect, url_for
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, render_template, flash, session, redirect, send_file, url_for, stream_with_context
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 import io
-import csv
+
+# NumPy, the export writers, the screening and job subsystems and the population
+# index are imported where they are used, so a cold start only pays for the routes
+# it serves (see warm_up for preloading them).
+import http_cache
+import jobs
+import metrics
+import rules
+import static_assets
+from history import FIELDS as HISTORY_FIELDS, PredictionHistory, normalize_timestamp
+from password_hashing import HasherBusyError, PasswordHasher
+from rate_limit import AdmissionError, get_admission_control
+from recommendations import (education_variant, get_educational_content, get_treatment_recommendations,
+                             recommendation_variant)
+from result_cache import cache_key, get_result_cache
+from user_store import UserExistsError, get_user_store
 
 # Load environment variables from .env file
 load_dotenv()
@@ -19,285 +37,245 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', 'your_super_secret_key_please_change_this_in_production_environment')
-CORS(app)
+# Compiled templates are cached here (and prebuilt by `flask --app app prebuild`)
+TEMPLATE_CACHE_DIR = os.getenv('TEMPLATE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'template_cache'))
 
-USERS_FILE = 'users.json'
+# Reverse proxies in front of the app whose X-Forwarded-For is trusted (the client IP rate limits use)
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', 0))
 
-def load_users():
-    if not os.path.exists(USERS_FILE):
-        return {}
-    try:
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        logger.warning(f"Error decoding JSON from {USERS_FILE}. Returning empty users dictionary.")
-        return {}
-    except Exception as e:
-        logger.error(f"Error loading users from {USERS_FILE}: {e}")
-        return {}
+bp = Blueprint('main', __name__)
+
+user_store = get_user_store()
+prediction_history = PredictionHistory()
+predict_cache = get_result_cache()
+password_hasher = PasswordHasher()
+job_queue = jobs.JobQueue()
+admission_control = get_admission_control()
+
+MAX_BATCH_ROWS = int(os.getenv('MAX_BATCH_ROWS', 50000))
+MAX_JOB_BATCH_ROWS = int(os.getenv('MAX_JOB_BATCH_ROWS', 1000000))
+BATCH_FIELDS = ('Age', 'BMI', 'HbA1c')
+# Endpoints behind admission control (rate_limit.py)
+RATE_LIMITED_ENDPOINTS = {'main.api_predict', 'main.api_predict_batch', 'main.api_predict_bulk'}
+# Endpoints that read profiles; requests to them aren't profiled themselves
+PROFILE_ENDPOINTS = {'main.list_profiles', 'main.get_profile'}
+
+if metrics.PROFILING_ENABLED and not metrics.PROFILE_TOKEN:
+    logger.warning("PROFILING_ENABLED is set but PROFILE_TOKEN is not; profiling stays off")
+
+def batch_rule_results(ruleset):
+    # Per-rule result objects for the batch API; every record matched by the same rule
+    # serializes to the same fields, so rows can share these instead of building dicts.
+    return ruleset.derived('batch_results', lambda rs: [
+        {"prediction": prediction, "risk_level": risk_level, "diabetes_type": diabetes_type, "explanation": [explanation]}
+        for _, prediction, risk_level, diabetes_type, _, explanation in rs.rules
+    ])
+
+_fragments = {}
+
+def render_fragment(template, variant, **context):
+    """
+    Render a partial once per variant and reuse its HTML. The recommendation and
+    education lists only depend on (prediction, diabetes_type), so /predict composes
+    its page from these instead of looping over the lists on every request.
+    """
+    key = (template, variant)
+    html = _fragments.get(key)
+    if html is None or current_app.debug:
+        html = _fragments[key] = Markup(render_template(template, **context))
+    return html
+
+def result_fragments(prediction, diabetes_type, recommendations, educational_content):
+    """The cached pieces of the /predict result page, as render_template keyword arguments."""
+    variant = recommendation_variant(prediction, diabetes_type)
+    json_key = ('recommendations_json', variant)
+    if json_key not in _fragments or current_app.debug:
+        _fragments[json_key] = current_app.jinja_env.call_filter('tojson', recommendations)
+    return {
+        "recommendations_html": render_fragment('partials/recommendations.html', variant, recommendations=recommendations),
+        "education_html": render_fragment('partials/education.html', education_variant(diabetes_type),
+                                          educational_content=educational_content),
+        "recommendations_json": _fragments[json_key],
+    }
+
+@bp.app_context_processor
+def template_globals():
+    # index.html's footer calls now()
+    return {"now": datetime.now}
+
+@metrics.REGISTRY.collector
+def service_metrics():
+    """Result cache and password hasher counters, read at scrape time."""
+    families = []
+    if predict_cache is not None:
+        stats = predict_cache.stats()
+        tiers = list(stats.values()) if 'local' in stats else [stats]
+        for name, kind, key, help in (
+            ('predict_cache_hits_total', 'counter', 'hits', 'Result cache hits.'),
+            ('predict_cache_misses_total', 'counter', 'misses', 'Result cache misses.'),
+            ('predict_cache_evictions_total', 'counter', 'evictions', 'Entries evicted from the result cache.'),
+            ('predict_cache_entries', 'gauge', 'size', 'Entries in the result cache.'),
+        ):
+            samples = [({"backend": tier['backend']}, tier[key]) for tier in tiers if key in tier]
+            if samples:
+                families.append((name, kind, help, samples))
+    hasher = password_hasher.metrics()
+    for name, kind, key, help in (
+        ('password_hash_queued', 'gauge', 'queued', 'Password operations waiting for a hashing thread.'),
+        ('password_hash_in_flight', 'gauge', 'in_flight', 'Password operations being hashed.'),
+        ('password_hash_completed_total', 'counter', 'completed', 'Password operations completed.'),
+        ('password_hash_rejected_total', 'counter', 'rejected', 'Password operations rejected because the pool was full.'),
+        ('password_hash_timeouts_total', 'counter', 'timeouts', 'Password operations that timed out.'),
+        ('password_hash_seconds_total', 'counter', 'seconds_total', 'Time spent hashing passwords.'),
+    ):
+        families.append((name, kind, help, [({"method": hasher['method']}, hasher[key])]))
+    admission = admission_control.metrics()
+    families.append(('api_in_flight', 'gauge', 'Prediction API requests being served by this process.',
+                     [({}, admission['in_flight'])]))
+    families.append(('api_admitted_total', 'counter', 'Prediction API requests admitted.', [({}, admission['admitted'])]))
+    families.append(('api_rejected_total', 'counter', 'Prediction API requests rejected by admission control.',
+                     [({"reason": reason}, count) for reason, count in admission['rejected'].items()]))
+    return families
+
+@bp.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    if (metrics.profiler is not None and request.endpoint not in PROFILE_ENDPOINTS
+            and metrics.profiler.requested(request.headers.get(metrics.PROFILE_HEADER))):
+        g.profile = metrics.profiler.start(f"{request.method} {request.path}")
 
-def save_users(users):
+@bp.after_app_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - started, request.method, route, str(response.status_code))
+    profile = g.pop('profile', None)
+    if profile is not None:
+        metrics.profiler.stop(profile)
+        response.headers['X-Profile-Id'] = str(profile.id)
+    return response
+
+@bp.teardown_app_request
+def stop_request_profile(error=None):
+    # after_request is skipped when a view raises; don't leave the sampler running.
+    profile = g.pop('profile', None)
+    if profile is not None:
+        metrics.profiler.stop(profile)
+
+@bp.before_app_request
+def admit_api_request():
+    """Rate-limit the prediction API per API key or IP and cap its concurrent requests (rate_limit.py)."""
+    if request.endpoint not in RATE_LIMITED_ENDPOINTS or request.method == 'OPTIONS':
+        return None
     try:
-        with open(USERS_FILE, 'w') as f:
-            json.dump(users, f, indent=4)
-    except Exception as e:
-        logger.error(f"Error saving users to {USERS_FILE}: {e}")
+        admission_control.admit(request.headers.get('X-API-Key'), request.remote_addr)
+    except AdmissionError as e:
+        headers = {'Retry-After': str(e.retry_after)} if e.retry_after else {}
+        return jsonify({"error": str(e)}), e.status, headers
+    g.admitted = True
+
+@bp.after_app_request
+def hold_api_request_while_streaming(response):
+    # A streamed body (bulk scoring) is produced after teardown; keep the slot until it's sent.
+    if response.is_streamed and g.pop('admitted', False):
+        response.call_on_close(admission_control.release)
+    return response
+
+@bp.teardown_app_request
+def release_api_request(error=None):
+    if g.pop('admitted', False):
+        admission_control.release()
 
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             flash("Please log in to access this page.", "info")
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         return f(*args, **kwargs)
     return decorated_function
 
-def rule_based_predict(age, bmi, hba1c):
-    diabetes_type = "No Diabetes"
-    risk_level = "Low Risk"
-    prediction = 0
-    explanation = []
-    rec_category = "Lifestyle, Dietary"
-    
-    if hba1c > 6.5 and age < 30:
-        diabetes_type = "Type 1 Diabetes"
-        risk_level = "High Risk"
-        prediction = 1
-        rec_category = "Medical, Monitoring"
-        explanation.append("Rule R1: Age < 30 and HbA1c > 6.5% suggests Type 1 Diabetes.")
-    elif hba1c > 6.5 and age >= 30:
-        diabetes_type = "Type 2 Diabetes"
-        risk_level = "High Risk"
-        prediction = 1
-        rec_category = "Medical, Lifestyle, Dietary"
-        explanation.append("Rule R2: Age >= 30 and HbA1c > 6.5% suggests Type 2 Diabetes.")
-    elif 5.7 <= hba1c <= 6.4:
-        diabetes_type = "Prediabetes"
-        risk_level = "Moderate Risk"
-        prediction = 0
-        rec_category = "Lifestyle, Dietary, Medical"
-        explanation.append("Rule R3: HbA1c between 5.7% and 6.4% indicates Prediabetes.")
-    elif hba1c < 5.7 and 25 <= bmi < 30:
-        diabetes_type = "No Diabetes"
-        risk_level = "Moderate Risk"
-        prediction = 0
-        rec_category = "Lifestyle, Dietary"
-        explanation.append("Rule R4: BMI 25-29.9 and HbA1c < 5.7% indicates Moderate Risk (Overweight).")
-    elif hba1c < 5.7 and bmi >= 30:
-        diabetes_type = "No Diabetes"
-        risk_level = "Moderate Risk"
-        prediction = 0
-        rec_category = "Lifestyle, Dietary"
-        explanation.append("Rule R5: BMI >= 30 and HbA1c < 5.7% indicates Moderate Risk (Obese).")
-    elif hba1c < 5.7 and bmi < 25:
-        diabetes_type = "No Diabetes"
-        risk_level = "Low Risk"
-        prediction = 0
-        rec_category = "Lifestyle, Dietary"
-        explanation.append("Rule R6: BMI < 25 and HbA1c < 5.7% indicates Low Risk.")
-    else:
-        explanation.append("Input does not match any specific rule. Defaulting to low risk.")
-    return prediction, risk_level, diabetes_type, rec_category, explanation
-
-def get_treatment_recommendations(prediction, risk_level, diabetes_type, input_data):
-    recommendations = {
-        "immediate": [],
-        "lifestyle": [],
-        "monitoring": [],
-        "medical": [],
-        "dietary": [],
-        "exercise": []
-    }
-    if prediction == 1:
-        recommendations["immediate"].extend([
-            "Schedule an appointment with your healthcare provider immediately to confirm diagnosis and develop a treatment plan.",
-            "Begin monitoring blood glucose levels regularly as advised by your doctor.",
-            "Review current medications with your doctor to ensure they are appropriate for diabetes management."
-        ])
-        recommendations["lifestyle"].extend([
-            "Adopt a low-carbohydrate, high-fiber diet focusing on whole foods and portion control.",
-            "Engage in at least 150 minutes of moderate-intensity aerobic exercise weekly (e.g., brisk walking, cycling).",
-            "Maintain a healthy weight through balanced nutrition and regular physical activity.",
-            "Limit alcohol consumption and quit smoking entirely, as both can worsen diabetes complications.",
-            "Practice stress management techniques like meditation, yoga, or deep breathing exercises."
-        ])
-        recommendations["monitoring"].extend([
-            "Monitor blood glucose levels 2-4 times daily, or as recommended by your healthcare provider.",
-            "Track HbA1c levels every 3-6 months to assess long-term blood sugar control.",
-            "Perform regular foot examinations to check for cuts, sores, or infections.",
-            "Undergo annual eye examinations to screen for diabetic retinopathy.",
-            "Monitor blood pressure regularly and manage it within target ranges."
-        ])
-        recommendations["medical"].extend([
-            "Discuss medication therapy options (e.g., Metformin, Insulin, SGLT2 inhibitors) with your doctor.",
-            "Ensure regular HbA1c testing is performed as part of your diabetes management plan.",
-            "Undergo cardiovascular risk assessment to manage heart health.",
-            "Monitor kidney function regularly through blood and urine tests."
-        ])
-        if "Type 2" in diabetes_type:
-            recommendations["dietary"].extend([
-                "Focus on a low-carbohydrate diet (e.g., 45-50% of total daily calories from carbs).",
-                "Incorporate high fiber foods (25-30g daily) such as whole grains, fruits, and vegetables.",
-                "Prioritize lean proteins (chicken, fish, beans) and healthy fats (avocado, nuts, olive oil).",
-                "Strictly limit processed foods, sugary drinks, and added sugars.",
-                "Maintain regular meal timing to help stabilize blood glucose levels."
-            ])
-        else:
-            recommendations["dietary"].extend([
-                "Implement balanced carbohydrate counting to match insulin doses.",
-                "Ensure regular insulin timing in conjunction with meals.",
-                "Maintain consistent meal patterns to avoid blood sugar fluctuations.",
-                "Understand emergency glucose management for hypoglycemia.",
-                "Seek professional nutrition counseling for personalized meal planning."
-            ])
-        recommendations["exercise"].extend([
-            "Aim for at least 150 minutes per week of moderate-intensity aerobic exercise.",
-            "Include strength training exercises 2-3 sessions per week for all major muscle groups.",
-            "Incorporate flexibility exercises (stretching, yoga) 2-3 sessions per week.",
-            "Monitor blood glucose before and after exercise, especially if on insulin or certain medications.",
-            "Stay well-hydrated during physical activity."
-        ])
-    else:
-        recommendations["lifestyle"].extend([
-            "Maintain a healthy lifestyle with regular exercise to prevent diabetes.",
-            "Eat a balanced diet rich in whole grains, lean proteins, and plenty of fruits and vegetables.",
-            "Monitor your weight and BMI regularly to stay within a healthy range.",
-            "Get regular health check-ups, especially if you have risk factors for diabetes.",
-            "Avoid smoking and limit alcohol consumption to support overall health."
-        ])
-        recommendations["monitoring"].extend([
-            "Consider annual diabetes screening if you are over 45 years old or have other risk factors.",
-            "Regularly monitor your BMI and weight.",
-            "Have your blood pressure checked regularly.",
-            "Monitor your cholesterol levels as part of routine health checks."
-        ])
-        recommendations["dietary"].extend([
-            "Follow a balanced diet with an emphasis on whole grains over refined grains.",
-            "Consume plenty of fruits and vegetables daily.",
-            "Include lean proteins and healthy fats in your meals.",
-            "Limit processed foods, sugary drinks, and excessive saturated/trans fats.",
-            "Stay well-hydrated by drinking adequate water throughout the day."
-        ])
-        recommendations["exercise"].extend([
-            "Aim for at least 150 minutes of moderate-intensity exercise weekly.",
-            "Incorporate strength training 2-3 times weekly.",
-            "Include flexibility exercises in your routine.",
-            "Find physical activities you enjoy to make exercise sustainable.",
-            "Progress gradually in intensity and duration to avoid injury."
-        ])
-    return recommendations
-
-def get_educational_content(diabetes_type, risk_level):
-    content = {
-        "general": [
-            "Diabetes is a chronic condition affecting how your body processes glucose (sugar).",
-            "Early detection and proper management can prevent or delay serious complications.",
-            "Lifestyle changes, including diet and exercise, are crucial for diabetes management and prevention.",
-            "Regular monitoring of blood sugar levels helps track progress and prevent complications."
-        ],
-        "prevention": [
-            "Maintain a healthy weight through a balanced diet and regular exercise.",
-            "Eat a balanced diet low in processed foods, sugary drinks, and unhealthy fats.",
-            "Get at least 150 minutes of moderate physical activity each week.",
-            "Monitor blood pressure and cholesterol levels regularly.",
-            "Avoid smoking and limit alcohol consumption."
-        ],
-        "management": [
-            "Work closely with your healthcare providers to develop a personalized care plan.",
-            "Monitor blood glucose levels regularly as advised by your doctor.",
-            "Take medications as prescribed and understand their purpose.",
-            "Maintain a healthy lifestyle, including diet and exercise, as a cornerstone of management.",
-            "Attend regular check-ups and screenings for diabetes complications."
-        ],
-        "specific": []
-    }
-    if "Type 1" in diabetes_type:
-        content["specific"].extend([
-            "Type 1 diabetes is an autoimmune condition where the body does not produce insulin.",
-            "Insulin therapy is essential for survival and must be administered daily.",
-            "Regular blood glucose monitoring is crucial for adjusting insulin doses.",
-            "Carbohydrate counting helps match insulin doses to food intake.",
-            "Emergency preparedness for hypoglycemia (low blood sugar) is important."
-        ])
-    elif "Type 2" in diabetes_type:
-        content["specific"].extend([
-            "Type 2 diabetes is often related to insulin resistance and insufficient insulin production, frequently linked to lifestyle factors.",
-            "Diet and exercise are powerful tools to help manage blood glucose levels.",
-            "Oral medications or injectable non-insulin medications may be prescribed.",
-            "Weight management is a key component in managing Type 2 diabetes.",
-            "Regular screening for complications (eyes, kidneys, nerves, heart) is essential."
-        ])
-
-    elif "Prediabetes" in diabetes_type:
-        content["specific"].extend([
-            "Prediabetes means your blood sugar is higher than normal but not yet diabetes.",
-            "This is a critical time for intervention; lifestyle changes can prevent Type 2 diabetes.",
-            "Focus on increasing physical activity and making healthier food choices.",
-            "Losing even a small amount of weight can make a big difference.",
-            "Regular check-ups are important to monitor your blood sugar levels."
-        ])
-    return content
-
-@app.route('/')
+def record_prediction(user_id, age, bmi, hba1c, rule):
+    """Append a prediction (rule is a RuleSet.rules entry) to a logged-in user's history; never fails the request."""
+    if user_id is None:
+        return
+    try:
+        rule_id, prediction, risk_level, diabetes_type, _, _ = rule
+        prediction_history.append(user_id, age, bmi, hba1c, rule_id, prediction, risk_level, diabetes_type)
+    except Exception as e:
+        logger.error(f"Error recording prediction history: {e}")
+
+def upgrade_password_hash(username, password):
+    """Re-hash a password with the configured parameters after a successful login."""
+    try:
+        user_store.update_password_hash(username, password_hasher.hash(password))
+    except Exception as e:
+        logger.warning(f"Could not upgrade password hash for {username}: {e}")
+
+@bp.route('/')
 @login_required
 def home():
     username = session.get('username')
     return render_template('index.html', username=username)
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
         email = request.form.get('email')
-        users = load_users()
         if not username or not password or not email:
             flash("All fields are required.", "error")
             return render_template('register.html', username=username, email=email)
-        if username in users:
+        if user_store.get(username) is not None:
+            flash("Username already exists. Please choose a different one.", "warning")
+            return render_template('register.html', username=username, email=email)
+        try:
+            hashed_password = password_hasher.hash(password)
+        except HasherBusyError:
+            flash("The server is busy right now. Please try again in a moment.", "warning")
+            return render_template('register.html', username=username, email=email), 503, {'Retry-After': '1'}
+        try:
+            user_store.create(username, hashed_password, email)
+        except UserExistsError:
             flash("Username already exists. Please choose a different one.", "warning")
             return render_template('register.html', username=username, email=email)
-        hashed_password = generate_password_hash(password)
-        user_id = str(len(users) + 1)
-        users[username] = {
-            'user_id': user_id,
-            'password_hash': hashed_password,
-            'email': email,
-            'created_at': datetime.now().isoformat(),
-            'predictions': []
-        }
-        save_users(users)
         flash("Registration successful! Please log in.", "success")
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('register.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
-        users = load_users()
-        user_data = users.get(username)
-        if user_data and check_password_hash(user_data['password_hash'], password):
+        user_data = user_store.get(username)
+        try:
+            valid = user_data is not None and password_hasher.verify(user_data['password_hash'], password)
+        except HasherBusyError:
+            flash("The server is busy right now. Please try again in a moment.", "warning")
+            return render_template('login.html', username=username), 503, {'Retry-After': '1'}
+        if valid:
+            if password_hasher.needs_rehash(user_data['password_hash']):
+                upgrade_password_hash(username, password)
             session['user_id'] = user_data['user_id']
             session['username'] = username
             flash(f"Welcome back, {username}!", "success")
-            return redirect(url_for('home'))
+            return redirect(url_for('main.home'))
         else:
             flash("Invalid username or password.", "error")
             return render_template('login.html', username=username)
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.pop('user_id', None)
     session.pop('username', None)
     flash("You have been logged out.", "info")
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
-@app.route('/predict', methods=['POST'])
+@bp.route('/predict', methods=['POST'])
 @login_required
 def predict():
     try:
@@ -317,7 +295,12 @@ def predict():
             input_data = {'Age': age, 'BMI': bmi, 'HbA1c': hba1c}
             return render_template('index.html', input_data=input_data, username=session.get('username'))
         
-        prediction, risk_level, diabetes_type, rec_category, explanation = rule_based_predict(age, bmi, hba1c)
+        ruleset = rules.current()
+        with metrics.stage('rule_engine'):
+            rule_index = ruleset.match(age, bmi, hba1c)
+            prediction, risk_level, diabetes_type, rec_category, explanation = ruleset.outcome(rule_index)
+        metrics.RULES_FIRED.inc(ruleset.rules[rule_index][0])
+        record_prediction(session.get('user_id'), age, bmi, hba1c, ruleset.rules[rule_index])
         
         if prediction == 1:
             prediction_text = f"Diabetes detected. Type: {diabetes_type}. Risk Level: {risk_level}."
@@ -327,108 +310,543 @@ def predict():
             result_type = "success"
         
         input_data = {'Age': age, 'BMI': bmi, 'HbA1c': hba1c}
-        recommendations = get_treatment_recommendations(prediction, risk_level, diabetes_type, input_data)
-        educational_content = get_educational_content(diabetes_type, risk_level)
+        with metrics.stage('recommendations'):
+            recommendations = get_treatment_recommendations(prediction, risk_level, diabetes_type, input_data)
+            educational_content = get_educational_content(diabetes_type, risk_level)
         
-        return render_template('index.html',
-            prediction_text=prediction_text,
-            result_type=result_type,
-            risk_level=risk_level,
-            diabetes_type=diabetes_type,
-            recommendations=recommendations,
-            educational_content=educational_content,
-            input_data=input_data,
-            explanation=explanation,
-            username=session.get('username')
-        )
+        with metrics.stage('render_template'):
+            return render_template('index.html',
+                prediction_text=prediction_text,
+                result_type=result_type,
+                risk_level=risk_level,
+                diabetes_type=diabetes_type,
+                recommendations=recommendations,
+                educational_content=educational_content,
+                input_data=input_data,
+                explanation=explanation,
+                username=session.get('username'),
+                **result_fragments(prediction, diabetes_type, recommendations, educational_content)
+            )
     except Exception as e:
         logger.error(f"Error during prediction: {e}")
         flash(f"An unexpected error occurred during prediction: {str(e)}", "error")
         input_data = {'Age': request.form.get('Age', ''), 'BMI': request.form.get('BMI', ''), 'HbA1c': request.form.get('HbA1c', '')}
         return render_template('index.html', error=f"An error occurred: {str(e)}", input_data=input_data, username=session.get('username'))
 
-@app.route('/api/predict', methods=['POST'])
+def lookup_rule(age, bmi, hba1c):
+    """
+    Match a record through the result cache. Returns (ruleset, rule_index, cache_status).
+
+    The API body only varies by rule and timestamp, so the cached result is the rule
+    index and the body is spliced from pre-serialized fragments with a fresh timestamp.
+    Keys include the rule set version, so edited rules never serve stale results.
+    """
+    ruleset = rules.current()
+    key = cache_key(age, bmi, hba1c) if predict_cache is not None else None
+    if key is not None:
+        key = f"{ruleset.version}|{key}"
+    rule_index = predict_cache.get(key) if key is not None else None
+    if rule_index is not None:
+        return ruleset, rule_index, 'HIT'
+    rule_index = ruleset.match(age, bmi, hba1c)
+    if key is None:
+        return ruleset, rule_index, 'BYPASS'
+    predict_cache.set(key, rule_index)
+    return ruleset, rule_index, 'MISS'
+
+def population_for(data, age, bmi, hba1c, requested):
+    """The optional "population" field of /api/predict, when requested (?population=1)."""
+    if str(requested).lower() not in ('1', 'true', 'yes'):
+        return None
+    try:
+        import population
+        with metrics.stage('population'):
+            return population.lookup(age, bmi, hba1c, data.get('Gender'))
+    except Exception as e:
+        logger.warning(f"Population lookup unavailable: {e}")
+        return None
+
+@bp.route('/api/predict', methods=['GET', 'POST'])
 def api_predict():
+    """
+    Score one record, sent as a JSON body (POST) or as query parameters (GET). GET
+    responses carry an ETag and answer If-None-Match with 304 (http_cache.py).
+    """
     try:
-        data = request.get_json()
+        data = request.get_json() if request.method == 'POST' else request.args
         if not data:
             return jsonify({"error": "No data provided"}), 400
         age = float(data.get('Age', 0))
         bmi = float(data.get('BMI', 0))
         hba1c = float(data.get('HbA1c', 0))
         
-        prediction, risk_level, diabetes_type, rec_category, explanation = rule_based_predict(age, bmi, hba1c)
-        input_data = {'Age': age, 'BMI': bmi, 'HbA1c': hba1c}
-        recommendations = get_treatment_recommendations(prediction, risk_level, diabetes_type, input_data)
-        
-        response = {
-            "prediction": int(prediction),
-            "risk_level": risk_level,
-            "diabetes_type": diabetes_type,
-            "recommendations": recommendations,
-            "explanation": explanation,
-            "timestamp": datetime.now().isoformat()
-        }
-        return jsonify(response)
+        with metrics.stage('rule_engine'):
+            ruleset, rule_index, cache_status = lookup_rule(age, bmi, hba1c)
+        metrics.RULES_FIRED.inc(ruleset.rules[rule_index][0])
+        record_prediction(session.get('user_id'), age, bmi, hba1c, ruleset.rules[rule_index])
+        cohort = population_for(data, age, bmi, hba1c, request.args.get('population', ''))
+        encoding = http_cache.negotiate(request.headers.get('Accept-Encoding'))
+        headers = {'X-Cache': cache_status, 'Vary': 'Accept-Encoding'}
+        if request.method != 'POST':
+            tag = http_cache.etag(ruleset.version, age, bmi, hba1c, cohort, encoding)
+            if tag is not None:
+                headers.update({'ETag': tag, 'Cache-Control': 'no-cache'})
+                if http_cache.if_none_match(request.headers.get('If-None-Match'), tag):
+                    return Response(status=304, headers=headers)
+        with metrics.stage('json'):
+            body = http_cache.encoded_api_predict_body(ruleset, rule_index, datetime.now().isoformat(), cohort, encoding)
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+        return Response(body, mimetype='application/json', headers=headers)
     except Exception as e:
         logger.error(f"API Error: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/export-report', methods=['POST'])
+@bp.route('/api/history', methods=['GET'])
+def api_history():
+    """
+    Page through the logged-in user's prediction history, newest first.
+    Query parameters: limit (max 500), cursor (from next_cursor), since/until (ISO-8601).
+    """
+    if 'user_id' not in session:
+        return jsonify({"error": "Authentication required"}), 401
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        items, next_cursor = prediction_history.query(
+            session['user_id'],
+            limit=request.args.get('limit', 50),
+            cursor=request.args.get('cursor'),
+            since=normalize_timestamp(since) if since else None,
+            until=normalize_timestamp(until, end_of_day=True) if until else None
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"History API Error: {e}")
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"items": items, "next_cursor": next_cursor})
+
+def parse_batch_payload(data):
+    """
+    Accept either a JSON array of {"Age", "BMI", "HbA1c"} records or a columnar
+    object {"Age": [...], "BMI": [...], "HbA1c": [...]}.
+    Returns (age, bmi, hba1c, columnar) with float64 arrays; missing fields default
+    to 0 like /api/predict. Raises ValueError on malformed input.
+    """
+    import numpy as np
+    if isinstance(data, list):
+        if not all(isinstance(row, dict) for row in data):
+            raise ValueError("Every record must be a JSON object")
+        columns = [np.array([row.get(field, 0) for row in data], dtype=np.float64) for field in BATCH_FIELDS]
+        return (*columns, False)
+    if isinstance(data, dict):
+        missing = [field for field in BATCH_FIELDS if field not in data]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+        columns = [np.asarray(data[field], dtype=np.float64) for field in BATCH_FIELDS]
+        if any(col.ndim != 1 for col in columns) or len({len(col) for col in columns}) != 1:
+            raise ValueError("Columns must be arrays of equal length")
+        return (*columns, True)
+    raise ValueError("Expected a JSON array of records or an object of columns")
+
+def count_rules(ruleset, idx):
+    """Add a batch's matched rules (an array of rule indices) to the rules_fired_total counter."""
+    import numpy as np
+    for rule_index, count in enumerate(np.bincount(idx, minlength=len(ruleset.rules)).tolist()):
+        if count:
+            metrics.RULES_FIRED.inc(ruleset.rules[rule_index][0], amount=count)
+
+def batch_results(age, bmi, hba1c, columnar):
+    """Score parsed batch columns into the batch API response, shaped like the input."""
+    ruleset = rules.current()
+    with metrics.stage('batch_rule_engine'):
+        idx = ruleset.match_batch(age, bmi, hba1c)
+    count_rules(ruleset, idx)
+    idx = idx.tolist()
+    rule_results = batch_rule_results(ruleset)
+    if columnar:
+        results = {
+            key: [rule_results[i][key] for i in idx]
+            for key in ("prediction", "risk_level", "diabetes_type", "explanation")
+        }
+    else:
+        results = [rule_results[i] for i in idx]
+    return {
+        "count": len(idx),
+        "results": results,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@bp.route('/api/predict/batch', methods=['POST'])
+def api_predict_batch():
+    try:
+        data = request.get_json(silent=True)
+        if data is None:
+            return jsonify({"error": "No data provided"}), 400
+        try:
+            age, bmi, hba1c, columnar = parse_batch_payload(data)
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": str(e)}), 400
+        if len(age) > MAX_BATCH_ROWS:
+            return jsonify({"error": f"Batch too large: {len(age)} rows (limit {MAX_BATCH_ROWS})"}), 413
+
+        results = batch_results(age, bmi, hba1c, columnar)
+        with metrics.stage('batch_json'):
+            return jsonify(results)
+    except Exception as e:
+        logger.error(f"Batch API Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def bulk_input_format(upload):
+    """Pick csv or ndjson from ?format=, the upload's filename or the request Content-Type."""
+    fmt = request.args.get('format', '').lower()
+    if not fmt and upload is not None and upload.filename:
+        fmt = os.path.splitext(upload.filename)[1].lstrip('.').lower()
+    if not fmt:
+        fmt = request.mimetype.rsplit('/', 1)[-1].lower()
+    if fmt in ('ndjson', 'jsonl', 'x-ndjson', 'x-jsonlines'):
+        return 'ndjson'
+    return 'csv'
+
+@bp.route('/api/predict/bulk', methods=['POST'])
+def api_predict_bulk():
+    """
+    Stream-score a CSV or NDJSON upload (multipart field "file" or the raw request body).
+    Rows are scored in chunks and results are streamed back in the same format.
+    """
+    import screening
+    try:
+        upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+        if upload is not None:
+            # Request teardown closes uploaded files before a streamed response is
+            # consumed, so the response takes over the upload's stream.
+            raw, upload.stream = upload.stream, io.BytesIO()
+        else:
+            raw = request.stream
+        lines = io.TextIOWrapper(io.BufferedReader(raw) if not isinstance(raw, io.BufferedIOBase) else raw,
+                                 encoding='utf-8-sig', newline='')
+        if bulk_input_format(upload) == 'ndjson':
+            chunks, mimetype = screening.stream_ndjson_results(lines), 'application/x-ndjson'
+        else:
+            try:
+                chunks, mimetype = screening.stream_csv_results(lines), 'text/csv'
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        return Response(stream_with_context(chunks), mimetype=mimetype)
+    except Exception as e:
+        logger.error(f"Bulk API Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def report_rows(data):
+    """Rows of the single-prediction CSV report posted to /export-report."""
+    yield ['Diabetes Prediction Report']
+    yield ['Generated on', datetime.now().strftime('%Y-%m-%d %H:%M:%S')]
+    yield ['Generated for User', session.get('username', 'Anonymous')]
+    yield []
+    yield ['Patient Information']
+    yield ['Age', data.get('Age', 'N/A')]
+    yield ['BMI', data.get('BMI', 'N/A')]
+    yield ['HbA1c (%)', data.get('HbA1c', 'N/A')]
+    yield []
+    yield ['Prediction Results']
+    yield ['Prediction', 'Diabetes' if data.get('prediction', 0) else 'No Diabetes']
+    yield ['Risk Level', data.get('risk_level', 'N/A')]
+    yield ['Diabetes Type', data.get('diabetes_type', 'N/A')]
+    yield []
+    recommendations = data.get('recommendations', {})
+    yield ['Recommendations']
+    for category, items in recommendations.items():
+        if items:
+            yield [category.title()]
+            for item in items:
+                yield ['', item]
+            yield []
+
+def export_response(chunks, mimetype, filename):
+    """Stream an export's chunks as a file download."""
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+def export_filename(prefix, extension):
+    return f'{prefix}_{session.get("username", "anonymous")}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+
+@bp.route('/export-report', methods=['POST'])
 @login_required
 def export_report():
+    from exports import stream_export
     try:
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data provided for export"}), 400
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Diabetes Prediction Report'])
-        writer.writerow(['Generated on', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
-        writer.writerow(['Generated for User', session.get('username', 'Anonymous')])
-        writer.writerow([])
-        writer.writerow(['Patient Information'])
-        writer.writerow(['Age', data.get('Age', 'N/A')])
-        writer.writerow(['BMI', data.get('BMI', 'N/A')])
-        writer.writerow(['HbA1c (%)', data.get('HbA1c', 'N/A')])
-        writer.writerow([])
-        writer.writerow(['Prediction Results'])
-        writer.writerow(['Prediction', 'Diabetes' if data.get('prediction', 0) else 'No Diabetes'])
-        writer.writerow(['Risk Level', data.get('risk_level', 'N/A')])
-        writer.writerow(['Diabetes Type', data.get('diabetes_type', 'N/A')])
-        writer.writerow([])
+        # The report streams after the headers are sent; reject what report_rows can't write up front
+        if not isinstance(data, dict):
+            return jsonify({"error": "Export data must be a JSON object"}), 400
         recommendations = data.get('recommendations', {})
-        writer.writerow(['Recommendations'])
-        for category, items in recommendations.items():
-            if items:
-                writer.writerow([category.title()])
-                for item in items:
-                    writer.writerow(['', item])
-                writer.writerow([])
-        output.seek(0)
-        csv_content = output.getvalue()
-        from flask import send_file
-        return send_file(
-            io.BytesIO(csv_content.encode('utf-8')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'diabetes_prediction_report_{session.get("username", "anonymous")}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        )
+        if not isinstance(recommendations, dict) or not all(
+                not items or isinstance(items, list) for items in recommendations.values()):
+            return jsonify({"error": "recommendations must be an object of lists"}), 400
+        chunks, mimetype, extension = stream_export('csv', None, report_rows(data))
+        return export_response(chunks, mimetype, export_filename('diabetes_prediction_report', extension))
     except Exception as e:
         logger.error(f"Export Error: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.errorhandler(404)
+@bp.route('/export/history', methods=['GET'])
+@login_required
+def export_history():
+    """
+    Download the logged-in user's whole prediction history, oldest first.
+    Query parameters: format (csv, xlsx or pdf summary; default csv), since/until (ISO-8601).
+    """
+    from exports import stream_export
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        since = normalize_timestamp(since) if since else None
+        until = normalize_timestamp(until, end_of_day=True) if until else None
+        rows = (tuple(item[field] for field in HISTORY_FIELDS)
+                for item in prediction_history.iter_user(session['user_id'], since, until))
+        subtitle = [f"User: {session.get('username', 'Anonymous')}"]
+        if since or until:
+            subtitle.append(f"Period: {since or 'start'} to {until or 'now'}")
+        chunks, mimetype, extension = stream_export(
+            request.args.get('format', 'csv').lower(), list(HISTORY_FIELDS), rows,
+            title='Prediction History', subtitle_lines=subtitle
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"History Export Error: {e}")
+        return jsonify({"error": str(e)}), 500
+    return export_response(chunks, mimetype, export_filename('prediction_history', extension))
+
+@bp.route('/export/screening', methods=['POST'])
+@login_required
+def export_screening():
+    """
+    Score a batch (same payload as /api/predict/batch) and download the results
+    as ?format=csv, xlsx or a pdf summary.
+    """
+    import screening
+    from exports import stream_export
+    try:
+        data = request.get_json(silent=True)
+        if data is None:
+            return jsonify({"error": "No data provided"}), 400
+        try:
+            age, bmi, hba1c, _ = parse_batch_payload(data)
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": str(e)}), 400
+        if len(age) > MAX_BATCH_ROWS:
+            return jsonify({"error": f"Batch too large: {len(age)} rows (limit {MAX_BATCH_ROWS})"}), 413
+        ruleset = rules.current()
+        idx = ruleset.match_batch(age, bmi, hba1c)
+        result_values = screening.rule_result_values(ruleset)
+        rows = ((row, *values, *result_values[rule])
+                for row, (*values, rule) in enumerate(zip(age.tolist(), bmi.tolist(), hba1c.tolist(), idx.tolist())))
+        try:
+            chunks, mimetype, extension = stream_export(
+                request.args.get('format', 'csv').lower(), screening.RESULT_HEADER, rows,
+                title='Screening Results', subtitle_lines=[f"Rows screened: {len(age)}"]
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return export_response(chunks, mimetype, export_filename('screening_results', extension))
+    except Exception as e:
+        logger.error(f"Screening Export Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def job_response(job, status=200):
+    body = jobs.public_fields(job)
+    if job['status'] == 'succeeded':
+        body['result_url'] = url_for('main.api_job_result', job_id=job['id'])
+    return jsonify(body), status, {'Location': url_for('main.api_job', job_id=job['id'])}
+
+def submit_json_job(user_id, data):
+    """Queue an export job described by a JSON body. Raises ValueError for a bad request."""
+    from exports import FORMATS as EXPORT_FORMATS
+    job_type = data.get('type')
+    fmt = str(data.get('format', 'csv')).lower()
+    if job_type in ('export_history', 'export_screening') and fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt} (choose from {', '.join(EXPORT_FORMATS)})")
+    if job_type == 'export_history':
+        since, until = data.get('since'), data.get('until')
+        params = {
+            'format': fmt,
+            'since': normalize_timestamp(since) if since else None,
+            'until': normalize_timestamp(until, end_of_day=True) if until else None,
+            'username': session.get('username'),
+        }
+        return job_queue.submit(user_id, job_type, params)
+    if job_type == 'export_screening':
+        try:
+            age, bmi, hba1c, _ = parse_batch_payload(data.get('records'))
+        except TypeError as e:
+            raise ValueError(str(e))
+        if len(age) > MAX_JOB_BATCH_ROWS:
+            raise ValueError(f"Batch too large: {len(age)} rows (limit {MAX_JOB_BATCH_ROWS})")
+        return job_queue.submit(user_id, job_type, {'format': fmt}, columns={'Age': age, 'BMI': bmi, 'HbA1c': hba1c})
+    raise ValueError(f"Unknown job type: {job_type} (choose from {', '.join(jobs.JOB_TYPES)})")
+
+@bp.route('/api/jobs', methods=['POST'])
+def api_submit_job():
+    """
+    Queue a background job. A JSON body {"type": "export_history" | "export_screening",
+    "format": "csv" | "xlsx" | "pdf", ...} queues an export; a CSV or NDJSON upload (as for
+    /api/predict/bulk) queues a screening job. Answers 202 with the job and its Location.
+    """
+    if 'user_id' not in session:
+        return jsonify({"error": "Authentication required"}), 401
+    try:
+        user_id = session['user_id']
+        if job_queue.active_count(user_id) >= jobs.JOB_MAX_ACTIVE_PER_USER:
+            return (jsonify({"error": f"Too many active jobs (limit {jobs.JOB_MAX_ACTIVE_PER_USER})"}), 429,
+                    {'Retry-After': str(int(jobs.JOB_POLL_INTERVAL * 10))})
+        if request.mimetype == 'application/json':
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return jsonify({"error": "No data provided"}), 400
+            job = submit_json_job(user_id, data)
+        else:
+            upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+            job = job_queue.submit(user_id, 'screening', {'input': bulk_input_format(upload)},
+                                   upload=upload.stream if upload is not None else request.stream)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Job Submit Error: {e}")
+        return jsonify({"error": str(e)}), 500
+    return job_response(job, 202)
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def api_job(job_id):
+    """A job's status, progress (0-1, when known), rows processed and, once done, its result_url."""
+    if 'user_id' not in session:
+        return jsonify({"error": "Authentication required"}), 401
+    job = job_queue.get(job_id, session['user_id'])
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return job_response(job)
+
+@bp.route('/api/jobs/<job_id>/result', methods=['GET'])
+def api_job_result(job_id):
+    if 'user_id' not in session:
+        return jsonify({"error": "Authentication required"}), 401
+    job = job_queue.get(job_id, session['user_id'])
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job['status'] != 'succeeded':
+        return jsonify({"error": f"Job is {job['status']}", **jobs.public_fields(job)}), 409
+    params = json.loads(job['params'])
+    mimetype, extension = jobs.result_format(job['type'], params)
+    try:
+        return send_file(jobs.result_path(job['id'], job['type'], params), mimetype=mimetype, as_attachment=True,
+                         download_name=export_filename(jobs.JOB_TYPES[job['type']], extension))
+    except FileNotFoundError:
+        return jsonify({"error": "Job result has expired"}), 410
+
+@bp.route('/health')
+def health():
+    return jsonify({"status": "ok", "timestamp": datetime.now().isoformat()})
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+def profiles_visible():
+    # Without the token the profile endpoints don't exist, whether or not profiling is on
+    return metrics.profiler is not None and metrics.profiler.requested(request.headers.get(metrics.PROFILE_HEADER))
+
+@bp.route('/metrics/profiles')
+def list_profiles():
+    if not profiles_visible():
+        return jsonify({"error": "Not found"}), 404
+    return jsonify({"profiles": metrics.profiler.list()})
+
+@bp.route('/metrics/profiles/<int:profile_id>')
+def get_profile(profile_id):
+    """One profile's folded stacks (for flamegraph.pl or speedscope)."""
+    profile = metrics.profiler.get(profile_id) if profiles_visible() else None
+    if profile is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return Response(profile.folded(), mimetype='text/plain')
+
+@bp.app_errorhandler(404)
 def not_found(error):
     flash("The page you requested could not be found.", "error")
     return render_template('index.html', error="Page not found", username=session.get('username')), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     flash("An internal server error occurred. Please try again later.", "error")
     return render_template('index.html', error="Internal server error", username=session.get('username')), 500
 
-app.debug = False
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """Jinja's on-disk template cache; a read-only directory (e.g. a serverless bundle) just isn't written to."""
+
+    def dump_bytecode(self, bucket):
+        try:
+            super().dump_bytecode(bucket)
+        except OSError as e:
+            logger.debug(f"Not caching compiled template {bucket.key}: {e}")
+
+def warm_up(app):
+    """
+    Do the work of the first requests ahead of time: import the lazily loaded
+    subsystems, load the rules with their batch tables and compressed /api/predict
+    bodies, compile every template and render the cached result-page fragments.
+    gunicorn.conf.py runs this in the master when the app is preloaded, so forked
+    workers start warm and share it all.
+    """
+    import numpy  # noqa: F401
+    import exports  # noqa: F401
+    import population  # noqa: F401
+    import screening  # noqa: F401
+    ruleset = rules.current()
+    ruleset.match_batch([0.0], [0.0], [0.0])
+    http_cache.compressed_prefixes(ruleset)
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    with app.test_request_context():
+        for _, prediction, risk_level, diabetes_type, _, _ in ruleset.rules:
+            result_fragments(prediction, diabetes_type, get_treatment_recommendations(prediction, risk_level, diabetes_type),
+                             get_educational_content(diabetes_type, risk_level))
+
+def prebuild():
+    """Build the startup artifacts: compiled rules, compiled templates and the population index."""
+    import population
+    rules.save_compiled(rules.load_rules(rules.RULES_FILE), rules.RULES_COMPILED)
+    logger.info(f"Compiled rules into {rules.RULES_COMPILED}")
+    app = current_app._get_current_object()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    logger.info(f"Compiled templates into {TEMPLATE_CACHE_DIR}")
+    population.build()
+
+def create_app():
+    """
+    Build the Flask application. The stores, caches and queues are module-level
+    singletons shared by every app (and by asgi.py).
+    """
+    app = Flask(__name__)
+    try:
+        os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    except OSError:
+        pass
+    # Before anything touches app.jinja_env (setting app.debug does).
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': TemplateBytecodeCache(TEMPLATE_CACHE_DIR)}
+    app.secret_key = os.getenv('SECRET_KEY', 'your_super_secret_key_please_change_this_in_production_environment')
+    app.debug = False
+    CORS(app)
+    if TRUSTED_PROXIES:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+    static_assets.init_app(app)
+    app.register_blueprint(bp)
+    app.cli.command('prebuild', help='Build the compiled rules, templates and population index.')(prebuild)
+    return app
+
+app = create_app()
 
 if __name__ == "__main__":
     port = int(os.getenv('PORT', 5050))
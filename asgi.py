@@ -0,0 +1,312 @@
+# asgi.py
+"""
+ASGI entry point for the prediction API.
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+
+/api/predict, /api/predict/batch, /api/predict/bulk and the health checks are
+served by async handlers that share the rule engine, result cache, history store
+and admission control (rate_limit.py) with the Flask app, so a slow client or a
+long bulk upload only holds its own connection instead of the whole worker.
+CPU-bound scoring of large payloads runs in a thread so the event loop keeps
+serving other requests. Every other route (pages, login, exports) is handed to
+the Flask app through asgiref's WSGI adapter when it is installed.
+"""
+import asyncio
+import codecs
+import functools
+import json
+import logging
+import queue
+import time
+from datetime import datetime
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+import app as wsgi
+import http_cache
+import metrics
+import screening
+from rate_limit import AdmissionError, MemoryBuckets
+from result_cache import LRUCache
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    WsgiToAsgi = None
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+BULK_QUEUE_DEPTH = 64
+
+CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+
+def _json_bytes(obj):
+    # Same compact, key-sorted encoding as Flask's jsonify.
+    return (json.dumps(obj, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+
+async def send_response(send, status, body, content_type=b'application/json', headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode()),
+                    *CORS_HEADERS, *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_json(send, status, obj, headers=()):
+    await send_response(send, status, _json_bytes(obj), headers=headers)
+
+
+async def read_body(receive, limit=MAX_BODY_BYTES):
+    """Read the whole request body; raises ValueError past limit bytes."""
+    parts, size = [], 0
+    while True:
+        message = await receive()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > limit:
+            raise ValueError(f"Request body larger than {limit} bytes")
+        parts.append(chunk)
+        if not message.get('more_body', False):
+            return b''.join(parts)
+
+
+def _header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def session_user_id(scope):
+    """Read the user_id from the Flask session cookie, if the request carries a valid one."""
+    cookie_header = _header(scope, b'cookie')
+    if not cookie_header:
+        return None
+    flask_app = wsgi.app
+    morsel = SimpleCookie(cookie_header).get(flask_app.config['SESSION_COOKIE_NAME'])
+    if morsel is None:
+        return None
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        data = serializer.loads(morsel.value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return None
+    return data.get('user_id')
+
+
+async def predict(scope, receive, send):
+    try:
+        query = parse_qs(scope.get('query_string', b'').decode())
+        if scope['method'] == 'POST':
+            data = json.loads(await read_body(receive) or b'null')
+        else:
+            data = {key: values[0] for key, values in query.items()}
+        if not data:
+            return await send_json(send, 400, {"error": "No data provided"})
+        age = float(data.get('Age', 0))
+        bmi = float(data.get('BMI', 0))
+        hba1c = float(data.get('HbA1c', 0))
+        if wsgi.predict_cache is None or isinstance(wsgi.predict_cache, LRUCache):
+            with metrics.stage('rule_engine'):
+                ruleset, rule_index, cache_status = wsgi.lookup_rule(age, bmi, hba1c)
+        else:
+            ruleset, rule_index, cache_status = await asyncio.to_thread(wsgi.lookup_rule, age, bmi, hba1c)
+        rule = ruleset.rules[rule_index]
+        metrics.RULES_FIRED.inc(rule[0])
+        user_id = session_user_id(scope)
+        if user_id is not None:
+            await asyncio.to_thread(wsgi.record_prediction, user_id, age, bmi, hba1c, rule)
+        cohort = None
+        requested = query.get('population', [''])[0]
+        if requested:
+            # The first lookup loads the population index (about half a second): off the event loop
+            cohort = await asyncio.to_thread(wsgi.population_for, data, age, bmi, hba1c, requested)
+        encoding = http_cache.negotiate(_header(scope, b'accept-encoding'))
+        headers = [(b'x-cache', cache_status.encode()), (b'vary', b'Accept-Encoding')]
+        if scope['method'] != 'POST':
+            tag = http_cache.etag(ruleset.version, age, bmi, hba1c, cohort, encoding)
+            if tag is not None:
+                headers += [(b'etag', tag.encode()), (b'cache-control', b'no-cache')]
+                if http_cache.if_none_match(_header(scope, b'if-none-match'), tag):
+                    await send({'type': 'http.response.start', 'status': 304, 'headers': [*CORS_HEADERS, *headers]})
+                    return await send({'type': 'http.response.body', 'body': b''})
+        with metrics.stage('json'):
+            body = http_cache.encoded_api_predict_body(ruleset, rule_index, datetime.now().isoformat(), cohort, encoding)
+        if encoding is not None:
+            headers.append((b'content-encoding', encoding.encode()))
+        await send_response(send, 200, body, headers=headers)
+    except Exception as e:
+        logger.error(f"API Error: {e}")
+        await send_json(send, 500, {"error": str(e)})
+
+
+def _score_batch(body):
+    data = json.loads(body) if body else None
+    if data is None:
+        return 400, {"error": "No data provided"}
+    try:
+        age, bmi, hba1c, columnar = wsgi.parse_batch_payload(data)
+    except (ValueError, TypeError) as e:
+        return 400, {"error": str(e)}
+    if len(age) > wsgi.MAX_BATCH_ROWS:
+        return 413, {"error": f"Batch too large: {len(age)} rows (limit {wsgi.MAX_BATCH_ROWS})"}
+    return 200, wsgi.batch_results(age, bmi, hba1c, columnar)
+
+
+async def predict_batch(scope, receive, send):
+    try:
+        body = await read_body(receive)
+        # Parsing and scoring tens of thousands of rows is CPU work; keep it off the event loop.
+        status, payload = await asyncio.to_thread(_score_batch, body)
+        await send_response(send, status, await asyncio.to_thread(_json_bytes, payload))
+    except ValueError as e:
+        await send_json(send, 400, {"error": str(e)})
+    except Exception as e:
+        logger.error(f"Batch API Error: {e}")
+        await send_json(send, 500, {"error": str(e)})
+
+
+async def predict_bulk(scope, receive, send):
+    """
+    Stream-score a CSV or NDJSON request body with the same chunked generators as the
+    Flask endpoint. The body is decoded into lines on the event loop and handed to the
+    scoring generator, which runs in a thread, through a bounded queue, so memory stays
+    flat and a slow uploader never blocks other requests.
+    """
+    content_type = (_header(scope, b'content-type') or '').split(';')[0].strip().lower()
+    if content_type == 'multipart/form-data':
+        return await send_json(send, 415, {"error": "Send the file as the raw request body (text/csv or application/x-ndjson)"})
+    fmt = parse_qs(scope.get('query_string', b'').decode()).get('format', [''])[0].lower() or content_type.rsplit('/', 1)[-1]
+    ndjson = fmt in ('ndjson', 'jsonl', 'x-ndjson', 'x-jsonlines')
+
+    lines_queue = queue.Queue(maxsize=BULK_QUEUE_DEPTH)
+
+    async def pump():
+        decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        pending = ''
+        more = True
+        while more:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            more = message.get('more_body', False)
+            lines = (pending + decoder.decode(message.get('body', b''), final=not more)).splitlines(keepends=True)
+            pending = lines.pop() if lines and not lines[-1].endswith(('\n', '\r')) else ''
+            if lines:
+                await asyncio.to_thread(lines_queue.put, lines)
+        if pending:
+            await asyncio.to_thread(lines_queue.put, [pending])
+        await asyncio.to_thread(lines_queue.put, None)
+
+    def iter_lines():
+        while (lines := lines_queue.get()) is not None:
+            yield from lines
+
+    pump_task = asyncio.create_task(pump())
+    try:
+        if ndjson:
+            chunks, mimetype = screening.stream_ndjson_results(iter_lines()), b'application/x-ndjson'
+        else:
+            try:
+                chunks = await asyncio.to_thread(screening.stream_csv_results, iter_lines())
+            except ValueError as e:
+                return await send_json(send, 400, {"error": str(e)})
+            mimetype = b'text/csv'
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', mimetype), *CORS_HEADERS]})
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    except Exception as e:
+        logger.error(f"Bulk API Error: {e}")
+        raise
+    finally:
+        pump_task.cancel()
+        # Unblock a pump thread waiting on a full queue.
+        while True:
+            try:
+                lines_queue.get_nowait()
+            except queue.Empty:
+                break
+
+
+async def health(scope, receive, send):
+    await send_json(send, 200, {"status": "ok", "timestamp": datetime.now().isoformat()})
+
+
+async def admitted(handler, scope, receive, send):
+    """Run an API handler under the Flask app's admission control (rate_limit.py)."""
+    control = wsgi.admission_control
+    client = scope.get('client')
+    args = (_header(scope, b'x-api-key'), client[0] if client else None)
+    try:
+        if control.buckets is None or isinstance(control.buckets, MemoryBuckets):
+            control.admit(*args)
+        else:
+            await asyncio.to_thread(control.admit, *args)
+    except AdmissionError as e:
+        headers = [(b'retry-after', str(e.retry_after).encode())] if e.retry_after else []
+        return await send_json(send, e.status, {"error": str(e)}, headers=headers)
+    try:
+        await handler(scope, receive, send)
+    finally:
+        control.release()
+
+
+async def timed(handler, route, scope, receive, send):
+    """Run a handler, recording the time to its response headers like the Flask app's after_request hook."""
+    started = time.perf_counter()
+
+    async def send_timed(message):
+        if message['type'] == 'http.response.start':
+            metrics.REQUEST_LATENCY.observe(time.perf_counter() - started, scope['method'], route, str(message['status']))
+        await send(message)
+
+    await handler(scope, receive, send_timed)
+
+
+ROUTES = {
+    ('GET', '/api/predict'): predict,
+    ('POST', '/api/predict'): predict,
+    ('POST', '/api/predict/batch'): predict_batch,
+    ('POST', '/api/predict/bulk'): predict_bulk,
+    ('GET', '/health'): health,
+    ('GET', '/healthz'): health,
+}
+API_PATHS = {path for _, path in ROUTES}
+RATE_LIMITED_PATHS = {'/api/predict', '/api/predict/batch', '/api/predict/bulk'}
+
+_flask_asgi = WsgiToAsgi(wsgi.app) if WsgiToAsgi is not None else None
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+    path = scope['path'].rstrip('/') or '/'
+    handler = ROUTES.get((scope['method'], path))
+    if handler is not None:
+        if path in RATE_LIMITED_PATHS:
+            handler = functools.partial(admitted, handler)
+        return await timed(handler, path, scope, receive, send)
+    if scope['method'] == 'OPTIONS' and path in API_PATHS:
+        return await send_response(send, 204, b'', headers=[
+            (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+            (b'access-control-allow-headers', (_header(scope, b'access-control-request-headers') or '*').encode()),
+        ])
+    if _flask_asgi is not None:
+        return await _flask_asgi(scope, receive, send)
+    await send_json(send, 404, {"error": "Not found (install asgiref to serve the Flask routes over ASGI)"})
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: building and jsonify-ing the /api/predict payload per request vs.
+splicing the pre-serialized fragments from recommendations.py into a Response.
+
+Run from the project root:  python benchmarks/bench_recommendations.py
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, Response, jsonify
+
+from recommendations import api_predict_body, build_treatment_recommendations
+import rules
+
+app = Flask(__name__)
+RULESET = rules.current()
+TYPE2_RULE = next(i for i, rule in enumerate(RULESET.rules) if rule[3] == "Type 2 Diabetes")
+
+
+def per_request():
+    """What /api/predict did before: build the dicts and lists, then encode them."""
+    prediction, risk_level, diabetes_type, _, explanation = RULESET.outcome(TYPE2_RULE)
+    return jsonify({
+        "prediction": int(prediction),
+        "risk_level": risk_level,
+        "diabetes_type": diabetes_type,
+        "recommendations": build_treatment_recommendations(prediction, diabetes_type),
+        "explanation": explanation,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+def precomputed():
+    return Response(api_predict_body(RULESET, TYPE2_RULE, datetime.now().isoformat()), mimetype="application/json")
+
+
+def measure(func, number=20000):
+    per_call_us = min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+    tracemalloc.start()
+    func()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_call_us, peak - base
+
+
+def main():
+    with app.app_context():
+        assert per_request().get_data()[:-30] == precomputed().get_data()[:-30]
+        results = {name: measure(func) for name, func in (("per-request build", per_request), ("precomputed", precomputed))}
+    print(f"{'variant':<20}{'latency (us)':>15}{'peak alloc (B)':>18}")
+    for name, (latency, peak) in results.items():
+        print(f"{name:<20}{latency:>15.2f}{peak:>18}")
+    (old_latency, old_peak), (new_latency, new_peak) = results.values()
+    print(f"\nspeedup: {old_latency / new_latency:.1f}x, peak allocation: {old_peak} B -> {new_peak} B per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: how long a fresh process takes to import the app and answer
+its first requests, and which imports that time goes to.
+
+    python benchmarks/bench_startup.py                 # 5 fresh processes, prebuilt artifacts
+    python benchmarks/bench_startup.py --cold          # no compiled rules or template cache
+    python benchmarks/bench_startup.py --gunicorn      # also time `gunicorn --preload` to its first response
+    python benchmarks/bench_startup.py --json startup.json
+
+Every run is a new interpreter started with -X importtime. It times `import app`
+and then the first request to each of FIRST_REQUESTS through Flask's test client,
+each measured from the moment the process was spawned (so interpreter start-up is
+included), and the parent prints the medians over the runs together with the
+modules with the largest cumulative import time. By default the artifacts of
+`flask --app app prebuild` (compiled rules, compiled templates) are built once into
+the working directory first, as the deploy does; --cold gives every run empty ones.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+PAYLOAD = {"Age": 45, "BMI": 32.0, "HbA1c": 7.2}
+FIRST_REQUESTS = [
+    ('GET', '/health', None),
+    ('GET', '/login', None),
+    ('POST', '/api/predict', {'json': PAYLOAD}),
+    ('POST', '/predict', {'data': PAYLOAD}),
+]
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def child():
+    """Runs in the fresh interpreter: print {"step": seconds since spawn} as JSON."""
+    spawned = float(os.environ['STARTUP_SPAWNED'])
+    timings = {}
+    started = time.perf_counter()
+    import app as webapp
+    timings['import app'] = time.perf_counter() - started
+    client = webapp.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'], session['username'] = 'startup-benchmark', 'startup-benchmark'
+    for method, path, kwargs in FIRST_REQUESTS:
+        response = client.open(path, method=method, **(kwargs or {}))
+        assert response.status_code == 200, f"{method} {path} answered {response.status_code}"
+        timings[f"{method} {path}"] = time.time() - spawned
+    print(json.dumps(timings))
+
+
+def parse_importtime(stderr):
+    """{module: (self seconds, cumulative seconds, depth)} from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            modules[match[4]] = (int(match[1]) / 1e6, int(match[2]) / 1e6, len(match[3]) // 2)
+    return modules
+
+
+def run_child(env):
+    env = dict(env, STARTUP_SPAWNED=repr(time.time()))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--child'],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(f"startup run failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1]), parse_importtime(proc.stderr)
+
+
+def gunicorn_first_response(env, timeout=60):
+    """Seconds from spawning `gunicorn app:app --preload` (as in the Procfile) to its first /health answer."""
+    import urllib.request
+    from loadtest import free_port
+    port = free_port()
+    started = time.time()
+    proc = subprocess.Popen(['gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}', '--preload', '--workers', '1'],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.time() - started < timeout:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1).read()
+                return time.time() - started
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError(f"gunicorn did not answer within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def stores_env(workdir):
+    """Throwaway stores under workdir, plus the compiled rules and template cache locations."""
+    return {
+        **os.environ,
+        'USER_DB': os.path.join(workdir, 'users.db'),
+        'HISTORY_DB': os.path.join(workdir, 'history.db'),
+        'PREDICT_CACHE_DB': os.path.join(workdir, 'predict_cache.db'),
+        'JOBS_DB': os.path.join(workdir, 'jobs.db'),
+        'RULES_COMPILED': os.path.join(workdir, 'rules.compiled.json'),
+        'TEMPLATE_CACHE_DIR': os.path.join(workdir, 'template_cache'),
+        'JOBS_IN_WEB': 'false',
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bench_startup.py', description='Time the app\'s cold start and first responses.')
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes to time (default 5)')
+    parser.add_argument('--cold', action='store_true', help='start every run without compiled rules or template cache')
+    parser.add_argument('--gunicorn', action='store_true', help='also time gunicorn --preload to its first response')
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--json', dest='json_path', help='also write the medians to this file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        child()
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix='diabetes-startup-')
+    try:
+        env = stores_env(workdir)
+        if not args.cold:
+            subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'prebuild'], cwd=ROOT, env=env,
+                           check=True, capture_output=True)
+        runs, imports, servers = [], [], []
+        for _ in range(args.runs):
+            if args.cold:
+                shutil.rmtree(env['TEMPLATE_CACHE_DIR'], ignore_errors=True)
+                if os.path.exists(env['RULES_COMPILED']):
+                    os.remove(env['RULES_COMPILED'])
+            timings, modules = run_child(env)
+            runs.append(timings)
+            imports.append(modules)
+            if args.gunicorn:
+                servers.append(gunicorn_first_response(env))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    medians = {step: statistics.median(run[step] for run in runs) for step in runs[0]}
+    if servers:
+        medians['gunicorn --preload GET /health'] = statistics.median(servers)
+    print(f"Median of {args.runs} fresh processes ({'cold' if args.cold else 'prebuilt artifacts'}), "
+          f"seconds since spawn except for the import:")
+    for step, seconds in medians.items():
+        print(f"  {step:<34}{seconds * 1000:>9.1f} ms")
+
+    cumulative = {}
+    for modules in imports:
+        for name, (_, total, depth) in modules.items():
+            cumulative.setdefault((name, depth), []).append(total)
+    slowest = sorted(((statistics.median(times), name, depth) for (name, depth), times in cumulative.items()
+                      if name != 'app'), reverse=True)[:args.top]
+    print("\nSlowest imports (median cumulative, -X importtime):")
+    for total, name, depth in slowest:
+        print(f"  {total * 1000:>8.1f} ms  {'  ' * depth}{name}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({"cold": args.cold, "runs": args.runs, "medians": medians,
+                       "imports": [{"module": name, "cumulative": total} for total, name, _ in slowest]}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
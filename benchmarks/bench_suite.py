@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+In-process benchmark suite: rule engine, API round trips, page rendering, login and
+exports, timed through Flask's test client and compared with a stored baseline.
+
+    python benchmarks/bench_suite.py             # run and compare with benchmarks/baseline.json
+    python benchmarks/bench_suite.py -k api      # only benchmarks whose name contains "api"
+    python benchmarks/bench_suite.py --save      # record the current numbers as the new baseline
+    python benchmarks/bench_suite.py --runs 1    # one run, in this process
+
+The suite runs RUNS (5) times, each in a fresh process (a process can settle into a
+faster or slower state for the allocation-heavy benchmarks, so runs within one
+process don't vary the way runs on CI do), and each benchmark keeps the run with
+the median fastest round (time per call, the statistic least disturbed by other load
+on the machine). Right before each benchmark the run also times calibrate(), a fixed
+workload that doesn't touch the app, and the comparison is of the benchmark's time
+relative to that, so a machine that is slower as a whole (shared CI runners, a
+neighbour's load) doesn't read as a regression. A benchmark regresses when that
+relative time is more than its threshold (25% unless noted, and at least 50% for
+benchmarks under a millisecond, where a few microseconds of noise are already that
+much) above the baseline's; the script then exits with status 1.
+Baselines are only comparable on the machine that recorded them, so re-record one
+(--save) on the machine that runs the comparison.
+
+The app runs against throwaway stores in a temporary directory: a copy of users.json
+(whose scrypt:32768:8:1 hashes set the cost of a login) plus one benchmark user,
+and a history database with HISTORY_ROWS predictions for the export benchmarks.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix='diabetes-bench-')
+shutil.copy(os.path.join(ROOT, 'users.json'), os.path.join(WORKDIR, 'users.json'))
+os.environ.update({
+    'USER_STORE': 'json',
+    'USERS_FILE': os.path.join(WORKDIR, 'users.json'),
+    'HISTORY_DB': os.path.join(WORKDIR, 'history.db'),
+    'JOBS_DB': os.path.join(WORKDIR, 'jobs.db'),
+    'JOBS_DIR': os.path.join(WORKDIR, 'job_files'),
+    'PREDICT_CACHE': 'memory',
+    'RATE_LIMIT': 'off',
+})
+
+import numpy as np  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+import app as webapp  # noqa: E402
+from harness import Benchmark, format_seconds  # noqa: E402
+import rules  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_THRESHOLD = 0.25
+# Lower bound of the threshold of benchmarks whose baseline is under a millisecond
+SUB_MILLISECOND_THRESHOLD = 0.5
+RUNS = 5
+HISTORY_ROWS = 2000
+BENCH_USER, BENCH_PASSWORD = 'benchmark', 'benchmark-password'
+PAYLOAD = {"Age": 45, "BMI": 32.0, "HbA1c": 7.2}
+
+BENCHMARKS = []
+
+
+def bench(name, threshold=DEFAULT_THRESHOLD):
+    def register(func):
+        BENCHMARKS.append((name, threshold, func))
+        return func
+    return register
+
+
+def random_inputs(n, seed=42):
+    rng = np.random.default_rng(seed)
+    return rng.integers(18, 90, n).astype(float), rng.uniform(16, 45, n).round(1), rng.uniform(4, 12, n).round(1)
+
+
+def calibrate():
+    """The reference workload: JSON, dicts and sorting, the same kind of work as a request but none of the app."""
+    rows = [{"Age": i % 90, "BMI": i * 0.37 % 45, "HbA1c": i * 0.11 % 12, "Gender": "FM"[i % 2]} for i in range(500)]
+    rows = json.loads(json.dumps(rows))
+    return sorted(rows, key=lambda row: (row["BMI"], row["Age"]))
+
+
+def setup():
+    """Create the benchmark user (hashed like the users.json entries) and its history."""
+    method = next(iter(webapp.user_store.load().values()))['password_hash'].split('$', 1)[0]
+    webapp.user_store.create(BENCH_USER, generate_password_hash(BENCH_PASSWORD, method), 'bench@example.com')
+    user_id = webapp.user_store.get(BENCH_USER)['user_id']
+    ruleset = rules.current()
+    for age, bmi, hba1c in zip(*(column.tolist() for column in random_inputs(HISTORY_ROWS))):
+        webapp.record_prediction(user_id, age, bmi, hba1c, ruleset.rules[ruleset.match(age, bmi, hba1c)])
+    client = webapp.app.test_client()
+    response = client.post('/login', data={'username': BENCH_USER, 'password': BENCH_PASSWORD})
+    assert response.status_code == 302, "benchmark user could not log in"
+    return client
+
+
+@bench('engine_scalar_1k', threshold=0.3)
+def bench_engine_scalar(benchmark, client):
+    rows = list(zip(*(column.tolist() for column in random_inputs(1000))))
+
+    def run():
+        for age, bmi, hba1c in rows:
+            rules.rule_based_predict(age, bmi, hba1c)
+    benchmark(run)
+
+
+@bench('engine_batch_100k', threshold=0.3)
+def bench_engine_batch(benchmark, client):
+    benchmark(rules.match_rules_batch, *random_inputs(100000))
+
+
+@bench('api_predict_cached')
+def bench_api_predict_cached(benchmark, client):
+    anonymous = webapp.app.test_client()
+    benchmark(anonymous.post, '/api/predict', json=PAYLOAD)
+
+
+@bench('api_predict_uncached')
+def bench_api_predict_uncached(benchmark, client):
+    anonymous = webapp.app.test_client()
+    cache, webapp.predict_cache = webapp.predict_cache, None
+    try:
+        benchmark(anonymous.post, '/api/predict', json=PAYLOAD)
+    finally:
+        webapp.predict_cache = cache
+
+
+@bench('api_predict_gzip')
+def bench_api_predict_gzip(benchmark, client):
+    anonymous = webapp.app.test_client()
+    benchmark(anonymous.post, '/api/predict', json=PAYLOAD, headers={'Accept-Encoding': 'gzip'})
+
+
+@bench('api_predict_not_modified')
+def bench_api_predict_not_modified(benchmark, client):
+    anonymous = webapp.app.test_client()
+    tag = anonymous.get('/api/predict', query_string=PAYLOAD).headers['ETag']
+    benchmark(anonymous.get, '/api/predict', query_string=PAYLOAD, headers={'If-None-Match': tag})
+
+
+# Allocation-heavy: the fastest round settles about 50% apart from one process to the next
+@bench('api_predict_batch_1k', threshold=0.6)
+def bench_api_predict_batch(benchmark, client):
+    records = [{"Age": a, "BMI": b, "HbA1c": h} for a, b, h in zip(*(c.tolist() for c in random_inputs(1000)))]
+    anonymous = webapp.app.test_client()
+    benchmark(anonymous.post, '/api/predict/batch', json=records)
+
+
+@bench('predict_render')
+def bench_predict_render(benchmark, client):
+    benchmark(client.post, '/predict', data=PAYLOAD)
+
+
+@bench('login_scrypt', threshold=0.5)
+def bench_login(benchmark, client):
+    benchmark(webapp.app.test_client().post, '/login', data={'username': BENCH_USER, 'password': BENCH_PASSWORD})
+
+
+@bench('export_report_csv')
+def bench_export_report(benchmark, client):
+    data = {**PAYLOAD, "prediction": 1, "risk_level": "High Risk", "diabetes_type": "Type 2 Diabetes",
+            "recommendations": {"lifestyle": ["Exercise"], "dietary": ["Fewer refined carbohydrates"]}}
+    benchmark(lambda: client.post('/export-report', json=data).get_data())
+
+
+# The history exports are allocation-heavy too, like api_predict_batch_1k
+@bench(f'export_history_csv_{HISTORY_ROWS}', threshold=0.6)
+def bench_export_history_csv(benchmark, client):
+    benchmark(lambda: client.get('/export/history?format=csv').get_data())
+
+
+@bench(f'export_history_xlsx_{HISTORY_ROWS}', threshold=0.6)
+def bench_export_history_xlsx(benchmark, client):
+    benchmark(lambda: client.get('/export/history?format=xlsx').get_data())
+
+
+def machine_info():
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(), "cpus": os.cpu_count()}
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def relative_time(result):
+    """A result's fastest round in units of the calibration run next to it (baselines without one: seconds)."""
+    return result['min'] / result['calibration'] if 'calibration' in result else result['min']
+
+
+def run_benchmarks(pattern, max_time):
+    """Run the benchmarks whose name contains pattern in this process: {name: result dict}."""
+    client = setup()
+    results = {}
+    for name, _, func in BENCHMARKS:
+        if pattern and pattern not in name:
+            continue
+        calibration = Benchmark('calibration', max_time=max_time / 2)
+        calibration(calibrate)
+        benchmark = Benchmark(name, max_time=max_time)
+        func(benchmark, client)
+        results[name] = dict(benchmark.result.as_dict(), calibration=calibration.result.min)
+    return results
+
+
+def run_in_processes(runs, pattern, max_time):
+    """Run the suite runs times in fresh processes; per benchmark, the run with the median relative time."""
+    outputs = []
+    with tempfile.TemporaryDirectory(prefix='diabetes-bench-runs-') as tmp:
+        for run in range(runs):
+            path = os.path.join(tmp, f'run-{run}.json')
+            command = [sys.executable, os.path.abspath(__file__), '--runs', '1', '--max-time', str(max_time), '--dump', path]
+            if pattern:
+                command += ['-k', pattern]
+            subprocess.run(command, check=True)
+            with open(path) as f:
+                outputs.append(json.load(f))
+            print(f"run {run + 1}/{runs} done", file=sys.stderr)
+    return {name: sorted((output[name] for output in outputs), key=relative_time)[runs // 2] for name in outputs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', dest='pattern', help='only run benchmarks whose name contains this')
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file (default: benchmarks/baseline.json)')
+    parser.add_argument('--threshold', type=float, help='override every regression threshold (e.g. 0.1 for 10%%)')
+    parser.add_argument('--max-time', type=float, default=0.5, help='seconds to spend timing each run of a benchmark')
+    parser.add_argument('--runs', type=int, default=RUNS, help=f'runs of the suite, each in a fresh process (default {RUNS})')
+    parser.add_argument('--dump', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    baseline = None if args.save or args.dump else load_baseline(args.baseline)
+    if baseline and baseline.get('machine') != machine_info():
+        print(f"warning: baseline was recorded on {baseline.get('machine')}; comparisons may not be meaningful\n")
+
+    try:
+        if args.runs > 1:
+            results = run_in_processes(args.runs, args.pattern, args.max_time)
+        else:
+            results = run_benchmarks(args.pattern, args.max_time)
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+    if args.dump:
+        with open(args.dump, 'w') as f:
+            json.dump(results, f)
+        return 0
+
+    thresholds = {name: threshold for name, threshold, _ in BENCHMARKS}
+    regressions = []
+    print(f"{'benchmark':<30}{'min':>12}{'median':>12}{'rounds':>8}{'baseline':>12}{'change':>9}")
+    for name, result in results.items():
+        line = f"{name:<30}{format_seconds(result['min']):>12}{format_seconds(result['median']):>12}{result['rounds']:>8}"
+        previous = (baseline or {}).get('benchmarks', {}).get(name)
+        if previous:
+            change = (relative_time(result) / relative_time(previous) if 'calibration' in previous
+                      else result['min'] / previous['min']) - 1
+            if args.threshold is not None:
+                limit = args.threshold
+            elif previous['min'] < 1e-3:
+                limit = max(thresholds[name], SUB_MILLISECOND_THRESHOLD)
+            else:
+                limit = thresholds[name]
+            line += f"{format_seconds(previous['min']):>12}{change:>+9.1%}"
+            if change > limit:
+                regressions.append(name)
+                line += f"  REGRESSION (> {limit:.0%})"
+        print(line)
+
+    if args.save:
+        saved = load_baseline(args.baseline) or {}
+        saved.setdefault('benchmarks', {}).update(results)
+        saved['machine'] = machine_info()
+        saved['recorded_at'] = datetime.now().isoformat(timespec='seconds')
+        with open(args.baseline, 'w') as f:
+            json.dump(saved, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nSaved {len(results)} results to {args.baseline}")
+    elif baseline is None:
+        print(f"\nNo baseline at {args.baseline}; run with --save to record one.")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
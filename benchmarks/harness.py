@@ -0,0 +1,88 @@
+"""
+A small stand-in for pytest-benchmark's `benchmark` fixture, so the suite runs with
+nothing but the app's own dependencies.
+
+    def bench_something(benchmark):
+        benchmark(func, *args)
+
+benchmark(func) calls func once, calibrates how many calls make up one round (at
+least MIN_ROUND_TIME, so timer resolution doesn't matter), runs one warm-up round,
+then times rounds with the garbage collector paused until it has MIN_ROUNDS of them
+and MAX_TIME has passed. Stats are per call, in seconds.
+"""
+import gc
+import statistics
+import time
+
+MIN_ROUND_TIME = 0.01
+MIN_ROUNDS = 5
+MAX_TIME = 1.0
+
+
+class BenchmarkResult:
+    def __init__(self, name, timings, iterations):
+        self.name = name
+        self.rounds = len(timings)
+        self.iterations = iterations
+        self.min = min(timings)
+        self.max = max(timings)
+        self.mean = statistics.fmean(timings)
+        self.median = statistics.median(timings)
+        self.stddev = statistics.stdev(timings) if len(timings) > 1 else 0.0
+
+    @property
+    def ops(self):
+        return 1.0 / self.median if self.median else float('inf')
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in ('rounds', 'iterations', 'min', 'max', 'mean', 'median', 'stddev')}
+
+
+class Benchmark:
+    """Callable passed to each benchmark function; keeps the result of its last run."""
+
+    def __init__(self, name, min_rounds=MIN_ROUNDS, max_time=MAX_TIME, min_round_time=MIN_ROUND_TIME):
+        self.name = name
+        self.min_rounds = min_rounds
+        self.max_time = max_time
+        self.min_round_time = min_round_time
+        self.result = None
+
+    def _round(self, func, args, kwargs, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func(*args, **kwargs)
+        return time.perf_counter() - started
+
+    def _calibrate(self, func, args, kwargs):
+        iterations = 1
+        while True:
+            elapsed = self._round(func, args, kwargs, iterations)
+            if elapsed >= self.min_round_time:
+                return iterations
+            iterations *= 2 if elapsed <= 0 else max(2, min(10, int(self.min_round_time / elapsed) + 1))
+
+    def __call__(self, func, *args, **kwargs):
+        func(*args, **kwargs)  # first-call costs (template compilation, imports) aren't per-call costs
+        iterations = self._calibrate(func, args, kwargs)
+        self._round(func, args, kwargs, iterations)
+        timings = []
+        gc_enabled = gc.isenabled()
+        gc.collect()
+        gc.disable()
+        try:
+            deadline = time.perf_counter() + self.max_time
+            while len(timings) < self.min_rounds or time.perf_counter() < deadline:
+                timings.append(self._round(func, args, kwargs, iterations) / iterations)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        self.result = BenchmarkResult(self.name, timings, iterations)
+        return func(*args, **kwargs)
+
+
+def format_seconds(seconds):
+    for unit, scale in (('s', 1.0), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
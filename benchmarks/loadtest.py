@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Load-test harness for /api/predict: requests/sec and latency percentiles at a range
+of concurrent connections, against the WSGI app (gunicorn, as in the Procfile) and
+the ASGI app (uvicorn asgi:app).
+
+Compare both, starting the servers on free local ports:
+
+    python benchmarks/loadtest.py --spawn --concurrency 100 250 500 1000 --duration 10
+
+Or point it at a server that is already running:
+
+    python benchmarks/loadtest.py --url http://127.0.0.1:5050 --concurrency 100
+
+The client is plain asyncio (keep-alive HTTP/1.1, reconnecting whenever the server
+closes the connection, as gunicorn's sync worker does after every response), so it
+needs nothing beyond the standard library.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAYLOAD = json.dumps({"Age": 45, "BMI": 32.0, "HbA1c": 7.2}).encode()
+REQUEST_TIMEOUT = 30.0
+
+
+def build_request(host, path):
+    return (f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(PAYLOAD)}\r\n\r\n").encode() + PAYLOAD
+
+
+async def read_response(reader):
+    """Read one response; returns (status, keep_alive)."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip().lower()
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get("connection") != "close"
+
+
+async def connection_worker(host, port, request, deadline, latencies, errors):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            status, keep_alive = await asyncio.wait_for(read_response(reader), REQUEST_TIMEOUT)
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors[status] = errors.get(status, 0) + 1
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            keep_alive = False
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run_load(url, concurrency, duration):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    request = build_request(f"{host}:{port}", (parts.path.rstrip("/") or "") + "/api/predict")
+    latencies, errors = [], {}
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(connection_worker(host, port, request, deadline, latencies, errors)
+                           for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "errors": errors,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url + "/health", timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not come up")
+
+
+def spawn(kind, port):
+    if kind == "wsgi":
+        cmd = ["gunicorn", "app:app", "--bind", f"127.0.0.1:{port}", "--workers", "1", "--timeout", "120"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", "1", "--log-level", "warning", "--backlog", "4096"]
+    # Measure the servers' capacity, not the admission control (rate_limit.py).
+    env = {**os.environ, "RATE_LIMIT": "off", "API_MAX_CONCURRENT": "0", "JOBS_IN_WEB": "false"}
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    wait_until_up(url)
+    return proc, url
+
+
+def raise_fd_limit(wanted):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+
+def print_row(target, result):
+    errors = ", ".join(f"{k}:{v}" for k, v in result["errors"].items()) or "-"
+    print(f"{target:<8}{result['concurrency']:>8}{result['requests']:>10}{result['rps']:>10.0f}"
+          f"{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}  {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running server")
+    parser.add_argument("--spawn", action="store_true", help="start gunicorn (WSGI) and uvicorn (ASGI) and compare them")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[100, 250, 500, 1000])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    args = parser.parse_args()
+    if not args.url and not args.spawn:
+        parser.error("pass --url or --spawn")
+    raise_fd_limit(max(args.concurrency) * 2 + 256)
+
+    targets, procs = [], []
+    try:
+        if args.spawn:
+            for kind in ("wsgi", "asgi"):
+                proc, url = spawn(kind, free_port())
+                procs.append(proc)
+                targets.append((kind, url))
+        else:
+            targets.append(("server", args.url))
+        print(f"{'target':<8}{'conns':>8}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}  errors")
+        for name, url in targets:
+            for concurrency in args.concurrency:
+                print_row(name, asyncio.run(run_load(url, concurrency, args.duration)))
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
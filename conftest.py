@@ -0,0 +1,37 @@
+"""
+Shared test setup: every store the app writes (users, history, result cache, jobs,
+compiled rules, template cache) goes to a throwaway directory, set before any test
+module imports the app, and rate limiting is off unless a test builds its own.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+import pytest
+
+STORES_DIR = tempfile.mkdtemp(prefix='diabetes-tests-')
+atexit.register(shutil.rmtree, STORES_DIR, ignore_errors=True)
+os.environ.update({
+    'USER_DB': os.path.join(STORES_DIR, 'users.db'),
+    'USERS_FILE': os.path.join(STORES_DIR, 'users.json'),
+    'HISTORY_DB': os.path.join(STORES_DIR, 'history.db'),
+    'PREDICT_CACHE_DB': os.path.join(STORES_DIR, 'predict_cache.db'),
+    'JOBS_DB': os.path.join(STORES_DIR, 'jobs.db'),
+    'JOBS_DIR': os.path.join(STORES_DIR, 'job_files'),
+    'RATE_LIMIT_DB': os.path.join(STORES_DIR, 'rate_limit.db'),
+    'RULES_COMPILED': os.path.join(STORES_DIR, 'rules.compiled.json'),
+    'TEMPLATE_CACHE_DIR': os.path.join(STORES_DIR, 'template_cache'),
+    'RATE_LIMIT': 'off',
+    'API_MAX_CONCURRENT': '0',
+})
+
+
+@pytest.fixture
+def client():
+    """A Flask test client logged in as a test user."""
+    import app as webapp
+    client = webapp.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'], session['username'] = 'test-user', 'test-user'
+    return client
@@ -0,0 +1,263 @@
+# datasets.py
+"""
+Columnar, memory-mapped copies of the reference datasets.
+
+The reference CSVs (docs/diabetes_prediction_dataset.csv, docs/diabetes.csv) are
+converted once into one .npy file per column under DATASET_CACHE_DIR/<name>/, with a
+schema.json recording the column names and dtypes, the row count, the sha256 of every
+column file and the size/mtime/sha256 of the source CSV. load() maps the columns
+read-only with np.load(mmap_mode='r'), so opening a dataset costs a few page faults
+instead of a CSV parse, slices are zero-copy, and all workers share the page cache.
+
+Numeric columns are stored as int64 (when every value is an integer) or float64
+(blanks become NaN); any other column is stored as integer codes into a list of
+categories kept in the schema (-1 for blanks). A cache whose source CSV changed is
+rebuilt on the next load().
+
+    python -m datasets build          # convert (or refresh) every dataset
+    python -m datasets verify         # re-hash the column files against the schema
+    python -m datasets info prediction
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DATASET_CACHE_DIR = os.getenv('DATASET_CACHE_DIR', os.path.join(ROOT, 'dataset_cache'))
+
+DATASETS = {
+    'prediction': os.path.join(ROOT, 'docs', 'diabetes_prediction_dataset.csv'),
+    'pima': os.path.join(ROOT, 'docs', 'diabetes.csv'),
+}
+
+# Bump when the layout of the converted files changes
+SCHEMA_VERSION = 1
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _parse_column(values):
+    """Return (array, categories) for one column of CSV strings; categories is None for numeric columns."""
+    blank = [value.strip() == '' for value in values]
+    if not any(blank):
+        try:
+            return np.array([int(value) for value in values], dtype=np.int64), None
+        except ValueError:
+            pass
+    try:
+        return np.array([math.nan if empty else float(value) for value, empty in zip(values, blank)], dtype=np.float64), None
+    except ValueError:
+        pass
+    categories = sorted({value for value, empty in zip(values, blank) if not empty})
+    index = {value: code for code, value in enumerate(categories)}
+    dtype = np.int8 if len(categories) < 2 ** 7 else np.int16 if len(categories) < 2 ** 15 else np.int32
+    return np.array([-1 if empty else index[value] for value, empty in zip(values, blank)], dtype=dtype), categories
+
+
+def convert(source, target):
+    """Convert a CSV into target/ (one .npy per column plus schema.json). Returns the schema."""
+    stamp = _source_stamp(source)
+    with open(source, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader)]
+        columns = [[] for _ in header]
+        for row in reader:
+            if not row:
+                continue
+            row = (row + [''] * len(header))[:len(header)]
+            for column, value in zip(columns, row):
+                column.append(value)
+    os.makedirs(target, exist_ok=True)
+    schema = {
+        'version': SCHEMA_VERSION,
+        'source': {'path': os.path.relpath(source, ROOT), 'sha256': file_digest(source), **stamp},
+        'rows': len(columns[0]) if columns else 0,
+        'columns': [],
+    }
+    for i, (name, values) in enumerate(zip(header, columns)):
+        array, categories = _parse_column(values)
+        file_name = f"{i:03d}.npy"
+        np.save(os.path.join(target, file_name), array, allow_pickle=False)
+        column = {'name': name, 'file': file_name, 'dtype': array.dtype.name,
+                  'sha256': file_digest(os.path.join(target, file_name))}
+        if categories is not None:
+            column['categories'] = categories
+        schema['columns'].append(column)
+    with open(os.path.join(target, 'schema.json'), 'w') as f:
+        json.dump(schema, f, indent=2)
+    return schema
+
+
+class Dataset:
+    """A converted dataset: columns are read-only memory-mapped arrays."""
+
+    def __init__(self, name, path, schema):
+        self.name = name
+        self.path = path
+        self.schema = schema
+        self.rows = schema['rows']
+        self._columns = {column['name']: column for column in schema['columns']}
+        self._arrays = {name: np.load(os.path.join(path, column['file']), mmap_mode='r', allow_pickle=False)
+                        for name, column in self._columns.items()}
+
+    @property
+    def names(self):
+        return list(self._columns)
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __getitem__(self, name):
+        """The column as stored (numeric values, or category codes). Raises KeyError."""
+        return self._arrays[name]
+
+    def categories(self, name):
+        """The categories of a coded column, or None for a numeric one."""
+        return self._columns[name].get('categories')
+
+    def decode(self, name, rows=slice(None)):
+        """The values of a coded column as an object array (None for blanks)."""
+        categories = np.array(self.categories(name) + [None], dtype=object)
+        return categories[np.asarray(self._arrays[name][rows])]
+
+    def verify(self):
+        """Re-hash the column files; returns the names of columns that don't match the schema."""
+        return [name for name, column in self._columns.items()
+                if file_digest(os.path.join(self.path, column['file'])) != column['sha256']]
+
+
+def _read_schema(path):
+    try:
+        with open(os.path.join(path, 'schema.json')) as f:
+            schema = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return schema if schema.get('version') == SCHEMA_VERSION else None
+
+
+def _is_current(schema, source, path):
+    """Whether a cached schema still describes source (re-hashing it only if its size/mtime moved)."""
+    if schema is None:
+        return False
+    recorded = schema['source']
+    stamp = _source_stamp(source)
+    if (recorded['size'], recorded['mtime_ns']) == (stamp['size'], stamp['mtime_ns']):
+        return True
+    if recorded['size'] != stamp['size'] or recorded['sha256'] != file_digest(source):
+        return False
+    # Same contents (e.g. a fresh checkout); remember the new mtime
+    schema['source'].update(stamp)
+    with open(os.path.join(path, 'schema.json.tmp'), 'w') as f:
+        json.dump(schema, f, indent=2)
+    os.replace(os.path.join(path, 'schema.json.tmp'), os.path.join(path, 'schema.json'))
+    return True
+
+
+def build(name, cache_dir=None, force=False):
+    """Convert the named dataset unless an up-to-date copy exists. Returns its directory."""
+    source = DATASETS[name]
+    cache_dir = cache_dir or DATASET_CACHE_DIR
+    path = os.path.join(cache_dir, name)
+    if not force and _is_current(_read_schema(path), source, path):
+        return path
+    os.makedirs(cache_dir, exist_ok=True)
+    started = time.perf_counter()
+    # Build next to the target and swap it in, so readers never see half a dataset
+    staging = tempfile.mkdtemp(prefix=f".{name}-", dir=cache_dir)
+    os.chmod(staging, 0o755)
+    retired = None
+    try:
+        schema = convert(source, staging)
+        if os.path.exists(path):
+            retired = tempfile.mkdtemp(prefix=f".{name}-old-", dir=cache_dir)
+            os.rename(path, os.path.join(retired, name))
+        os.rename(staging, path)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        if retired:
+            shutil.rmtree(retired, ignore_errors=True)
+    logger.info(f"Converted {source} into {path} ({schema['rows']} rows, {time.perf_counter() - started:.2f}s)")
+    return path
+
+
+_loaded = {}
+_load_lock = threading.Lock()
+
+
+def load(name, cache_dir=None):
+    """
+    Return the named dataset (see DATASETS), converting it first if needed. Datasets
+    are mapped once per process; a later call notices a changed source and rebuilds.
+    """
+    cache_dir = cache_dir or DATASET_CACHE_DIR
+    stamp = _source_stamp(DATASETS[name])
+    key = (name, cache_dir)
+    loaded = _loaded.get(key)
+    if loaded is not None and loaded[0] == stamp:
+        return loaded[1]
+    with _load_lock:
+        path = build(name, cache_dir)
+        dataset = Dataset(name, path, _read_schema(path))
+        _loaded[key] = (_source_stamp(DATASETS[name]), dataset)
+        return dataset
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m datasets', description='Manage the memory-mapped copies of the reference datasets.')
+    parser.add_argument('command', choices=('build', 'verify', 'info'))
+    parser.add_argument('names', nargs='*', help=f"datasets (default: all of {', '.join(DATASETS)})")
+    parser.add_argument('--force', action='store_true', help='rebuild even if the copy is up to date')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    unknown = [name for name in args.names if name not in DATASETS]
+    if unknown:
+        print(f"Error: unknown dataset(s) {', '.join(unknown)}", file=sys.stderr)
+        return 1
+    status = 0
+    for name in args.names or DATASETS:
+        if args.command == 'build':
+            build(name, force=args.force)
+        dataset = load(name)
+        if args.command == 'verify':
+            mismatched = dataset.verify()
+            status |= bool(mismatched)
+            print(f"{name}: {'OK' if not mismatched else 'checksum mismatch in ' + ', '.join(mismatched)}")
+        elif args.command == 'info':
+            print(f"{name}: {dataset.rows} rows from {dataset.schema['source']['path']} ({dataset.path})")
+            for column in dataset.schema['columns']:
+                categories = column.get('categories')
+                detail = f"{len(categories)} categories" if categories is not None else column['dtype']
+                print(f"  {column['name']:<24} {detail}")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
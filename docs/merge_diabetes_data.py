@@ -6,13 +6,50 @@ Standalone script to merge and clean multiple diabetes-related CSV datasets into
 Instructions:
 1. Place all source CSV files in a folder named 'data_sources/' in the project root.
 2. Run this script: python merge_diabetes_data.py
+   (-o diabetes.parquet writes Parquet instead, which needs pyarrow; see --help for the other options)
+   For nightly refreshes, python merge_diabetes_data.py --incremental keeps the normalized
+   sources in merge_cache/ and only re-reads the files that were added or changed.
 3. The merged and cleaned dataset will be saved as 'diabetes.csv' in the project root.
 
 Expected unified columns:
 - Age, Gender, BMI, Weight, Height, HbA1c, PhysicalActivity, DietaryHabits, FamilyHistory, ExistingConditions, DiabetesType, Outcome
+
+Sources of any size are merged in bounded memory. Each file is split into line-aligned
+byte ranges (so no quoted field may span lines) that a process pool reads in two passes:
+the first infers each column's dtype, finds the Height/Weight maxima for the unit
+heuristics and spills the numeric columns to disk for the medians; the second reads
+every range again with the dtypes fixed for the whole file, normalizes it with those
+per-file statistics and writes it to a shard. The shards are then concatenated in
+order, so the output is the same file a whole-file pd.read_csv and pd.concat would
+write. (Columns mixing numbers and text are read as text throughout, where
+pd.read_csv may hand back numbers for some rows.)
+
+With --dedup, duplicate records are dropped, keeping the first in merge order: with
+exact, records with the same value in every column of the source as read (so two
+patients that only differ in a column the mapping drops are kept); with near, also
+records that agree on Gender and Outcome and on Age, BMI and HbA1c rounded to
+NEAR_DUPLICATE_DECIMALS (records missing any of the five fall back to exact). The
+default, off, keeps everything and writes the output described above. Pass 1
+computes a 64-bit fingerprint of every row, and duplicates within a source are
+found before its medians are taken, so repeated patients don't weigh on them;
+duplicates of a record from an earlier source are dropped while the shards are
+concatenated. Either way the fingerprints go through an on-disk index: they are
+partitioned into bucket files small enough to sort within --dedup-memory-mb, so
+memory stays bounded however large the sources are. The merge reports the
+duplicates it dropped per source.
 """
-import os
+import argparse
 import glob
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
 
@@ -22,37 +59,50 @@ COLUMNS = [
     'PhysicalActivity', 'DietaryHabits', 'FamilyHistory', 'ExistingConditions', 'DiabetesType', 'Outcome'
 ]
 
-def map_and_normalize(df):
-    """
-    Map columns from various sources to the unified structure and normalize units.
-    """
-    col_map = {
-        'age': 'Age', 'Age': 'Age',
-        'sex': 'Gender', 'gender': 'Gender', 'Gender': 'Gender',
-        'bmi': 'BMI', 'BMI': 'BMI',
-        'weight': 'Weight', 'Weight': 'Weight',
-        'height': 'Height', 'Height': 'Height',
-        'hba1c': 'HbA1c', 'HbA1c': 'HbA1c', 'A1C': 'HbA1c',
-        'physicalactivity': 'PhysicalActivity', 'PhysicalActivity': 'PhysicalActivity',
-        'dietaryhabits': 'DietaryHabits', 'DietaryHabits': 'DietaryHabits',
-        'familyhistory': 'FamilyHistory', 'FamilyHistory': 'FamilyHistory',
-        'existingconditions': 'ExistingConditions', 'ExistingConditions': 'ExistingConditions',
-        'diabetestype': 'DiabetesType', 'DiabetesType': 'DiabetesType',
-        'outcome': 'Outcome', 'Outcome': 'Outcome', 'diabetes': 'Outcome', 'class': 'Outcome'
-    }
-    # Rename columns
-    df = df.rename(columns={k: v for k, v in col_map.items() if k in df.columns})
-    # Add missing columns
+COL_MAP = {
+    'age': 'Age', 'Age': 'Age',
+    'sex': 'Gender', 'gender': 'Gender', 'Gender': 'Gender',
+    'bmi': 'BMI', 'BMI': 'BMI',
+    'weight': 'Weight', 'Weight': 'Weight',
+    'height': 'Height', 'Height': 'Height',
+    'hba1c': 'HbA1c', 'HbA1c': 'HbA1c', 'A1C': 'HbA1c',
+    'physicalactivity': 'PhysicalActivity', 'PhysicalActivity': 'PhysicalActivity',
+    'dietaryhabits': 'DietaryHabits', 'DietaryHabits': 'DietaryHabits',
+    'familyhistory': 'FamilyHistory', 'FamilyHistory': 'FamilyHistory',
+    'existingconditions': 'ExistingConditions', 'ExistingConditions': 'ExistingConditions',
+    'diabetestype': 'DiabetesType', 'DiabetesType': 'DiabetesType',
+    'outcome': 'Outcome', 'Outcome': 'Outcome', 'diabetes': 'Outcome', 'class': 'Outcome'
+}
+
+# Imputed with the median of their source
+NUMERIC_COLUMNS = ['Age', 'BMI', 'Weight', 'Height', 'HbA1c', 'PhysicalActivity']
+
+# What pd.read_csv infers for a text column (object, or str from pandas 3 on)
+TEXT_DTYPE = pd.Series(['']).dtype
+
+CHUNK_BYTES = 32 * 1024 * 1024
+
+# Bump when a change to map_and_normalize changes the shards --incremental keeps
+MANIFEST_VERSION = 4
+
+DEDUP_MODES = ('off', 'exact', 'near')
+# Decimals Age, BMI and HbA1c are rounded to for near-duplicate fingerprints
+NEAR_DUPLICATE_DECIMALS = {'Age': 0, 'BMI': 1, 'HbA1c': 1}
+DEDUP_MEMORY_BYTES = 256 * 1024 * 1024
+FINGERPRINT_RECORD = np.dtype([('fp', '<u8'), ('row', '<i8')])
+FINGERPRINT_SUFFIX = '.fp.npy'
+
+
+def rename_columns(df):
+    """Rename source columns to the unified names and add the missing ones."""
+    df = df.rename(columns={k: v for k, v in COL_MAP.items() if k in df.columns})
     for col in COLUMNS:
         if col not in df.columns:
             df[col] = np.nan
-    # Normalize units
-    # Height: if in meters, convert to cm
-    if df['Height'].max() < 10:
-        df['Height'] = df['Height'] * 100
-    # Weight: if in pounds, convert to kg
-    if df['Weight'].max() > 200:
-        df['Weight'] = df['Weight'] * 0.453592
+    return df
+
+def normalize_codes(df):
+    """Normalize the coded columns of a renamed frame in place; none of it depends on the rest of the file."""
     # Gender normalization
     df['Gender'] = df['Gender'].replace({'M': 'Male', 'F': 'Female', 1: 'Male', 0: 'Female'}).fillna('Unknown')
     # FamilyHistory normalization
@@ -61,31 +111,473 @@ def map_and_normalize(df):
     df['DiabetesType'] = df['DiabetesType'].replace({np.nan: 'None'}).fillna('None')
     # Outcome normalization
     df['Outcome'] = df['Outcome'].replace({'Yes': 1, 'No': 0, 'Positive': 1, 'Negative': 0}).fillna(0).astype(int)
+
+def exact_fingerprints(df):
+    """
+    64-bit fingerprints of the rows of a source frame as read, over all of its columns,
+    so records are only duplicates if they agree on the fields the mapping drops too.
+    Numbers are compared as float64 (45 and 45.0 agree, whichever dtype a range was
+    read with) and the columns in name order, salted with their names: a copy of a
+    source with its columns reordered matches it, a source with other columns doesn't.
+    """
+    names = sorted(df.columns)
+    key = {}
+    for name in names:
+        numeric = pd.to_numeric(df[name], errors='coerce').astype(np.float64) + 0.0
+        key[f"{name}#number"] = numeric
+        key[f"{name}#text"] = df[name].astype(str).where(numeric.isna() & df[name].notna(), '')
+    salt = int(hashlib.sha256('\0'.join(names).encode()).hexdigest()[:16], 16)
+    return pd.util.hash_pandas_object(pd.DataFrame(key), index=False).to_numpy(dtype=np.uint64) ^ np.uint64(salt)
+
+def near_fingerprints(df, exact):
+    """
+    Near-duplicate fingerprints of the rows of a renamed, code-normalized frame: Age, BMI
+    and HbA1c rounded to NEAR_DUPLICATE_DECIMALS, Gender and Outcome. A row missing any
+    of them keeps its exact fingerprint, so near drops everything exact does.
+    """
+    key = pd.DataFrame({col: pd.to_numeric(df[col], errors='coerce').astype(np.float64).round(decimals) + 0.0
+                        for col, decimals in NEAR_DUPLICATE_DECIMALS.items()})
+    key['Gender'] = df['Gender'].astype(str)
+    key['Outcome'] = df['Outcome'].astype(np.int64)
+    eligible = (key[list(NEAR_DUPLICATE_DECIMALS)].notna().all(axis=1) & (key['Gender'] != 'Unknown')).to_numpy()
+    return np.where(eligible, pd.util.hash_pandas_object(key, index=False).to_numpy(dtype=np.uint64), exact)
+
+def find_duplicates(chunks, rows, path, memory_bytes=DEDUP_MEMORY_BYTES):
+    """
+    Mark the rows whose fingerprint an earlier row already has. chunks yields the
+    fingerprints of consecutive blocks of rows, rows in all. The fingerprints are
+    partitioned by value into bucket files small enough to sort in
+    memory_bytes (path.<bucket>), and each bucket is deduplicated on its own. Returns a
+    bool array over the rows (True for a duplicate), memory-mapped from path.
+    """
+    if not rows:
+        return np.zeros(0, dtype=bool)
+    # Sorting a bucket takes about twice its size
+    buckets = max(1, -(-rows * FINGERPRINT_RECORD.itemsize * 2 // memory_bytes))
+    duplicate = np.memmap(path, dtype=bool, mode='w+', shape=(rows,))
+    bucket_paths = [f"{path}.{b}" for b in range(buckets)]
+    files = [open(bucket_path, 'wb') for bucket_path in bucket_paths]
+    try:
+        offset = 0
+        for fp in chunks:
+            records = np.empty(len(fp), FINGERPRINT_RECORD)
+            records['fp'] = fp
+            records['row'] = np.arange(offset, offset + len(fp))
+            offset += len(fp)
+            bucket = records['fp'] % np.uint64(buckets)
+            # Stable, so every bucket file stays in row order
+            order = np.argsort(bucket, kind='stable')
+            records, bounds = records[order], np.searchsorted(bucket[order], np.arange(buckets + 1, dtype=np.uint64))
+            for b, f in enumerate(files):
+                records[bounds[b]:bounds[b + 1]].tofile(f)
+    finally:
+        for f in files:
+            f.close()
+    for bucket_path in bucket_paths:
+        records = np.fromfile(bucket_path, dtype=FINGERPRINT_RECORD)
+        os.remove(bucket_path)
+        # Stable on fingerprint alone keeps equal fingerprints in row order: all but the first repeat it
+        records = records[np.argsort(records['fp'], kind='stable')]
+        duplicate[records['row'][1:][records['fp'][1:] == records['fp'][:-1]]] = True
+    duplicate.flush()
+    return duplicate
+
+def map_and_normalize(df, stats=None):
+    """
+    Map columns from various sources to the unified structure and normalize units.
+
+    The unit heuristics and the imputed medians are per source file. When df is only
+    part of a source, stats (from source_stats) carries them for the whole file.
+    """
+    df = rename_columns(df)
+    # Normalize units
+    # Height: if in meters, convert to cm
+    if (df['Height'].max() < 10) if stats is None else stats['height_in_m']:
+        df['Height'] = df['Height'] * 100
+    # Weight: if in pounds, convert to kg
+    if (df['Weight'].max() > 200) if stats is None else stats['weight_in_lb']:
+        df['Weight'] = df['Weight'] * 0.453592
+    normalize_codes(df)
     # Fill missing values with median or 'Unknown'
-    for col in ['Age', 'BMI', 'Weight', 'Height', 'HbA1c', 'PhysicalActivity']:
+    for col in NUMERIC_COLUMNS:
         df[col] = pd.to_numeric(df[col], errors='coerce')
-        df[col] = df[col].fillna(df[col].median())
+        if stats is None:
+            df[col] = df[col].fillna(df[col].median())
+        else:
+            # A chunk without NaNs parses as int64 where the whole column is float64
+            if df[col].dtype.name != stats['dtypes'][col]:
+                df[col] = df[col].astype(stats['dtypes'][col])
+            df[col] = df[col].fillna(stats['medians'][col])
     for col in ['DietaryHabits', 'ExistingConditions']:
         df[col] = df[col].fillna('Unknown')
     # Reorder columns
     df = df[COLUMNS]
     return df
 
-def main():
-    data_dir = 'data_sources/'
-    all_files = glob.glob(os.path.join(data_dir, '*.csv'))
-    dfs = []
-    for file in all_files:
-        print(f'Reading {file}')
-        df = pd.read_csv(file)
-        df = map_and_normalize(df)
-        dfs.append(df)
-    if not dfs:
-        print('No CSV files found in data_sources/.')
+
+def default_workers():
+    """Cores this process may run on (respects container CPU affinity)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def common_dtype(dtypes):
+    """The dtype pd.concat (or a whole-file read) gives a column made of parts with these dtypes."""
+    dtypes = set(dtypes)
+    if len(dtypes) == 1:
+        return dtypes.pop()
+    if dtypes and dtypes <= {'int64', 'float64'}:
+        return 'float64'
+    return 'object'
+
+
+def read_header(path):
+    """Return the source's column names (as pd.read_csv names them) and where its data starts."""
+    names = list(pd.read_csv(path, nrows=0).columns)
+    with open(path, 'rb') as f:
+        f.readline()
+        return names, f.tell()
+
+
+def split_ranges(path, data_start, chunk_bytes=CHUNK_BYTES):
+    """Split [data_start, EOF) into byte ranges of about chunk_bytes that end on line boundaries."""
+    size = os.path.getsize(path)
+    bounds = [data_start]
+    with open(path, 'rb') as f:
+        while bounds[-1] + chunk_bytes < size:
+            f.seek(bounds[-1] + chunk_bytes)
+            f.readline()
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_range(path, start, end, names, dtype=None, all_columns=False):
+    """Parse one byte range of a source, keeping only the columns that map to the unified schema (or all of them)."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    usecols = None if all_columns else [name for name in names if name in COL_MAP]
+    return pd.read_csv(io.BytesIO(data), header=None, names=names, usecols=usecols, dtype=dtype)
+
+
+def scan_range(path, start, end, names, spill_prefix, dedup='off'):
+    """
+    Pass 1 worker: parse one byte range with inferred dtypes, spill its numeric columns
+    (as float64) to spill_prefix.<column>, and with dedup its row fingerprints to
+    spill_prefix.fp, and return what it contributes to the file's stats.
+    """
+    df = read_range(path, start, end, names, all_columns=dedup != 'off')
+    fp = None
+    if dedup != 'off':
+        fp = exact_fingerprints(df)
+        df = df[[name for name in names if name in COL_MAP]]
+    raw_dtypes = {name: df[name].dtype.name for name in df.columns}
+    df = rename_columns(df)
+    if dedup == 'near':
+        normalize_codes(df)
+        fp = near_fingerprints(df, fp)
+    if fp is not None:
+        fp.tofile(f"{spill_prefix}.fp")
+    scan = {
+        'rows': len(df),
+        'raw_dtypes': raw_dtypes,
+        'height_max': df['Height'].max(),
+        'weight_max': df['Weight'].max(),
+        'dtypes': {},
+    }
+    for col in NUMERIC_COLUMNS:
+        values = pd.to_numeric(df[col], errors='coerce')
+        scan['dtypes'][col] = values.dtype.name
+        values.to_numpy(dtype=np.float64, na_value=np.nan).tofile(f"{spill_prefix}.{col}")
+    return scan
+
+
+def source_stats(scans, spill_prefixes, duplicates=None):
+    """
+    Combine the pass-1 scans of one file into its read dtypes and normalization stats.
+    duplicates (a bool array per scan) leaves the duplicate rows out of the medians.
+    """
+    duplicates = duplicates or [None] * len(scans)
+    scans = [(scan, prefix, duplicate) for scan, prefix, duplicate in zip(scans, spill_prefixes, duplicates) if scan['rows']]
+    if not scans:
+        return None, None
+    read_dtypes = {}
+    for name in scans[0][0]['raw_dtypes']:
+        dtype = common_dtype(scan['raw_dtypes'][name] for scan, _, _ in scans)
+        read_dtypes[name] = dtype if dtype in ('int64', 'float64', 'bool') else TEXT_DTYPE
+    height_max = pd.Series([scan['height_max'] for scan, _, _ in scans], dtype=object).max()
+    weight_max = pd.Series([scan['weight_max'] for scan, _, _ in scans], dtype=object).max()
+    stats = {'height_in_m': bool(height_max < 10), 'weight_in_lb': bool(weight_max > 200), 'dtypes': {}, 'medians': {}}
+    scale = {'Height': 100 if stats['height_in_m'] else None, 'Weight': 0.453592 if stats['weight_in_lb'] else None}
+    for col in NUMERIC_COLUMNS:
+        stats['dtypes'][col] = common_dtype(scan['dtypes'][col] for scan, _, _ in scans)
+        # One column of one file in memory at a time
+        values = np.concatenate([np.fromfile(f"{prefix}.{col}", dtype=np.float64)[~duplicate] if duplicate is not None
+                                 else np.fromfile(f"{prefix}.{col}", dtype=np.float64) for _, prefix, duplicate in scans])
+        if scale.get(col) is not None:
+            values = values * scale[col]
+        stats['medians'][col] = pd.Series(values).median()
+    if stats['weight_in_lb']:
+        stats['dtypes']['Weight'] = 'float64'
+    return read_dtypes, stats
+
+
+def normalize_range(path, start, end, names, read_dtypes, stats, shard_path, output_format,
+                    duplicate=None, fingerprint_prefix=None):
+    """
+    Pass 2 worker: normalize one byte range into a shard, leaving out the rows marked in
+    duplicate. With fingerprint_prefix, the kept rows' pass-1 fingerprints are saved
+    next to the shard (<shard>.fp.npy). Returns (rows, column dtypes).
+    """
+    df = read_range(path, start, end, names, read_dtypes)
+    if duplicate is not None:
+        df = df[~duplicate].reset_index(drop=True)
+    df = map_and_normalize(df, stats)
+    if fingerprint_prefix is not None:
+        fp = np.fromfile(f"{fingerprint_prefix}.fp", dtype=np.uint64)
+        np.save(f"{shard_path}{FINGERPRINT_SUFFIX}", fp[~duplicate] if duplicate is not None else fp)
+        os.remove(f"{fingerprint_prefix}.fp")
+    dtypes = {col: df[col].dtype.name for col in COLUMNS}
+    if output_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        for col in COLUMNS:
+            if dtypes[col] not in ('int64', 'float64'):
+                df[col] = df[col].astype(str)
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), shard_path)
+    else:
+        df.to_csv(shard_path, header=False, index=False)
+    return len(df), dtypes
+
+
+def concat_shards(shards, output, output_format, duplicate=None):
+    """
+    Write the shards (path, rows, dtypes) to output in order, leaving out the rows marked
+    in duplicate (a bool array over all their rows). A shard whose int64 column is float64
+    in the merged frame is re-rendered, as pd.concat would upcast it.
+    """
+    dtypes = {col: common_dtype(d[col] for _, rows, d in shards if rows) for col in COLUMNS}
+    offsets = np.cumsum([0] + [rows for _, rows, _ in shards])
+    drops = [duplicate[start:end] if duplicate is not None and duplicate[start:end].any() else None
+             for start, end in zip(offsets[:-1], offsets[1:])]
+    if output_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        types = {'int64': pa.int64(), 'float64': pa.float64()}
+        schema = pa.schema([(col, types.get(dtypes[col], pa.string())) for col in COLUMNS])
+        with pq.ParquetWriter(output, schema) as writer:
+            for (path, _, _), drop in zip(shards, drops):
+                done = 0
+                for batch in pq.ParquetFile(path).iter_batches():
+                    if drop is not None:
+                        done += batch.num_rows
+                        batch = batch.filter(pa.array(~drop[done - batch.num_rows:done]))
+                    writer.write_table(pa.Table.from_batches([batch]).cast(schema))
         return
-    merged = pd.concat(dfs, ignore_index=True)
-    merged.to_csv('diabetes.csv', index=False)
-    print(f'Merged dataset saved as diabetes.csv with {len(merged)} rows.')
+    with open(output, 'wb') as out:
+        out.write(pd.DataFrame(columns=COLUMNS).to_csv(index=False).encode('utf-8'))
+        for (path, rows, shard_dtypes), drop in zip(shards, drops):
+            upcast = [col for col in COLUMNS if shard_dtypes[col] == 'int64' and dtypes[col] == 'float64']
+            if rows and (upcast or drop is not None):
+                done = 0
+                for chunk in pd.read_csv(path, header=None, names=COLUMNS, dtype=str, keep_default_na=False, chunksize=100000):
+                    if drop is not None:
+                        done += len(chunk)
+                        chunk = chunk[~drop[done - len(chunk):done]]
+                    for col in upcast:
+                        chunk[col] = chunk[col].astype('int64').astype('float64')
+                    buffer = io.StringIO()
+                    chunk.to_csv(buffer, header=False, index=False)
+                    out.write(buffer.getvalue().encode('utf-8'))
+            else:
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, out, 1024 * 1024)
+
+
+def file_digest(path):
+    """sha256 of a file's contents, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def normalize_sources(pool, files, tags, shard_dir, spill_dir, output_format, chunk_bytes,
+                      dedup='off', dedup_memory=DEDUP_MEMORY_BYTES):
+    """
+    Run both passes over files on the pool, writing shard_dir/<tag>-<range>.<format> for
+    each (and with dedup, the fingerprints of its rows next to it). Returns, per file, its
+    shards (file name, rows, dtypes) and the number of duplicates dropped within it.
+    """
+    sources = []
+    for file, tag in zip(files, tags):
+        names, data_start = read_header(file)
+        ranges = split_ranges(file, data_start, chunk_bytes)
+        prefixes = [os.path.join(spill_dir, f"spill-{tag}-{j:05d}") for j in range(len(ranges))]
+        futures = [pool.submit(scan_range, file, start, end, names, prefix, dedup)
+                   for (start, end), prefix in zip(ranges, prefixes)]
+        sources.append((file, tag, names, ranges, prefixes, futures))
+
+    jobs = []
+    for file, tag, names, ranges, prefixes, futures in sources:
+        print(f'Reading {file}')
+        scans = [future.result() for future in futures]
+        duplicates = [None] * len(scans)
+        if dedup != 'off':
+            rows = np.cumsum([0] + [scan['rows'] for scan in scans])
+            chunks = (np.fromfile(f"{prefix}.fp", dtype=np.uint64) for prefix in prefixes)
+            duplicate = find_duplicates(chunks, int(rows[-1]), os.path.join(spill_dir, f"duplicates-{tag}"), dedup_memory)
+            duplicates = [np.array(duplicate[start:end]) for start, end in zip(rows[:-1], rows[1:])]
+        read_dtypes, stats = source_stats(scans, prefixes, duplicates)
+        for prefix in prefixes:
+            for col in NUMERIC_COLUMNS:
+                os.remove(f"{prefix}.{col}")
+        file_jobs = []
+        if stats is not None:
+            for j, ((start, end), prefix, duplicate) in enumerate(zip(ranges, prefixes, duplicates)):
+                shard = f"{tag}-{j:05d}.{output_format}"
+                future = pool.submit(normalize_range, file, start, end, names, read_dtypes, stats,
+                                     os.path.join(shard_dir, shard), output_format,
+                                     duplicate if duplicate is not None and duplicate.any() else None,
+                                     prefix if dedup != 'off' else None)
+                file_jobs.append((shard, future))
+        jobs.append((file_jobs, sum(int(duplicate.sum()) for duplicate in duplicates if duplicate is not None)))
+    return [([(shard, *future.result()) for shard, future in file_jobs], dropped) for file_jobs, dropped in jobs]
+
+
+def load_manifest(cache_dir, output_format, dedup='off'):
+    """The previous run's manifest, or an empty one when it was written for other settings."""
+    empty = {'version': MANIFEST_VERSION, 'pandas': pd.__version__, 'format': output_format, 'dedup': dedup, 'sources': {}}
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return empty
+    if any(manifest.get(key) != empty[key] for key in ('version', 'pandas', 'format', 'dedup')):
+        return empty
+    return manifest
+
+
+def save_manifest(cache_dir, manifest):
+    path = os.path.join(cache_dir, 'manifest.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def merge(files, output, workers=None, output_format=None, chunk_bytes=CHUNK_BYTES, cache_dir=None,
+          dedup='off', dedup_memory=DEDUP_MEMORY_BYTES):
+    """
+    Merge the source CSVs (in order) into output (CSV or Parquet), dropping duplicate
+    records as dedup ('off', 'exact' or 'near') says; returns the row count.
+
+    With cache_dir, the shards are kept there with a manifest of the sources they came
+    from (path, size, mtime, sha256), and the next run only normalizes sources that are
+    new or whose contents changed. Since the unit heuristics, medians and within-source
+    duplicates are per source, a source's shards don't depend on the other sources;
+    duplicates across sources are found again on every run, from the fingerprints kept
+    next to the shards.
+    """
+    workers = workers or default_workers()
+    output_format = output_format or ('parquet' if output.endswith('.parquet') else 'csv')
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output))) as tmp, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        if cache_dir is None:
+            shard_dir, manifest = tmp, None
+            tags = [f"{i:05d}" for i in range(len(files))]
+            entries = [{'path': file, 'shards': shards, 'duplicates': dropped} for file, (shards, dropped) in
+                       zip(files, normalize_sources(pool, files, tags, shard_dir, tmp, output_format, chunk_bytes,
+                                                    dedup, dedup_memory))]
+        else:
+            shard_dir = os.path.join(cache_dir, 'shards')
+            os.makedirs(shard_dir, exist_ok=True)
+            manifest = load_manifest(cache_dir, output_format, dedup)
+            companions = [FINGERPRINT_SUFFIX] if dedup != 'off' else []
+            # Shards are named by content hash, so a renamed or copied source reuses them too
+            known = {previous['sha256']: (previous['shards'], previous['duplicates'])
+                     for previous in manifest['sources'].values()
+                     if all(os.path.exists(os.path.join(shard_dir, shard + suffix))
+                            for shard, _, _ in previous['shards'] for suffix in ['', *companions])}
+            entries, stale = [], {}
+            for file in files:
+                stat = os.stat(file)
+                entry = {'path': file, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+                previous = manifest['sources'].get(os.path.abspath(file))
+                if previous and previous['sha256'] in known and (previous['size'], previous['mtime_ns']) == (entry['size'], entry['mtime_ns']):
+                    entry['sha256'] = previous['sha256']
+                else:
+                    entry['sha256'] = file_digest(file)
+                if entry['sha256'] in known:
+                    print(f'Reusing {file}')
+                elif entry['sha256'] not in stale:
+                    stale[entry['sha256']] = file
+                entries.append(entry)
+            results = normalize_sources(pool, list(stale.values()), [digest[:16] for digest in stale],
+                                        shard_dir, tmp, output_format, chunk_bytes, dedup, dedup_memory)
+            known.update(zip(stale, results))
+            for entry in entries:
+                entry['shards'], entry['duplicates'] = known[entry['sha256']]
+
+        shards = [(os.path.join(shard_dir, shard), rows, dtypes) for entry in entries for shard, rows, dtypes in entry['shards']]
+        duplicate = None
+        if dedup != 'off':
+            def shard_fingerprints():
+                for path, _, _ in shards:
+                    yield np.load(f"{path}{FINGERPRINT_SUFFIX}")
+            duplicate = find_duplicates(shard_fingerprints(), sum(rows for _, rows, _ in shards),
+                                        os.path.join(tmp, 'duplicates'), dedup_memory)
+            start = 0
+            for entry in entries:
+                end = start + sum(rows for _, rows, _ in entry['shards'])
+                repeated, start = int(duplicate[start:end].sum()), end
+                print(f"{entry['path']}: dropped {entry['duplicates'] + repeated} duplicates "
+                      f"({entry['duplicates']} within the file, {repeated} already in an earlier one)")
+        concat_shards(shards, output, output_format, duplicate)
+        rows = sum(rows for _, rows, _ in shards) - (int(duplicate.sum()) if duplicate is not None else 0)
+        del duplicate
+
+    if manifest is not None:
+        manifest['sources'] = {os.path.abspath(entry['path']): entry for entry in entries}
+        save_manifest(cache_dir, manifest)
+        kept = {shard + suffix for entry in entries for shard, _, _ in entry['shards'] for suffix in ['', *companions]}
+        for shard in os.listdir(shard_dir):
+            if shard not in kept:
+                os.remove(os.path.join(shard_dir, shard))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Merge and clean the diabetes CSV sources into one dataset.')
+    parser.add_argument('--sources', default='data_sources/', help='folder with the source CSV files')
+    parser.add_argument('-o', '--output', default='diabetes.csv', help='output .csv or .parquet file')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--chunk-mb', type=int, default=CHUNK_BYTES // (1024 * 1024), help='size of the byte ranges read at once')
+    parser.add_argument('--incremental', action='store_true',
+                        help='keep normalized shards in --cache-dir and only re-read sources that changed')
+    parser.add_argument('--cache-dir', default='merge_cache/', help='where --incremental keeps its shards and manifest')
+    parser.add_argument('--dedup', choices=DEDUP_MODES, default='off',
+                        help='drop records identical to an earlier one in every source column (exact), also those '
+                             'that agree on Gender, Outcome and rounded Age, BMI and HbA1c (near), or none (off, the default)')
+    parser.add_argument('--dedup-memory-mb', type=int, default=DEDUP_MEMORY_BYTES // (1024 * 1024),
+                        help='memory for finding duplicates; beyond it the index is split into on-disk buckets')
+    args = parser.parse_args(argv)
+
+    all_files = glob.glob(os.path.join(args.sources, '*.csv'))
+    if not all_files:
+        print(f'No CSV files found in {args.sources}.')
+        return 0
+    started = time.perf_counter()
+    rows = merge(all_files, args.output, args.workers, chunk_bytes=args.chunk_mb * 1024 * 1024,
+                 cache_dir=args.cache_dir if args.incremental else None,
+                 dedup=args.dedup, dedup_memory=args.dedup_memory_mb * 1024 * 1024)
+    print(f'Merged dataset saved as {args.output} with {rows} rows ({time.perf_counter() - started:.1f}s).')
+    return 0
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Tests for merge_diabetes_data.py on the two datasets shipped in docs/.
+
+    python -m pytest docs/test_merge_diabetes_data.py
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import merge_diabetes_data as merger
+
+DOCS = os.path.dirname(os.path.abspath(__file__))
+SOURCES = [os.path.join(DOCS, 'diabetes.csv'), os.path.join(DOCS, 'diabetes_prediction_dataset.csv')]
+
+
+def source_rows():
+    return sum(len(pd.read_csv(source)) for source in SOURCES)
+
+
+def full_row_duplicates():
+    return sum(int(pd.read_csv(source).duplicated().sum()) for source in SOURCES)
+
+
+def test_merge_keeps_every_record_by_default(tmp_path):
+    output = str(tmp_path / 'merged.csv')
+    assert merger.merge(SOURCES, output, workers=2) == source_rows()
+    assert len(pd.read_csv(output)) == source_rows()
+
+
+@pytest.mark.parametrize('chunk_bytes', [merger.CHUNK_BYTES, 256 * 1024])
+def test_merge_output_matches_a_whole_file_merge(tmp_path, chunk_bytes):
+    # What the script wrote before it read in ranges: each source whole, then one concat
+    expected = str(tmp_path / 'expected.csv')
+    pd.concat([merger.map_and_normalize(pd.read_csv(source)) for source in SOURCES],
+              ignore_index=True).to_csv(expected, index=False)
+    if chunk_bytes < merger.CHUNK_BYTES:
+        names, data_start = merger.read_header(SOURCES[1])
+        assert len(merger.split_ranges(SOURCES[1], data_start, chunk_bytes)) > 1
+    output = str(tmp_path / 'merged.csv')
+    merger.merge(SOURCES, output, workers=2, chunk_bytes=chunk_bytes)
+    with open(expected, 'rb') as a, open(output, 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_exact_dedup_only_drops_full_row_duplicates(tmp_path):
+    output = str(tmp_path / 'merged.csv')
+    rows = merger.merge(SOURCES, output, workers=2, dedup='exact')
+    assert rows == source_rows() - full_row_duplicates()
+    assert len(pd.read_csv(output)) == rows
+
+
+def test_exact_dedup_does_not_depend_on_chunking(tmp_path):
+    whole, chunked = str(tmp_path / 'whole.csv'), str(tmp_path / 'chunked.csv')
+    merger.merge(SOURCES, whole, workers=2, dedup='exact')
+    merger.merge(SOURCES, chunked, workers=1, dedup='exact', chunk_bytes=1024 * 1024, dedup_memory=64 * 1024)
+    with open(whole, 'rb') as a, open(chunked, 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_near_dedup_drops_everything_exact_does(tmp_path):
+    exact, near = str(tmp_path / 'exact.csv'), str(tmp_path / 'near.csv')
+    assert merger.merge(SOURCES, near, workers=2, dedup='near') <= merger.merge(SOURCES, exact, workers=2, dedup='exact')
+    # The Pima records have neither Gender nor HbA1c: near falls back to their exact fingerprint
+    pima = len(pd.read_csv(SOURCES[0]))
+    assert pd.read_csv(near).head(pima).equals(pd.read_csv(exact).head(pima))
+
+
+def test_find_duplicates_across_buckets(tmp_path):
+    fp = np.random.default_rng(0).integers(0, 5000, 20000).astype(np.uint64)
+    duplicate = merger.find_duplicates(iter(np.array_split(fp, 7)), len(fp), str(tmp_path / 'duplicates'),
+                                       memory_bytes=64 * 1024)
+    assert np.array_equal(duplicate, pd.Series(fp).duplicated().to_numpy())
+
+
+def test_incremental_merge_matches_a_full_merge(tmp_path, capsys):
+    sources = [str(tmp_path / os.path.basename(source)) for source in SOURCES]
+    for source, copy in zip(SOURCES, sources):
+        with open(source, 'rb') as f, open(copy, 'wb') as out:
+            out.write(f.read())
+    cache_dir = str(tmp_path / 'cache')
+
+    def merged(output, **options):
+        merger.merge(sources, str(tmp_path / output), workers=2, dedup='exact', **options)
+        with open(tmp_path / output, 'rb') as f:
+            return f.read()
+
+    assert merged('first.csv', cache_dir=cache_dir) == merged('full.csv')
+    # Change the Pima file (a repeated and a new record): only it is normalized again
+    with open(sources[0]) as f:
+        text = f.read()
+    lines = text.splitlines()
+    with open(sources[0], 'a') as f:
+        f.write(('' if text.endswith('\n') else '\n') + f"{lines[1]}\n{lines[2].replace(',', ',1', 1)}\n")
+    capsys.readouterr()
+    incremental = merged('second.csv', cache_dir=cache_dir)
+    log = capsys.readouterr().out
+    assert f'Reusing {sources[1]}' in log and f'Reading {sources[0]}' in log
+    assert f'Reading {sources[1]}' not in log
+    assert incremental == merged('full-again.csv')
+    assert len(pd.read_csv(tmp_path / 'second.csv')) == source_rows() - full_row_duplicates() + 1
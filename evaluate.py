@@ -0,0 +1,213 @@
+# evaluate.py
+"""
+Accuracy of the rule set against the labeled reference dataset.
+
+    python -m evaluate                                 # the active rules.json
+    python -m evaluate --rules proposed_rules.json     # a proposed rule set (repeatable)
+    python -m evaluate --hba1c 5.7:7.5:0.1 --bmi none,25,30 --json report.json
+
+Every record of docs/diabetes_prediction_dataset.csv (memory-mapped through
+datasets.py; 'diabetes' is the label) is matched with RuleSet.match_batch, and the
+report gives the confusion matrix of the rule set's predictions and, per rule, how
+many records it fires on, their observed diabetes rate, and its sensitivity and
+specificity as a test on its own (the share of diabetic records it fires on, and
+the share of non-diabetic records it doesn't).
+
+The threshold sweep scores "diabetic iff HbA1c > h and BMI > b" for every pair of
+cutoffs in one pass: each record is binned by how many cutoffs lie below its values,
+a 2-D histogram per class is built with np.bincount, and suffix sums over it give
+the true/false positives of every grid point at once, so a grid costs about the same
+as a single cutoff.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+
+import numpy as np
+
+import datasets
+import rules
+
+DEFAULT_HBA1C_CUTOFFS = [round(5.0 + 0.1 * i, 1) for i in range(31)]
+DEFAULT_BMI_CUTOFFS = [-math.inf, 20.0, 22.5, 25.0, 27.5, 30.0, 32.5, 35.0]
+
+
+def load_labeled(name='prediction'):
+    """(age, bmi, hba1c, truth) arrays of a reference dataset; truth is 0/1."""
+    dataset = datasets.load(name)
+    columns = [np.asarray(dataset[column], dtype=np.float64) for column in ('age', 'bmi', 'HbA1c_level')]
+    return (*columns, np.asarray(dataset['diabetes']).astype(np.int8))
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+
+def confusion(truth, predicted):
+    """Return {"tn", "fp", "fn", "tp"} plus sensitivity, specificity, ppv, npv and accuracy."""
+    tn, fp, fn, tp = np.bincount(truth.astype(np.intp) * 2 + predicted, minlength=4).tolist()
+    return {
+        "tn": tn, "fp": fp, "fn": fn, "tp": tp,
+        "sensitivity": _ratio(tp, tp + fn),
+        "specificity": _ratio(tn, tn + fp),
+        "ppv": _ratio(tp, tp + fp),
+        "npv": _ratio(tn, tn + fn),
+        "accuracy": _ratio(tp + tn, len(truth)),
+    }
+
+
+def rule_report(ruleset, matched, truth):
+    """Per rule: records fired on, diabetic records among them, observed rate, sensitivity, specificity."""
+    size = len(ruleset.rules)
+    fired = np.bincount(matched, minlength=size)
+    fired_positive = np.bincount(matched[truth == 1], minlength=size)
+    positives = int(truth.sum())
+    negatives = len(truth) - positives
+    report = []
+    for index, (rule_id, prediction, risk_level, diabetes_type, _, _) in enumerate(ruleset.rules):
+        n, diabetic = int(fired[index]), int(fired_positive[index])
+        report.append({
+            "rule": rule_id, "prediction": prediction, "risk_level": risk_level, "diabetes_type": diabetes_type,
+            "fired": n, "diabetic": diabetic,
+            "diabetes_rate": _ratio(diabetic, n),
+            "sensitivity": _ratio(diabetic, positives),
+            "specificity": _ratio(negatives - (n - diabetic), negatives),
+        })
+    return report
+
+
+def _suffix_sums(counts):
+    """S[i, j] = sum of counts[i:, j:]."""
+    return counts[::-1, ::-1].cumsum(axis=0).cumsum(axis=1)[::-1, ::-1]
+
+
+def threshold_sweep(hba1c, bmi, truth, hba1c_cutoffs, bmi_cutoffs):
+    """
+    Confusion counts of "positive iff HbA1c > h and BMI > b" for every (h, b) in the
+    grid, in one pass over the data. Returns (hba1c_cutoffs, bmi_cutoffs, tp, fp, fn, tn)
+    with sorted cutoffs and 2-D count arrays indexed [h, b]. NaN never exceeds a cutoff.
+    """
+    hba1c_cutoffs = np.unique(np.asarray(hba1c_cutoffs, dtype=np.float64))
+    bmi_cutoffs = np.unique(np.asarray(bmi_cutoffs, dtype=np.float64))
+    shape = (len(hba1c_cutoffs) + 1, len(bmi_cutoffs) + 1)
+    # Bin k holds the values above exactly k cutoffs.
+    hba1c_bins = np.searchsorted(hba1c_cutoffs, hba1c, side='left')
+    hba1c_bins[np.isnan(hba1c)] = 0
+    bmi_bins = np.searchsorted(bmi_cutoffs, bmi, side='left')
+    bmi_bins[np.isnan(bmi)] = 0
+    flat = hba1c_bins * shape[1] + bmi_bins
+    positive = truth == 1
+    # Above cutoffs i and j means bins past i and j: drop the first row and column of the suffix sums.
+    tp = _suffix_sums(np.bincount(flat[positive], minlength=shape[0] * shape[1]).reshape(shape))[1:, 1:]
+    fp = _suffix_sums(np.bincount(flat[~positive], minlength=shape[0] * shape[1]).reshape(shape))[1:, 1:]
+    positives = int(positive.sum())
+    negatives = len(truth) - positives
+    return hba1c_cutoffs, bmi_cutoffs, tp, fp, positives - tp, negatives - fp
+
+
+def sweep_rows(hba1c_cutoffs, bmi_cutoffs, tp, fp, fn, tn):
+    """Flatten a sweep into one dict per grid point, best Youden's J (sensitivity + specificity - 1) first."""
+    rows = []
+    for i, h in enumerate(hba1c_cutoffs.tolist()):
+        for j, b in enumerate(bmi_cutoffs.tolist()):
+            counts = {"tp": int(tp[i, j]), "fp": int(fp[i, j]), "fn": int(fn[i, j]), "tn": int(tn[i, j])}
+            sensitivity = _ratio(counts["tp"], counts["tp"] + counts["fn"])
+            specificity = _ratio(counts["tn"], counts["tn"] + counts["fp"])
+            rows.append({
+                "hba1c_gt": h, "bmi_gt": None if b == -math.inf else b, **counts,
+                "sensitivity": sensitivity, "specificity": specificity,
+                "ppv": _ratio(counts["tp"], counts["tp"] + counts["fp"]),
+                "youden_j": (sensitivity or 0.0) + (specificity or 0.0) - 1.0,
+            })
+    rows.sort(key=lambda row: -row["youden_j"])
+    return rows
+
+
+def evaluate(ruleset, data, hba1c_cutoffs=DEFAULT_HBA1C_CUTOFFS, bmi_cutoffs=DEFAULT_BMI_CUTOFFS):
+    age, bmi, hba1c, truth = data
+    started = time.perf_counter()
+    matched = ruleset.match_batch(age, bmi, hba1c)
+    predicted = ruleset.predictions[matched].astype(np.intp)
+    report = {
+        "rules_version": ruleset.version,
+        "rules_source": ruleset.source,
+        "records": len(truth),
+        "confusion": confusion(truth, predicted),
+        "per_rule": rule_report(ruleset, matched, truth),
+    }
+    report["rules_seconds"] = time.perf_counter() - started
+    started = time.perf_counter()
+    report["sweep"] = sweep_rows(*threshold_sweep(hba1c, bmi, truth, hba1c_cutoffs, bmi_cutoffs))
+    report["sweep_seconds"] = time.perf_counter() - started
+    return report
+
+
+def parse_cutoffs(text):
+    """"5.7:7.5:0.1" (inclusive range) or "none,25,30" ("none" means no cutoff)."""
+    if ':' in text:
+        start, stop, step = (float(part) for part in text.split(':'))
+        count = int(math.floor((stop - start) / step + 1e-9)) + 1
+        return [round(start + i * step, 10) for i in range(count)]
+    return [-math.inf if part.strip().lower() == 'none' else float(part) for part in text.split(',')]
+
+
+def _percent(value):
+    return f"{value:.1%}" if value is not None else '-'
+
+
+def print_report(report, top):
+    print(f"Rules {report['rules_version']} ({report['rules_source']}) on {report['records']} records "
+          f"[{report['rules_seconds'] * 1000:.1f} ms]")
+    c = report['confusion']
+    print(f"\n{'':>14}{'pred 0':>10}{'pred 1':>10}")
+    print(f"{'diabetes 0':>14}{c['tn']:>10}{c['fp']:>10}")
+    print(f"{'diabetes 1':>14}{c['fn']:>10}{c['tp']:>10}")
+    print(f"sensitivity {_percent(c['sensitivity'])}  specificity {_percent(c['specificity'])}  "
+          f"ppv {_percent(c['ppv'])}  npv {_percent(c['npv'])}  accuracy {_percent(c['accuracy'])}")
+    print(f"\n{'rule':<10}{'pred':>5}{'fired':>9}{'diabetic':>10}{'rate':>8}{'sens':>8}{'spec':>8}  outcome")
+    for row in report['per_rule']:
+        print(f"{row['rule']:<10}{row['prediction']:>5}{row['fired']:>9}{row['diabetic']:>10}{_percent(row['diabetes_rate']):>8}"
+              f"{_percent(row['sensitivity']):>8}{_percent(row['specificity']):>8}  {row['risk_level']} / {row['diabetes_type']}")
+    print(f"\nThreshold sweep: {len(report['sweep'])} grid points [{report['sweep_seconds'] * 1000:.1f} ms], "
+          f"best {min(top, len(report['sweep']))} by Youden's J")
+    print(f"{'HbA1c >':>8}{'BMI >':>8}{'tp':>8}{'fp':>8}{'fn':>8}{'tn':>8}{'sens':>8}{'spec':>8}{'ppv':>8}{'J':>7}")
+    for row in report['sweep'][:top]:
+        bmi = '-' if row['bmi_gt'] is None else f"{row['bmi_gt']:g}"
+        print(f"{row['hba1c_gt']:>8g}{bmi:>8}{row['tp']:>8}{row['fp']:>8}{row['fn']:>8}{row['tn']:>8}"
+              f"{_percent(row['sensitivity']):>8}{_percent(row['specificity']):>8}{_percent(row['ppv']):>8}{row['youden_j']:>7.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m evaluate', description='Evaluate the rules against the labeled reference dataset.')
+    parser.add_argument('--rules', action='append', help='rules file to evaluate (repeatable; default: the active rules)')
+    parser.add_argument('--hba1c', type=parse_cutoffs, default=DEFAULT_HBA1C_CUTOFFS,
+                        help='HbA1c cutoffs to sweep, start:stop:step or a comma list (default 5.0:8.0:0.1)')
+    parser.add_argument('--bmi', type=parse_cutoffs, default=DEFAULT_BMI_CUTOFFS,
+                        help='BMI cutoffs to sweep, start:stop:step or a comma list; "none" means no BMI condition')
+    parser.add_argument('--top', type=int, default=10, help='sweep rows to print')
+    parser.add_argument('--json', dest='json_path', help='also write the full report(s) to this file')
+    args = parser.parse_args(argv)
+
+    try:
+        rulesets = [rules.load_rules(path) for path in args.rules] if args.rules else [rules.current()]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: could not load rules: {e}", file=sys.stderr)
+        return 1
+    data = load_labeled()
+    reports = []
+    for i, ruleset in enumerate(rulesets):
+        if i:
+            print('\n' + '-' * 72 + '\n')
+        report = evaluate(ruleset, data, args.hba1c, args.bmi)
+        print_report(report, args.top)
+        reports.append(report)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(reports if len(reports) > 1 else reports[0], f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,223 @@
+# exports.py
+"""
+Streaming report writers.
+
+Each writer takes a column list and an iterable of rows and returns a generator
+of bytes, so an export of a user's whole prediction history or of a batch
+screening result is produced and sent incrementally: rows are pulled from the
+source as the client reads, and no writer builds the whole document in memory.
+
+- CSV: plain rows.
+- XLSX: a minimal single-sheet workbook written through zipfile onto a
+  non-seekable sink that is drained after every block of rows.
+- PDF: a one-page summary (counts by risk level, diabetes type and rule) that is
+  aggregated in a single pass over the rows; the rows themselves are not kept.
+"""
+import csv
+import io
+import math
+import zipfile
+from collections import Counter
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+FLUSH_ROWS = 1000
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'pdf': ('application/pdf', 'pdf'),
+}
+
+
+def csv_stream(columns, rows):
+    """Yield UTF-8 CSV: the header (if columns is not None) and then the rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if columns is not None:
+        writer.writerow(columns)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % FLUSH_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, non-seekable byte sink that zipfile writes into and the generator drains."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_XLSX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+def _xlsx_cell(value):
+    if isinstance(value, bool) or value is None:
+        value = '' if value is None else str(value)
+    if isinstance(value, (int, float)):
+        # NaN and inf have no spreadsheet representation: a missing value is an empty cell
+        if not math.isfinite(value):
+            return '<c/>'
+        return f'<c><v>{value!r}</v></c>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def xlsx_stream(columns, rows, sheet_name='Report'):
+    """Yield a single-sheet .xlsx workbook; numbers stay numeric, everything else is text."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _XLSX_RELS)
+        zf.writestr('xl/workbook.xml', _XLSX_WORKBOOK.format(name=escape(sheet_name[:31])))
+        zf.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS)
+        yield sink.drain()
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            sheet.write(_xlsx_row(columns).encode('utf-8'))
+            block = []
+            for row in rows:
+                block.append(_xlsx_row(row))
+                if len(block) >= FLUSH_ROWS:
+                    sheet.write(''.join(block).encode('utf-8'))
+                    block = []
+                    yield sink.drain()
+            sheet.write(''.join(block).encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+def summarize(columns, rows):
+    """Aggregate rows in one pass: total count, counts by outcome columns and created_at range."""
+    index = {name: i for i, name in enumerate(columns)}
+    counters = {name: Counter() for name in ('risk_level', 'diabetes_type', 'rule') if name in index}
+    total, first, last = 0, None, None
+    time_i = index.get('created_at')
+    for row in rows:
+        total += 1
+        for name, counter in counters.items():
+            counter[row[index[name]]] += 1
+        if time_i is not None:
+            stamp = row[time_i]
+            first = stamp if first is None or stamp < first else first
+            last = stamp if last is None or stamp > last else last
+    return {'total': total, 'counts': counters, 'first': first, 'last': last}
+
+
+def _pdf_text(value):
+    text = str(value).encode('latin-1', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def pdf_summary_stream(columns, rows, title='Diabetes Prediction Report', subtitle_lines=()):
+    """Yield a one-page PDF summarizing rows (see summarize)."""
+    summary = summarize(columns, rows)
+    lines = [(16, title), (10, f"Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")]
+    lines += [(10, line) for line in subtitle_lines]
+    lines.append((10, ''))
+    lines.append((12, f"Records: {summary['total']}"))
+    if summary['first']:
+        lines.append((10, f"From {summary['first']} to {summary['last']}"))
+    labels = {'risk_level': 'By risk level', 'diabetes_type': 'By diabetes type', 'rule': 'By rule'}
+    for name, counter in summary['counts'].items():
+        lines.append((10, ''))
+        lines.append((12, labels[name]))
+        for key, count in sorted(counter.items(), key=lambda item: (-item[1], str(item[0]))):
+            share = 100.0 * count / summary['total'] if summary['total'] else 0.0
+            lines.append((10, f"    {key}: {count} ({share:.1f}%)"))
+
+    content = ['BT', '50 800 Td']
+    for size, text in lines[:60]:
+        content.append(f'/F1 {size} Tf ({_pdf_text(text)}) Tj 0 -{size + 6} Td')
+    content.append('ET')
+    stream = '\n'.join(content).encode('latin-1')
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        b'<< /Length ' + str(len(stream)).encode() + b' >>\nstream\n' + stream + b'\nendstream',
+    ]
+    offset = 0
+    header = b'%PDF-1.4\n'
+    yield header
+    offset += len(header)
+    xref = []
+    for number, body in enumerate(objects, 1):
+        chunk = f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+        xref.append(offset)
+        offset += len(chunk)
+        yield chunk
+    table = [f'xref\n0 {len(objects) + 1}\n', '0000000000 65535 f \n']
+    table += [f'{position:010d} 00000 n \n' for position in xref]
+    table.append(f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{offset}\n%%EOF\n')
+    yield ''.join(table).encode()
+
+
+def stream_export(fmt, columns, rows, title='Diabetes Prediction Report', subtitle_lines=()):
+    """
+    Return (chunks, mimetype, extension) for an export in fmt (csv, xlsx or pdf).
+    Raises ValueError for an unknown format.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt} (choose from {', '.join(FORMATS)})")
+    mimetype, extension = FORMATS[fmt]
+    if fmt == 'csv':
+        chunks = csv_stream(columns, rows)
+    elif fmt == 'xlsx':
+        chunks = xlsx_stream(columns, rows, sheet_name=title)
+    else:
+        chunks = pdf_summary_stream(columns, rows, title=title, subtitle_lines=subtitle_lines)
+    return chunks, mimetype, extension
@@ -0,0 +1,65 @@
+# gunicorn.conf.py
+"""
+Gunicorn hooks, read from the working directory by `gunicorn app:app`.
+
+With --preload (as in the Procfile and render.yaml) the app is imported once in the
+master; when_ready then warms it there (rules, templates, the lazily imported
+subsystems, see app.warm_up) before any worker is forked, so workers answer their
+first request without that work and share the memory copy-on-write. gc.freeze()
+moves everything loaded so far out of the collector's reach, so collections in
+the workers don't write to (and so copy) those pages.
+
+The background job worker (`python -m jobs worker`) runs next to the web workers as
+a child of the master, so it shares the queue file and JOBS_DIR with them on the
+service's own filesystem; it is restarted if it exits and stopped with the server.
+Set JOBS_IN_WEB=false when a separate worker on the same host runs the jobs.
+"""
+import gc
+import os
+import subprocess
+import sys
+import threading
+
+JOBS_IN_WEB = os.getenv('JOBS_IN_WEB', 'true').lower() == 'true'
+# Seconds between checks that the job worker is alive
+JOB_WORKER_CHECK_INTERVAL = 5
+
+_job_worker = None
+_stopping = threading.Event()
+
+
+def _start_job_worker():
+    return subprocess.Popen([sys.executable, '-m', 'jobs', 'worker'], cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def _supervise_job_worker(server):
+    # Polls rather than wait()s: the master reaps unknown children itself on SIGCHLD.
+    global _job_worker
+    while not _stopping.wait(JOB_WORKER_CHECK_INTERVAL):
+        if _job_worker.poll() is not None and not _stopping.is_set():
+            # No exit status: the master usually reaps the process before poll() does
+            server.log.warning(f"Job worker (pid {_job_worker.pid}) exited, restarting it")
+            _job_worker = _start_job_worker()
+
+
+def when_ready(server):
+    global _job_worker
+    if server.cfg.preload_app:
+        import app
+        app.warm_up(app.app)
+        gc.freeze()
+    if JOBS_IN_WEB:
+        _job_worker = _start_job_worker()
+        server.log.info(f"Started job worker (pid {_job_worker.pid})")
+        threading.Thread(target=_supervise_job_worker, args=(server,), name='job-worker-supervisor', daemon=True).start()
+
+
+def on_exit(server):
+    _stopping.set()
+    if _job_worker is not None and _job_worker.poll() is None:
+        # The worker lets running jobs finish on SIGTERM
+        _job_worker.terminate()
+        try:
+            _job_worker.wait(server.cfg.graceful_timeout)
+        except subprocess.TimeoutExpired:
+            _job_worker.kill()
@@ -0,0 +1,122 @@
+# history.py
+"""
+Append-only per-user prediction history.
+
+Every prediction is one INSERT into an SQLite (WAL) table indexed by
+(user_id, created_at, id), so recording costs the same however long a user's
+history is, and reads walk the index one page at a time using an opaque cursor
+instead of loading the whole history.
+"""
+import base64
+import json
+import logging
+import os
+import sqlite3
+from datetime import date, datetime, time
+
+from sqlite_connections import ThreadLocalConnection
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DB = os.getenv('HISTORY_DB', 'history.db')
+MAX_PAGE_SIZE = 500
+
+FIELDS = ('id', 'created_at', 'age', 'bmi', 'hba1c', 'rule', 'prediction', 'risk_level', 'diabetes_type')
+
+
+def encode_cursor(created_at, row_id):
+    return base64.urlsafe_b64encode(json.dumps([created_at, row_id]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError for a malformed cursor."""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return str(created_at), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def normalize_timestamp(value, end_of_day=False):
+    """
+    Parse an ISO-8601 date/time filter into the format stored in created_at. A bare date
+    is the start of that day, or with end_of_day (for an until bound) its last moment, so
+    until=2026-10-18 includes the predictions made on the 18th. created_at is the server's
+    local time, so a value with a UTC offset is converted to it. Raises ValueError.
+    """
+    try:
+        day = date.fromisoformat(value)
+    except ValueError:
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is not None:
+            moment = moment.astimezone().replace(tzinfo=None)
+        return moment.isoformat()
+    return datetime.combine(day, time.max if end_of_day else time.min).isoformat()
+
+
+class PredictionHistory:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            age REAL,
+            bmi REAL,
+            hba1c REAL,
+            rule TEXT NOT NULL,
+            prediction INTEGER NOT NULL,
+            risk_level TEXT NOT NULL,
+            diabetes_type TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_predictions_user_time ON predictions (user_id, created_at, id);
+    """
+
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        self._connect = ThreadLocalConnection(path, timeout=30, row_factory=sqlite3.Row)
+        self._connect().executescript(self.SCHEMA)
+
+    def append(self, user_id, age, bmi, hba1c, rule, prediction, risk_level, diabetes_type, created_at=None):
+        """Record one prediction and return its id."""
+        cur = self._connect().execute(
+            "INSERT INTO predictions (user_id, created_at, age, bmi, hba1c, rule, prediction, risk_level, diabetes_type)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (str(user_id), created_at or datetime.now().isoformat(), age, bmi, hba1c, rule, int(prediction), risk_level, diabetes_type)
+        )
+        return cur.lastrowid
+
+    def _select(self, user_id, since=None, until=None, before=None, ascending=False, limit=None):
+        clauses, params = ["user_id = ?"], [str(user_id)]
+        if since:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until:
+            clauses.append("created_at <= ?")
+            params.append(until)
+        if before:
+            clauses.append("(created_at, id) < (?, ?)")
+            params.extend(before)
+        order = "ASC" if ascending else "DESC"
+        sql = (f"SELECT {', '.join(FIELDS)} FROM predictions WHERE {' AND '.join(clauses)}"
+               f" ORDER BY created_at {order}, id {order}")
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._connect().execute(sql, params)
+
+    def query(self, user_id, limit=50, cursor=None, since=None, until=None):
+        """
+        Return one page of a user's history, newest first: (items, next_cursor).
+        next_cursor is None on the last page. since/until bound created_at (inclusive).
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        before = decode_cursor(cursor) if cursor else None
+        rows = self._select(user_id, since, until, before, limit=limit + 1).fetchall()
+        items = [dict(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(items[-1]['created_at'], items[-1]['id']) if len(rows) > limit else None
+        return items, next_cursor
+
+    def iter_user(self, user_id, since=None, until=None):
+        """Yield a user's whole history oldest first, one row at a time."""
+        for row in self._select(user_id, since, until, ascending=True):
+            yield dict(row)
@@ -0,0 +1,155 @@
+# http_cache.py
+"""
+Compressed bodies and conditional requests for /api/predict.
+
+Almost all of an /api/predict body is the pre-serialized part for its rule
+(recommendations.api_predict_fragments); only the timestamp near the end changes
+between calls. So the part before the timestamp is compressed once per rule, as
+gzip (GZIP_LEVEL, default 9) and, when the optional `brotli` package is installed,
+as brotli (BROTLI_QUALITY, default 11), and flushed to a byte boundary. A response
+is then that prefix, the timestamp and the closing bytes appended as an uncompressed
+block (a stored deflate block, or an uncompressed brotli meta-block), and the
+stream's trailer: a valid gzip or brotli body for about a microsecond of work.
+Bodies with a "population" object are compressed whole, on the fly.
+
+The encoding is negotiated from Accept-Encoding (brotli preferred, then gzip,
+q-values respected). API_COMPRESSION=false sends every body uncompressed.
+
+GET /api/predict responses carry a strong ETag derived from the rule set version,
+the (Age, BMI, HbA1c) triple and the population object, one per encoding, and
+answer If-None-Match with 304 Not Modified. The timestamp is not part of the tag,
+so a revalidated response keeps the time it was first computed.
+"""
+import hashlib
+import json
+import os
+import struct
+import zlib
+
+from recommendations import api_predict_body, api_predict_fragments
+from result_cache import cache_key
+
+API_COMPRESSION = os.getenv('API_COMPRESSION', 'true').lower() == 'true'
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 9))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 11))
+# Quality of bodies compressed per request (those with a population object)
+ONLINE_GZIP_LEVEL = 6
+ONLINE_BROTLI_QUALITY = 5
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# gzip member header: deflate, no name or mtime, maximum compression, unknown OS
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x02\xff'
+# Largest tail that fits one stored deflate block / one 4-nibble brotli meta-block
+MAX_STORED_BLOCK = 0xffff
+
+
+def supported_encodings():
+    """Content codings this process can produce, most preferred first."""
+    if not API_COMPRESSION:
+        return ()
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding):
+    """Pick 'br', 'gzip' or None (identity) for an Accept-Encoding header value."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for coding in supported_encodings():
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def _gzip_prefix(head):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, -15)
+    return GZIP_HEADER + compressor.compress(head) + compressor.flush(zlib.Z_SYNC_FLUSH), zlib.crc32(head), len(head)
+
+
+def _brotli_prefix(head):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    return compressor.process(head) + compressor.flush()
+
+
+def compressed_prefixes(ruleset):
+    """Per rule index of a rule set: {encoding: compressed body up to the timestamp}."""
+    # Fetched first: derived() doesn't nest.
+    fragments = api_predict_fragments(ruleset)
+
+    def build(rs):
+        prefixes = []
+        for head, _ in fragments:
+            entry = {'gzip': _gzip_prefix(head)}
+            if brotli is not None:
+                entry['br'] = _brotli_prefix(head)
+            prefixes.append(entry)
+        return tuple(prefixes)
+    return ruleset.derived('api_predict_compressed', build)
+
+
+def _finish_gzip(prefix, rest):
+    # Sync-flushed deflate ends on a byte boundary: append a final stored block and the trailer.
+    data, crc, size = prefix
+    return (data + b'\x01' + struct.pack('<HH', len(rest), len(rest) ^ 0xffff) + rest
+            + struct.pack('<II', zlib.crc32(rest, crc), (size + len(rest)) & 0xffffffff))
+
+
+def _finish_brotli(prefix, rest):
+    # An uncompressed meta-block (ISLAST=0, 4 nibbles of MLEN-1, ISUNCOMPRESSED=1), then an empty last one.
+    return prefix + (((len(rest) - 1) << 3) | (1 << 19)).to_bytes(3, 'little') + rest + b'\x03'
+
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(ONLINE_GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress(body) + compressor.flush()
+    return brotli.compress(body, quality=ONLINE_BROTLI_QUALITY)
+
+
+def encoded_api_predict_body(ruleset, rule_index, timestamp, population=None, encoding=None):
+    """recommendations.api_predict_body, in the given content coding (None for identity)."""
+    if encoding is None:
+        return api_predict_body(ruleset, rule_index, timestamp, population)
+    _, tail = api_predict_fragments(ruleset)[rule_index]
+    rest = timestamp.encode() + tail
+    if population is not None or not rest or len(rest) > MAX_STORED_BLOCK:
+        return compress(api_predict_body(ruleset, rule_index, timestamp, population), encoding)
+    prefix = compressed_prefixes(ruleset)[rule_index][encoding]
+    return _finish_gzip(prefix, rest) if encoding == 'gzip' else _finish_brotli(prefix, rest)
+
+
+def etag(ruleset_version, age, bmi, hba1c, population=None, encoding=None):
+    """Strong ETag of an /api/predict result, or None when the inputs can't be keyed (NaN/inf)."""
+    key = cache_key(age, bmi, hba1c)
+    if key is None:
+        return None
+    parts = [ruleset_version, key]
+    if population is not None:
+        parts.append(json.dumps(population, sort_keys=True, separators=(',', ':')))
+    digest = hashlib.sha256('|'.join(parts).encode()).hexdigest()[:24]
+    return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+
+def if_none_match(header, tag):
+    """True if an If-None-Match header value matches tag (weak comparison, as RFC 9110 specifies)."""
+    if not header or tag is None:
+        return False
+    if header.strip() == '*':
+        return True
+    return any(candidate.strip().removeprefix('W/') == tag for candidate in header.split(','))
@@ -0,0 +1,435 @@
+# jobs.py
+"""
+Background jobs for bulk screening and exports.
+
+POST /api/jobs records a job in an SQLite (WAL) queue and stores its input next to
+it under JOBS_DIR; a worker process (started by the gunicorn master, see
+gunicorn.conf.py) runs queued jobs on a pool of JOB_WORKERS processes and writes
+each result to JOBS_DIR, where
+GET /api/jobs/<id>/result serves it. The web workers only enqueue and poll, so a
+multi-minute screening never holds a request (or a gunicorn worker) open, and the
+job processes run at a lower CPU priority (JOB_NICE) than the web server.
+
+    python -m jobs worker             # run jobs until SIGTERM/SIGINT
+    python -m jobs worker --once      # run what is queued, then exit
+    python -m jobs purge              # delete jobs finished more than JOB_RETENTION_HOURS ago
+
+The queue file and JOBS_DIR must be on a filesystem shared by the web app and the
+worker (same host or container). A job is claimed with a lease that the worker
+renews while the job runs; a job whose worker died is picked up again once the
+lease expires. Failed jobs are retried up to JOB_MAX_ATTEMPTS times with an
+exponential backoff starting at JOB_RETRY_DELAY seconds, except for bad input
+(ValueError), which fails at once.
+
+Job types:
+- screening: an uploaded CSV or NDJSON file, scored like /api/predict/bulk.
+- export_history: a user's prediction history as csv, xlsx or a pdf summary.
+- export_screening: a batch (same payload as /api/predict/batch) as csv, xlsx or pdf.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlite_connections import ThreadLocalConnection
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB = os.getenv('JOBS_DB', 'jobs.db')
+JOBS_DIR = os.getenv('JOBS_DIR', 'job_files')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_DELAY = float(os.getenv('JOB_RETRY_DELAY', 5))
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', 60))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+JOB_NICE = int(os.getenv('JOB_NICE', 10))
+JOB_MAX_ACTIVE_PER_USER = int(os.getenv('JOB_MAX_ACTIVE_PER_USER', 3))
+JOB_RETENTION_HOURS = float(os.getenv('JOB_RETENTION_HOURS', 24))
+
+# Job type -> prefix of the downloaded file name
+JOB_TYPES = {
+    'screening': 'screening_results',
+    'export_history': 'prediction_history',
+    'export_screening': 'screening_results',
+}
+ACTIVE = ('queued', 'running')
+FIELDS = ('id', 'type', 'status', 'progress', 'rows', 'attempts', 'max_attempts', 'error',
+          'created_at', 'started_at', 'finished_at')
+
+# Seconds between progress writes from a running job
+PROGRESS_INTERVAL = 0.5
+PURGE_INTERVAL = 600
+
+
+def input_path(job_id, extension='input'):
+    return os.path.join(JOBS_DIR, f"{job_id}.{extension}")
+
+
+def result_format(job_type, params):
+    """(mimetype, extension) of a job's result."""
+    if job_type == 'screening':
+        return ('application/x-ndjson', 'ndjson') if params.get('input') == 'ndjson' else ('text/csv', 'csv')
+    from exports import FORMATS
+    return FORMATS[params['format']]
+
+
+def result_path(job_id, job_type, params):
+    return os.path.join(JOBS_DIR, f"{job_id}.{result_format(job_type, params)[1]}")
+
+
+class JobQueue:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            type TEXT NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress REAL,
+            rows INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            run_after REAL NOT NULL,
+            lease_until REAL,
+            worker TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, run_after);
+        CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs (user_id, status);
+    """
+
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        self._connect = ThreadLocalConnection(path, timeout=30, row_factory=sqlite3.Row)
+        self._connect().executescript(self.SCHEMA)
+
+    def submit(self, user_id, job_type, params, upload=None, columns=None):
+        """
+        Queue a job and return it. upload (a binary stream) is copied to the job's input
+        file; columns (a dict of arrays) is saved as its input instead.
+        """
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type: {job_type} (choose from {', '.join(JOB_TYPES)})")
+        job_id = uuid.uuid4().hex
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        if upload is not None:
+            with open(input_path(job_id), 'wb') as f:
+                shutil.copyfileobj(upload, f, 1024 * 1024)
+        elif columns is not None:
+            import numpy as np
+            with open(input_path(job_id, 'npz'), 'wb') as f:
+                np.savez(f, **columns)
+        self._connect().execute(
+            "INSERT INTO jobs (id, user_id, type, params, status, max_attempts, created_at, run_after)"
+            " VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, str(user_id), job_type, json.dumps(params), JOB_MAX_ATTEMPTS, datetime.now().isoformat(), time.time())
+        )
+        return self.get(job_id)
+
+    def get(self, job_id, user_id=None):
+        """A job as a dict, or None. With user_id, only that user's job."""
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or (user_id is not None and row['user_id'] != str(user_id)):
+            return None
+        return dict(row)
+
+    def active_count(self, user_id):
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND status IN ('queued', 'running')", (str(user_id),)
+        ).fetchone()[0]
+
+    def claim(self, worker):
+        """Lease the oldest runnable job to worker and return it, or None."""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs whose worker died on their last attempt
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker lost', finished_at = ?"
+                " WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts",
+                (datetime.now().isoformat(), now)
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE (status = 'queued' AND run_after <= ?) OR (status = 'running' AND lease_until < ?)"
+                " ORDER BY created_at LIMIT 1", (now, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, lease_until = ?,"
+                    " worker = ?, progress = 0, rows = 0 WHERE id = ?",
+                    (datetime.now().isoformat(), now + JOB_LEASE_SECONDS, worker, row['id'])
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(row['id']) if row is not None else None
+
+    def renew(self, job_ids, worker):
+        """Extend the leases of worker's running jobs."""
+        conn = self._connect()
+        for job_id in job_ids:
+            conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                         (time.time() + JOB_LEASE_SECONDS, job_id, worker))
+
+    def set_progress(self, job_id, rows, progress=None):
+        self._connect().execute("UPDATE jobs SET rows = ?, progress = COALESCE(?, progress) WHERE id = ?",
+                                (rows, progress, job_id))
+
+    def complete(self, job_id, rows):
+        self._connect().execute(
+            "UPDATE jobs SET status = 'succeeded', progress = 1, rows = ?, error = NULL, finished_at = ?,"
+            " lease_until = NULL WHERE id = ?", (rows, datetime.now().isoformat(), job_id)
+        )
+
+    def fail(self, job_id, error, retry=True):
+        """Record a failed attempt: requeue with backoff while attempts remain (and retry is set), else fail."""
+        job = self.get(job_id)
+        if job is None:
+            return
+        if retry and job['attempts'] < job['max_attempts']:
+            delay = JOB_RETRY_DELAY * 2 ** (job['attempts'] - 1)
+            self._connect().execute(
+                "UPDATE jobs SET status = 'queued', error = ?, run_after = ?, lease_until = NULL WHERE id = ?",
+                (error, time.time() + delay, job_id)
+            )
+        else:
+            self._connect().execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                (error, datetime.now().isoformat(), job_id)
+            )
+
+    def purge(self, older_than_hours=JOB_RETENTION_HOURS):
+        """Delete jobs (and their files) that finished more than older_than_hours ago. Returns the count."""
+        cutoff = (datetime.now() - timedelta(hours=older_than_hours)).isoformat()
+        conn = self._connect()
+        rows = conn.execute("SELECT id, type, params FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?",
+                            (cutoff,)).fetchall()
+        for row in rows:
+            for path in (input_path(row['id']), input_path(row['id'], 'npz'),
+                         result_path(row['id'], row['type'], json.loads(row['params']))):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            conn.execute("DELETE FROM jobs WHERE id = ?", (row['id'],))
+        return len(rows)
+
+
+def public_fields(job):
+    """The fields of a job that GET /api/jobs/<id> returns."""
+    return {field: job[field] for field in FIELDS}
+
+
+class Progress:
+    """Row counter of a running job that writes to the queue at most every PROGRESS_INTERVAL."""
+
+    def __init__(self, queue, job_id, total=None):
+        self.queue = queue
+        self.job_id = job_id
+        self.total = total
+        self.rows = 0
+        self._reported = time.monotonic()
+
+    def advance(self, rows, fraction=None):
+        self.rows += rows
+        now = time.monotonic()
+        if now - self._reported >= PROGRESS_INTERVAL:
+            if fraction is None and self.total:
+                fraction = self.rows / self.total
+            self.queue.set_progress(self.job_id, self.rows, fraction)
+            self._reported = now
+
+
+def _counted(rows, progress, every=1000):
+    count = 0
+    for row in rows:
+        yield row
+        count += 1
+        if count == every:
+            progress.advance(count)
+            count = 0
+    progress.advance(count)
+
+
+def _run_screening(job, params, progress):
+    import screening
+    path = input_path(job['id'])
+    size = os.path.getsize(path) or 1
+    with open(path, 'rb') as raw:
+        lines = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+        if params.get('input') == 'ndjson':
+            chunks = screening.stream_ndjson_results(lines)
+        else:
+            chunks = screening.stream_csv_results(lines)
+            # Don't count the header line as a row
+            progress.rows = -1
+        for chunk in chunks:
+            progress.advance(chunk.count('\n'), raw.tell() / size)
+            yield chunk.encode('utf-8')
+
+
+def _run_export_history(job, params, progress):
+    from exports import stream_export
+    from history import FIELDS as HISTORY_FIELDS, PredictionHistory
+    since, until = params.get('since'), params.get('until')
+    rows = (tuple(item[field] for field in HISTORY_FIELDS)
+            for item in PredictionHistory().iter_user(job['user_id'], since, until))
+    subtitle = [f"User: {params.get('username') or 'Anonymous'}"]
+    if since or until:
+        subtitle.append(f"Period: {since or 'start'} to {until or 'now'}")
+    chunks, _, _ = stream_export(params['format'], list(HISTORY_FIELDS), _counted(rows, progress),
+                                 title='Prediction History', subtitle_lines=subtitle)
+    return chunks
+
+
+def _run_export_screening(job, params, progress):
+    import numpy as np
+    import rules
+    import screening
+    from exports import stream_export
+    with np.load(input_path(job['id'], 'npz'), allow_pickle=False) as data:
+        age, bmi, hba1c = (data[field] for field in ('Age', 'BMI', 'HbA1c'))
+    progress.total = len(age)
+    ruleset = rules.current()
+    idx = ruleset.match_batch(age, bmi, hba1c)
+    result_values = screening.rule_result_values(ruleset)
+    rows = ((row, *values, *result_values[rule])
+            for row, (*values, rule) in enumerate(zip(age.tolist(), bmi.tolist(), hba1c.tolist(), idx.tolist())))
+    chunks, _, _ = stream_export(params['format'], screening.RESULT_HEADER, _counted(rows, progress),
+                                 title='Screening Results', subtitle_lines=[f"Rows screened: {len(age)}"])
+    return chunks
+
+
+RUNNERS = {
+    'screening': _run_screening,
+    'export_history': _run_export_history,
+    'export_screening': _run_export_screening,
+}
+
+_pool_queue = None
+
+
+def run_job(job_id, queue_path):
+    """Pool worker: run one claimed job into its result file. Returns the number of rows."""
+    global _pool_queue
+    if _pool_queue is None or _pool_queue.path != queue_path:
+        _pool_queue = JobQueue(queue_path)
+    job = _pool_queue.get(job_id)
+    params = json.loads(job['params'])
+    progress = Progress(_pool_queue, job_id)
+    path = result_path(job_id, job['type'], params)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as out:
+            for chunk in RUNNERS[job['type']](job, params, progress):
+                out.write(chunk)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return max(progress.rows, 0)
+
+
+def _init_pool_process():
+    # Jobs yield the CPU to the web server; Ctrl-C is handled by the supervisor.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if JOB_NICE:
+        try:
+            os.nice(JOB_NICE)
+        except OSError:
+            pass
+
+
+def work(queue, workers=JOB_WORKERS, once=False, stop=None):
+    """
+    Claim jobs and run up to workers of them at a time on a process pool, until stop
+    is set (or, with once, until nothing is runnable). Running jobs finish before it returns.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    from concurrent.futures.process import BrokenProcessPool
+    stop = stop or threading.Event()
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_process)
+    running = {}
+    purged = 0.0
+    logger.info(f"Job worker {worker} started with {workers} processes ({queue.path})")
+    try:
+        while running or not stop.is_set():
+            while len(running) < workers and not stop.is_set():
+                job = queue.claim(worker)
+                if job is None:
+                    break
+                logger.info(f"Running job {job['id']} ({job['type']}, attempt {job['attempts']})")
+                running[pool.submit(run_job, job['id'], queue.path)] = job
+            if not running:
+                if once:
+                    break
+                stop.wait(JOB_POLL_INTERVAL)
+            else:
+                done, _ = wait(running, timeout=JOB_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        queue.complete(job['id'], future.result())
+                        logger.info(f"Job {job['id']} succeeded")
+                    except BrokenProcessPool as e:
+                        broken = True
+                        queue.fail(job['id'], f"Job process died: {e}")
+                        logger.error(f"Job {job['id']} lost its process: {e}")
+                    except Exception as e:
+                        queue.fail(job['id'], str(e), retry=not isinstance(e, ValueError))
+                        logger.error(f"Job {job['id']} failed: {e}")
+                if broken:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_process)
+                queue.renew([job['id'] for job in running.values()], worker)
+            if time.monotonic() - purged >= PURGE_INTERVAL:
+                purged = time.monotonic()
+                removed = queue.purge()
+                if removed:
+                    logger.info(f"Purged {removed} finished jobs")
+    finally:
+        pool.shutdown(wait=True)
+    logger.info(f"Job worker {worker} stopped")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m jobs', description='Run or maintain the background job queue.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    worker = sub.add_parser('worker', help='run queued jobs')
+    worker.add_argument('-w', '--workers', type=int, default=JOB_WORKERS, help=f'job processes (default {JOB_WORKERS})')
+    worker.add_argument('--once', action='store_true', help='exit when no job is runnable')
+    purge = sub.add_parser('purge', help='delete finished jobs and their files')
+    purge.add_argument('--hours', type=float, default=JOB_RETENTION_HOURS, help=f'age in hours (default {JOB_RETENTION_HOURS:g})')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    queue = JobQueue()
+    if args.command == 'purge':
+        print(f"Purged {queue.purge(args.hours)} jobs")
+        return 0
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+    work(queue, args.workers, args.once, stop)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,286 @@
+# metrics.py
+"""
+Request metrics in the Prometheus text format, and an opt-in sampling profiler.
+
+Counters and histograms live in this process; with several gunicorn workers each
+worker reports its own numbers (scrape them per worker, or sum them). Collectors
+registered with REGISTRY.collector add values read at scrape time, such as the
+result cache and password hasher counters.
+
+The profiler is off unless PROFILING_ENABLED=true and PROFILE_TOKEN is set (stacks
+and timings tell a lot about the server, so they are never open to anyone). A
+request whose X-Profile header equals PROFILE_TOKEN has its thread's stack sampled
+every PROFILE_INTERVAL_MS (default 1) by a background thread; the folded stacks
+(flamegraph.pl / speedscope format) and the request's stage timings are kept in a
+ring buffer of the last PROFILE_HISTORY (default 50) profiles, which are only
+served to requests carrying the same header. Samples are taken when the profiled
+thread releases the GIL, so expect roughly one sample per sys.getswitchinterval()
+(5 ms) of pure-Python work.
+"""
+import hmac
+import itertools
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter as _StackCounter, deque
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 0.5)
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() == 'true'
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL_MS', 1)) / 1000
+PROFILE_HISTORY = int(os.getenv('PROFILE_HISTORY', 50))
+PROFILE_HEADER = 'X-Profile'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        lines += [f'{self.name}{_format_labels(dict(zip(self.labelnames, labels)))} {_format_value(value)}'
+                  for labels, value in values]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            return series[2] if series else 0
+
+    def render(self):
+        with self._lock:
+            series = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items())
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in series:
+            labels = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append(f'{self.name}_bucket{_format_labels({**labels, "le": _format_value(bound)})} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func):
+        """
+        Register func() -> [(name, type, help, [(labels_dict, value), ...]), ...],
+        called on every scrape. Usable as a decorator.
+        """
+        self._collectors.append(func)
+        return func
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for func in self._collectors:
+            for name, kind, help, samples in func():
+                lines += [f'# HELP {name} {help}', f'# TYPE {name} {kind}']
+                lines += [f'{name}{_format_labels(labels)} {_format_value(value)}' for labels, value in samples]
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+REQUEST_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Time from request start until the view returned its response.',
+    ('method', 'route', 'status'))
+STAGE_LATENCY = REGISTRY.histogram(
+    'predict_stage_duration_seconds', 'Time spent in each stage of the prediction pipeline.',
+    ('stage',), STAGE_BUCKETS)
+RULES_FIRED = REGISTRY.counter('rules_fired_total', 'Predictions by the rule that matched.', ('rule',))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def render():
+    return REGISTRY.render()
+
+
+class Profile:
+    """Samples collected for one request."""
+
+    def __init__(self, profile_id, label, thread_id):
+        self.id = profile_id
+        self.label = label
+        self.thread_id = thread_id
+        self.started_at = time.time()
+        self.seconds = None
+        self._started = time.perf_counter()
+        self.stacks = _StackCounter()
+        self.stages = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def folded(self):
+        """Folded stacks, one 'frame;frame;frame count' line per distinct stack."""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "label": self.label,
+            "started_at": self.started_at,
+            "seconds": self.seconds,
+            "samples": sum(self.stacks.values()),
+            "stages": [{"stage": stage, "seconds": seconds} for stage, seconds in self.stages],
+        }
+
+
+def _fold(frame):
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(frames))
+
+
+class SamplingProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL, history=PROFILE_HISTORY, token=PROFILE_TOKEN):
+        self.interval = interval
+        self.token = token
+        self.profiles = deque(maxlen=history)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def requested(self, header_value):
+        """Whether an X-Profile header value carries the token (to profile a request or read profiles)."""
+        if not header_value:
+            return False
+        return hmac.compare_digest(header_value.encode(), self.token.encode())
+
+    def _sample(self, profile):
+        while not profile._stop.wait(self.interval):
+            frame = sys._current_frames().get(profile.thread_id)
+            if frame is not None:
+                profile.stacks[_fold(frame)] += 1
+
+    def start(self, label):
+        """Start sampling the calling thread; returns the Profile."""
+        with self._lock:
+            profile_id = next(self._ids)
+        profile = Profile(profile_id, label, threading.get_ident())
+        profile._thread = threading.Thread(target=self._sample, args=(profile,), name='profiler', daemon=True)
+        profile._thread.start()
+        self._local.profile = profile
+        return profile
+
+    def stop(self, profile):
+        """Stop sampling and keep the profile in the ring buffer. Safe to call twice."""
+        if profile.seconds is not None:
+            return profile
+        profile._stop.set()
+        profile._thread.join()
+        profile.seconds = time.perf_counter() - profile._started
+        self._local.profile = None
+        with self._lock:
+            self.profiles.append(profile)
+        return profile
+
+    def current(self):
+        return getattr(self._local, 'profile', None)
+
+    def get(self, profile_id):
+        with self._lock:
+            return next((p for p in self.profiles if p.id == profile_id), None)
+
+    def list(self):
+        with self._lock:
+            return [p.summary() for p in reversed(self.profiles)]
+
+
+profiler = SamplingProfiler() if PROFILING_ENABLED and PROFILE_TOKEN else None
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage into STAGE_LATENCY (and into the request's profile, if any)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_LATENCY.observe(seconds, name)
+        profile = profiler.current() if profiler is not None else None
+        if profile is not None:
+            profile.stages.append((name, seconds))
@@ -0,0 +1,132 @@
+# password_hashing.py
+"""
+Bounded executor for password hashing.
+
+scrypt with the stored parameters (scrypt:32768:8:1) costs tens of milliseconds of
+CPU and 32 MB of memory per call. Hashes are computed on a small thread pool
+(hashlib releases the GIL while hashing) with a cap on how many may run or wait at
+once: past the cap a login/registration is rejected immediately with
+HasherBusyError instead of piling up, so a login storm can neither exhaust memory
+nor starve /api/predict.
+
+Configuration: PASSWORD_HASH_METHOD (Werkzeug method string, default
+scrypt:32768:8:1), PASSWORD_HASH_WORKERS (concurrent hashes, default 2),
+PASSWORD_HASH_QUEUE (extra requests allowed to wait, default 8) and
+PASSWORD_HASH_TIMEOUT (seconds a request waits for its result, default 10).
+When the method changes, stored hashes are upgraded the next time the user
+logs in (see needs_rehash).
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', 8))
+PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
+
+def canonical_method(method):
+    """
+    The method prefix Werkzeug writes into a hash made with method, with its defaults
+    filled in ('scrypt' -> 'scrypt:32768:8:1', 'pbkdf2' -> 'pbkdf2:sha256:<iterations>').
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == 'pbkdf2' and len(args) <= 2:
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Invalid hash method '{method}'")
+
+
+class HasherBusyError(Exception):
+    """Raised when the hashing pool is saturated or a hash took longer than the timeout."""
+
+
+class PasswordHasher:
+    def __init__(self, method=PASSWORD_HASH_METHOD, workers=PASSWORD_HASH_WORKERS,
+                 max_queue=PASSWORD_HASH_QUEUE, timeout=PASSWORD_HASH_TIMEOUT):
+        self.method = method
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = None
+        self._executor_pid = None
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._prefix = canonical_method(method)
+        self.queued = self.in_flight = 0
+        self.completed = self.rejected = self.timeouts = 0
+        self.total_seconds = 0.0
+
+    def _pool(self):
+        # Threads don't survive a fork, so each worker process builds its own pool.
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _task(self, func, args):
+        with self._lock:
+            self.queued -= 1
+            self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.total_seconds += time.perf_counter() - started
+            self._slots.release()
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusyError("Too many password operations in progress")
+        with self._lock:
+            self.queued += 1
+        try:
+            future = self._pool().submit(self._task, func, args)
+        except Exception:
+            with self._lock:
+                self.queued -= 1
+            self._slots.release()
+            raise
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise HasherBusyError("Password operation timed out")
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if a stored hash was made with different parameters than the configured method."""
+        return password_hash.split('$', 1)[0] != self._prefix
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "method": self.method,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "seconds_total": round(self.total_seconds, 6),
+            }
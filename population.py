@@ -0,0 +1,210 @@
+# population.py
+"""
+Where a patient sits in the reference population.
+
+The index is built from the 'prediction' reference dataset
+(docs/diabetes_prediction_dataset.csv, memory-mapped through datasets.py): rows are
+grouped into age band x gender cells, plus one all-genders cell per band, and each
+cell keeps its BMI and HbA1c values sorted along with its observed diabetes rate.
+A lookup is then four binary searches over the cell's distinct values, a few
+microseconds, instead of a scan of the dataset.
+
+The index is saved as DATASET_CACHE_DIR/population.npz and reused while the
+dataset's source hash matches; python -m population build writes it ahead of time
+(e.g. in the build step), otherwise the first lookup builds it.
+"""
+import argparse
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+import datasets
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = os.path.join(datasets.DATASET_CACHE_DIR, 'population.npz')
+INDEX_VERSION = 1
+
+# Lower edges of the age bands after the first ("0-17", "18-29", ..., "80+")
+AGE_EDGES = (18, 30, 40, 50, 60, 70, 80)
+GENDERS = ('Female', 'Male', 'Other')
+ALL = 'all'
+# Smaller gender cells fall back to the band's all-genders cell
+MIN_CELL_SIZE = 30
+
+GENDER_ALIASES = {'f': 'Female', 'female': 'Female', 'w': 'Female', 'woman': 'Female',
+                  'm': 'Male', 'male': 'Male', 'man': 'Male', 'other': 'Other'}
+
+
+def age_band_labels():
+    edges = (0,) + AGE_EDGES
+    return [f"{lo}-{hi - 1}" for lo, hi in zip(edges, edges[1:])] + [f"{AGE_EDGES[-1]}+"]
+
+
+def normalize_gender(value):
+    """Map a free-form gender to one of GENDERS, or ALL when unknown."""
+    return GENDER_ALIASES.get(str(value).strip().lower(), ALL) if value is not None else ALL
+
+
+def build_index(dataset):
+    """Compute the index arrays from a datasets.Dataset with age/gender/bmi/HbA1c_level/diabetes columns."""
+    age = np.asarray(dataset['age'], dtype=np.float64)
+    band = np.searchsorted(AGE_EDGES, age, side='right')
+    labels = dataset.categories('gender')
+    gender_codes = np.asarray(dataset['gender'])
+    cells = [(b, g) for b in range(len(AGE_EDGES) + 1) for g in GENDERS + (ALL,)]
+    bmi_parts, hba1c_parts, bmi_offsets, hba1c_offsets, rates, sizes = [], [], [0], [0], [], []
+    for b, gender in cells:
+        mask = band == b
+        if gender != ALL:
+            mask &= gender_codes == (labels.index(gender) if gender in labels else -2)
+        for column, parts, offsets in (('bmi', bmi_parts, bmi_offsets), ('HbA1c_level', hba1c_parts, hba1c_offsets)):
+            values = np.asarray(dataset[column], dtype=np.float64)[mask]
+            values = np.sort(values[~np.isnan(values)])
+            parts.append(values)
+            offsets.append(offsets[-1] + len(values))
+        outcome = np.asarray(dataset['diabetes'])[mask]
+        sizes.append(int(mask.sum()))
+        rates.append(float(outcome.mean()) if len(outcome) else np.nan)
+    return {
+        'version': np.array(INDEX_VERSION),
+        'source_sha256': np.array(dataset.schema['source']['sha256']),
+        'cells': np.array([f"{b}|{gender}" for b, gender in cells]),
+        'sizes': np.array(sizes, dtype=np.int64),
+        'rates': np.array(rates, dtype=np.float64),
+        'bmi': np.concatenate(bmi_parts),
+        'bmi_offsets': np.array(bmi_offsets, dtype=np.int64),
+        'hba1c': np.concatenate(hba1c_parts),
+        'hba1c_offsets': np.array(hba1c_offsets, dtype=np.int64),
+    }
+
+
+def _percentile(cell, x):
+    """Percentile rank of x in a cell, counting ties as half (scipy's kind='mean')."""
+    distinct, below = cell
+    if not distinct or x != x:
+        return None
+    low = below[bisect.bisect_left(distinct, x)]
+    high = below[bisect.bisect_right(distinct, x)]
+    return round(50.0 * (low + high) / below[-1], 1)
+
+
+class PopulationIndex:
+    """Sorted per-cell BMI/HbA1c values and diabetes rates; lookup() is what /api/predict calls."""
+
+    def __init__(self, arrays):
+        self.source_sha256 = str(arrays['source_sha256'])
+        self._cells = {cell: i for i, cell in enumerate(arrays['cells'].tolist())}
+        self._sizes = arrays['sizes'].tolist()
+        self._rates = arrays['rates'].tolist()
+        self._bmi = self._split(arrays['bmi'], arrays['bmi_offsets'])
+        self._hba1c = self._split(arrays['hba1c'], arrays['hba1c_offsets'])
+        self._labels = age_band_labels()
+
+    @staticmethod
+    def _split(values, offsets):
+        """
+        Per cell, its distinct values and how many values lie below each of them (plus
+        the total), as lists: bisect on a short list beats np.searchsorted per call.
+        """
+        cells = []
+        offsets = offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            distinct, counts = np.unique(values[start:end], return_counts=True)
+            cells.append((distinct.tolist(), [0] + np.cumsum(counts).tolist()))
+        return cells
+
+    def lookup(self, age, bmi, hba1c, gender=None):
+        """
+        Return {"age_band", "gender", "n", "bmi_percentile", "hba1c_percentile",
+        "diabetes_rate"} for the patient's cell, or None when the age is unusable.
+        gender is the cell actually used: ALL when unknown or when the gender cell is too small.
+        """
+        if age != age:
+            return None
+        band = bisect.bisect_right(AGE_EDGES, age)
+        gender = normalize_gender(gender)
+        i = self._cells[f"{band}|{gender}"]
+        if gender != ALL and self._sizes[i] < MIN_CELL_SIZE:
+            gender = ALL
+            i = self._cells[f"{band}|{ALL}"]
+        rate = self._rates[i]
+        return {
+            "age_band": self._labels[band],
+            "gender": gender,
+            "n": self._sizes[i],
+            "bmi_percentile": _percentile(self._bmi[i], bmi),
+            "hba1c_percentile": _percentile(self._hba1c[i], hba1c),
+            "diabetes_rate": round(rate, 4) if rate == rate else None,
+        }
+
+
+def build(path=INDEX_FILE):
+    """Build the index from the reference dataset and save it to path. Returns the index."""
+    started = time.perf_counter()
+    arrays = build_index(datasets.load('prediction'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    logger.info(f"Built population index {path} ({time.perf_counter() - started:.2f}s)")
+    return PopulationIndex(arrays)
+
+
+def load(path=INDEX_FILE):
+    """Load the saved index if it matches the current dataset, else rebuild it."""
+    dataset = datasets.load('prediction')
+    try:
+        with np.load(path, allow_pickle=False) as saved:
+            arrays = {key: saved[key] for key in saved.files}
+        if int(arrays['version']) == INDEX_VERSION and str(arrays['source_sha256']) == dataset.schema['source']['sha256']:
+            return PopulationIndex(arrays)
+    except (OSError, KeyError, ValueError):
+        pass
+    return build(path)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def current():
+    """The process-wide index, loaded (or built) on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = load()
+    return _index
+
+
+def lookup(age, bmi, hba1c, gender=None):
+    return current().lookup(age, bmi, hba1c, gender)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m population', description='Build or query the reference population index.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help=f'build {INDEX_FILE}')
+    query = sub.add_parser('lookup', help='look up one patient')
+    query.add_argument('age', type=float)
+    query.add_argument('bmi', type=float)
+    query.add_argument('hba1c', type=float)
+    query.add_argument('--gender')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if args.command == 'build':
+        build()
+    else:
+        print(lookup(args.age, args.bmi, args.hba1c, args.gender))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+# rate_limit.py
+"""
+Admission control for the prediction API.
+
+Every /api/predict, /api/predict/batch and /api/predict/bulk request first takes a
+token from its client's bucket: the client is the API key in the X-API-Key header
+(one of API_KEYS) or, without a key, the caller's IP address. A bucket holds up to
+BURST tokens and refills at RATE tokens per second; an empty bucket answers 429
+with Retry-After set to when the next token is due. An admitted request then needs
+one of API_MAX_CONCURRENT slots in this worker process; when they are all taken
+it is rejected at once with 503 instead of queueing behind the others, so the
+worker's remaining threads stay free for the pages and a flood of API calls can't
+hold interactive requests until the gunicorn timeout.
+
+Buckets live in process (RATE_LIMIT=memory, bounded to RATE_LIMIT_MAX_CLIENTS
+clients), or in an SQLite file shared by all workers on the host
+(RATE_LIMIT=sqlite, RATE_LIMIT_DB) so a client's rate holds across them;
+RATE_LIMIT=off disables the buckets. The concurrency limit is always per process,
+since it protects that process's threads. If the shared store fails the request is
+let through (and logged) rather than failing the API.
+
+Configuration: RATE_LIMIT_RATE / RATE_LIMIT_BURST (per IP, default 10/s and 20),
+API_KEYS (comma-separated), API_KEY_RATE / API_KEY_BURST (per key, default 50/s
+and 100), API_MAX_CONCURRENT (default 3, 0 for no limit).
+"""
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_connections import ThreadLocalConnection
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT = os.getenv('RATE_LIMIT', 'memory').lower()
+RATE_LIMIT_RATE = float(os.getenv('RATE_LIMIT_RATE', 10))
+RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', 20))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv('RATE_LIMIT_MAX_CLIENTS', 10000))
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', 'rate_limit.db')
+API_KEYS = frozenset(key.strip() for key in os.getenv('API_KEYS', '').split(',') if key.strip())
+API_KEY_RATE = float(os.getenv('API_KEY_RATE', 50))
+API_KEY_BURST = float(os.getenv('API_KEY_BURST', 100))
+API_MAX_CONCURRENT = int(os.getenv('API_MAX_CONCURRENT', 3))
+
+
+class AdmissionError(Exception):
+    """A request that was not admitted; status and retry_after (seconds, or None) shape the response."""
+
+    status = 503
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class InvalidAPIKeyError(AdmissionError):
+    status = 401
+
+
+class RateLimitedError(AdmissionError):
+    status = 429
+
+
+class OverloadedError(AdmissionError):
+    status = 503
+
+
+def _refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryBuckets:
+    """Token buckets in this process, least recently used clients dropped past maxsize."""
+
+    def __init__(self, maxsize=RATE_LIMIT_MAX_CLIENTS):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1.0):
+        """Take cost tokens from key's bucket. Returns 0 if taken, else the seconds until they would be."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = _refill(tokens, updated, now, rate, burst)
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            self._buckets[key] = (tokens - cost if not wait else tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                # A dropped client comes back with a full bucket.
+                self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "clients": len(self._buckets)}
+
+
+class SQLiteBuckets:
+    """Token buckets in an SQLite file shared by every worker process on the host."""
+
+    TRIM_EVERY = 1000
+
+    def __init__(self, path=RATE_LIMIT_DB):
+        self.path = path
+        self._connect = ThreadLocalConnection(path, timeout=1, synchronous='OFF')
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+            "updated REAL NOT NULL, full_at REAL NOT NULL)"
+        )
+
+    def take(self, key, rate, burst, cost=1.0):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = _refill(*row, now, rate, burst) if row is not None else burst
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            if not wait:
+                tokens -= cost
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                         (key, tokens, now, now + (burst - tokens) / rate))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._writes += 1
+            trim = self._writes % self.TRIM_EVERY == 0
+        if trim:
+            # A bucket that has refilled is the same as no bucket.
+            conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+        return wait
+
+    def stats(self):
+        clients = self._connect().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+        return {"backend": "sqlite", "clients": clients}
+
+
+class AdmissionControl:
+    def __init__(self, buckets, max_concurrent=API_MAX_CONCURRENT, api_keys=API_KEYS,
+                 rate=RATE_LIMIT_RATE, burst=RATE_LIMIT_BURST, key_rate=API_KEY_RATE, key_burst=API_KEY_BURST):
+        self.buckets = buckets
+        self.max_concurrent = max_concurrent
+        self.api_keys = api_keys
+        self.rate, self.burst = rate, burst
+        self.key_rate, self.key_burst = key_rate, key_burst
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = {"api_key": 0, "rate": 0, "concurrency": 0}
+
+    def _reject(self, reason, error):
+        with self._lock:
+            self.rejected[reason] += 1
+        raise error
+
+    def _take(self, client, rate, burst):
+        if self.buckets is None:
+            return 0.0
+        try:
+            return self.buckets.take(client, rate, burst)
+        except sqlite3.Error as e:
+            logger.warning(f"Rate limit store unavailable, admitting {client}: {e}")
+            return 0.0
+
+    def admit(self, api_key=None, address=None):
+        """
+        Admit a request from api_key (the X-API-Key header, if any) or address, or raise
+        an AdmissionError. An admitted request holds a concurrency slot until release().
+        """
+        if api_key:
+            if api_key not in self.api_keys:
+                self._reject("api_key", InvalidAPIKeyError("Invalid API key"))
+            wait = self._take(f"key:{api_key}", self.key_rate, self.key_burst)
+        else:
+            wait = self._take(f"ip:{address}", self.rate, self.burst)
+        if wait:
+            self._reject("rate", RateLimitedError("Rate limit exceeded", max(1, math.ceil(wait))))
+        with self._lock:
+            if self.max_concurrent and self.in_flight >= self.max_concurrent:
+                self.rejected["concurrency"] += 1
+                raise OverloadedError("Too many API requests in progress", 1)
+            self.in_flight += 1
+            self.admitted += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrent": self.max_concurrent,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+            }
+
+
+def get_admission_control():
+    """Build the admission control with the buckets selected by RATE_LIMIT."""
+    if RATE_LIMIT == 'off':
+        buckets = None
+    elif RATE_LIMIT == 'sqlite':
+        buckets = SQLiteBuckets(RATE_LIMIT_DB)
+    elif RATE_LIMIT == 'memory':
+        buckets = MemoryBuckets(RATE_LIMIT_MAX_CLIENTS)
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT backend: {RATE_LIMIT}")
+    return AdmissionControl(buckets)
@@ -0,0 +1,232 @@
+# recommendations.py
+"""
+Treatment recommendations and educational content shown with a prediction.
+
+Both depend only on the prediction and the diabetes type, which take a handful of
+values, so every variant is built once at import time and shared between requests
+as a read-only structure. The JSON body of /api/predict is likewise pre-serialized
+per rule (once per rule set), leaving only the timestamp to be filled in on each call.
+"""
+import json
+
+
+class FrozenDict(dict):
+    """A dict that refuses mutation, so shared precomputed content can't be altered by a caller.
+    Subclassing dict keeps it usable by Jinja and JSON serialization."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("precomputed content is read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+
+def _freeze(content):
+    return FrozenDict((key, tuple(items)) for key, items in content.items())
+
+
+def build_treatment_recommendations(prediction, diabetes_type):
+    recommendations = {
+        "immediate": [],
+        "lifestyle": [],
+        "monitoring": [],
+        "medical": [],
+        "dietary": [],
+        "exercise": []
+    }
+    if prediction == 1:
+        recommendations["immediate"].extend([
+            "Schedule an appointment with your healthcare provider immediately to confirm diagnosis and develop a treatment plan.",
+            "Begin monitoring blood glucose levels regularly as advised by your doctor.",
+            "Review current medications with your doctor to ensure they are appropriate for diabetes management."
+        ])
+        recommendations["lifestyle"].extend([
+            "Adopt a low-carbohydrate, high-fiber diet focusing on whole foods and portion control.",
+            "Engage in at least 150 minutes of moderate-intensity aerobic exercise weekly (e.g., brisk walking, cycling).",
+            "Maintain a healthy weight through balanced nutrition and regular physical activity.",
+            "Limit alcohol consumption and quit smoking entirely, as both can worsen diabetes complications.",
+            "Practice stress management techniques like meditation, yoga, or deep breathing exercises."
+        ])
+        recommendations["monitoring"].extend([
+            "Monitor blood glucose levels 2-4 times daily, or as recommended by your healthcare provider.",
+            "Track HbA1c levels every 3-6 months to assess long-term blood sugar control.",
+            "Perform regular foot examinations to check for cuts, sores, or infections.",
+            "Undergo annual eye examinations to screen for diabetic retinopathy.",
+            "Monitor blood pressure regularly and manage it within target ranges."
+        ])
+        recommendations["medical"].extend([
+            "Discuss medication therapy options (e.g., Metformin, Insulin, SGLT2 inhibitors) with your doctor.",
+            "Ensure regular HbA1c testing is performed as part of your diabetes management plan.",
+            "Undergo cardiovascular risk assessment to manage heart health.",
+            "Monitor kidney function regularly through blood and urine tests."
+        ])
+        if "Type 2" in diabetes_type:
+            recommendations["dietary"].extend([
+                "Focus on a low-carbohydrate diet (e.g., 45-50% of total daily calories from carbs).",
+                "Incorporate high fiber foods (25-30g daily) such as whole grains, fruits, and vegetables.",
+                "Prioritize lean proteins (chicken, fish, beans) and healthy fats (avocado, nuts, olive oil).",
+                "Strictly limit processed foods, sugary drinks, and added sugars.",
+                "Maintain regular meal timing to help stabilize blood glucose levels."
+            ])
+        else:
+            recommendations["dietary"].extend([
+                "Implement balanced carbohydrate counting to match insulin doses.",
+                "Ensure regular insulin timing in conjunction with meals.",
+                "Maintain consistent meal patterns to avoid blood sugar fluctuations.",
+                "Understand emergency glucose management for hypoglycemia.",
+                "Seek professional nutrition counseling for personalized meal planning."
+            ])
+        recommendations["exercise"].extend([
+            "Aim for at least 150 minutes per week of moderate-intensity aerobic exercise.",
+            "Include strength training exercises 2-3 sessions per week for all major muscle groups.",
+            "Incorporate flexibility exercises (stretching, yoga) 2-3 sessions per week.",
+            "Monitor blood glucose before and after exercise, especially if on insulin or certain medications.",
+            "Stay well-hydrated during physical activity."
+        ])
+    else:
+        recommendations["lifestyle"].extend([
+            "Maintain a healthy lifestyle with regular exercise to prevent diabetes.",
+            "Eat a balanced diet rich in whole grains, lean proteins, and plenty of fruits and vegetables.",
+            "Monitor your weight and BMI regularly to stay within a healthy range.",
+            "Get regular health check-ups, especially if you have risk factors for diabetes.",
+            "Avoid smoking and limit alcohol consumption to support overall health."
+        ])
+        recommendations["monitoring"].extend([
+            "Consider annual diabetes screening if you are over 45 years old or have other risk factors.",
+            "Regularly monitor your BMI and weight.",
+            "Have your blood pressure checked regularly.",
+            "Monitor your cholesterol levels as part of routine health checks."
+        ])
+        recommendations["dietary"].extend([
+            "Follow a balanced diet with an emphasis on whole grains over refined grains.",
+            "Consume plenty of fruits and vegetables daily.",
+            "Include lean proteins and healthy fats in your meals.",
+            "Limit processed foods, sugary drinks, and excessive saturated/trans fats.",
+            "Stay well-hydrated by drinking adequate water throughout the day."
+        ])
+        recommendations["exercise"].extend([
+            "Aim for at least 150 minutes of moderate-intensity exercise weekly.",
+            "Incorporate strength training 2-3 times weekly.",
+            "Include flexibility exercises in your routine.",
+            "Find physical activities you enjoy to make exercise sustainable.",
+            "Progress gradually in intensity and duration to avoid injury."
+        ])
+    return recommendations
+
+def build_educational_content(diabetes_type):
+    content = {
+        "general": [
+            "Diabetes is a chronic condition affecting how your body processes glucose (sugar).",
+            "Early detection and proper management can prevent or delay serious complications.",
+            "Lifestyle changes, including diet and exercise, are crucial for diabetes management and prevention.",
+            "Regular monitoring of blood sugar levels helps track progress and prevent complications."
+        ],
+        "prevention": [
+            "Maintain a healthy weight through a balanced diet and regular exercise.",
+            "Eat a balanced diet low in processed foods, sugary drinks, and unhealthy fats.",
+            "Get at least 150 minutes of moderate physical activity each week.",
+            "Monitor blood pressure and cholesterol levels regularly.",
+            "Avoid smoking and limit alcohol consumption."
+        ],
+        "management": [
+            "Work closely with your healthcare providers to develop a personalized care plan.",
+            "Monitor blood glucose levels regularly as advised by your doctor.",
+            "Take medications as prescribed and understand their purpose.",
+            "Maintain a healthy lifestyle, including diet and exercise, as a cornerstone of management.",
+            "Attend regular check-ups and screenings for diabetes complications."
+        ],
+        "specific": []
+    }
+    if "Type 1" in diabetes_type:
+        content["specific"].extend([
+            "Type 1 diabetes is an autoimmune condition where the body does not produce insulin.",
+            "Insulin therapy is essential for survival and must be administered daily.",
+            "Regular blood glucose monitoring is crucial for adjusting insulin doses.",
+            "Carbohydrate counting helps match insulin doses to food intake.",
+            "Emergency preparedness for hypoglycemia (low blood sugar) is important."
+        ])
+    elif "Type 2" in diabetes_type:
+        content["specific"].extend([
+            "Type 2 diabetes is often related to insulin resistance and insufficient insulin production, frequently linked to lifestyle factors.",
+            "Diet and exercise are powerful tools to help manage blood glucose levels.",
+            "Oral medications or injectable non-insulin medications may be prescribed.",
+            "Weight management is a key component in managing Type 2 diabetes.",
+            "Regular screening for complications (eyes, kidneys, nerves, heart) is essential."
+        ])
+
+    elif "Prediabetes" in diabetes_type:
+        content["specific"].extend([
+            "Prediabetes means your blood sugar is higher than normal but not yet diabetes.",
+            "This is a critical time for intervention; lifestyle changes can prevent Type 2 diabetes.",
+            "Focus on increasing physical activity and making healthier food choices.",
+            "Losing even a small amount of weight can make a big difference.",
+            "Regular check-ups are important to monitor your blood sugar levels."
+        ])
+    return content
+
+
+def recommendation_variant(prediction, diabetes_type):
+    """The key that fully determines build_treatment_recommendations' output."""
+    return (1, "Type 2" in diabetes_type) if prediction == 1 else (0, False)
+
+
+def education_variant(diabetes_type):
+    """The key that fully determines build_educational_content's output."""
+    for marker in ("Type 1", "Type 2", "Prediabetes"):
+        if marker in diabetes_type:
+            return marker
+    return None
+
+
+_RECOMMENDATIONS = {
+    variant: _freeze(build_treatment_recommendations(variant[0], "Type 2" if variant[1] else ""))
+    for variant in ((0, False), (1, False), (1, True))
+}
+_EDUCATION = {
+    variant: _freeze(build_educational_content(variant or ""))
+    for variant in ("Type 1", "Type 2", "Prediabetes", None)
+}
+
+
+def get_treatment_recommendations(prediction, risk_level, diabetes_type, input_data=None):
+    return _RECOMMENDATIONS[recommendation_variant(prediction, diabetes_type)]
+
+
+def get_educational_content(diabetes_type, risk_level=None):
+    return _EDUCATION[education_variant(diabetes_type)]
+
+
+_TIMESTAMP_PLACEHOLDER = '"@@timestamp@@"'
+
+
+def _api_predict_fragments(rule):
+    _, prediction, risk_level, diabetes_type, _, explanation = rule
+    # Same compact, key-sorted encoding Flask's jsonify produces.
+    body = json.dumps({
+        "prediction": prediction,
+        "risk_level": risk_level,
+        "diabetes_type": diabetes_type,
+        "recommendations": get_treatment_recommendations(prediction, risk_level, diabetes_type),
+        "explanation": [explanation],
+        "timestamp": _TIMESTAMP_PLACEHOLDER[1:-1],
+    }, sort_keys=True, separators=(',', ':'))
+    head, tail = body.split(_TIMESTAMP_PLACEHOLDER)
+    return (head + '"').encode(), ('"' + tail + "\n").encode()
+
+
+def api_predict_fragments(ruleset):
+    """Per rule index of a rule set: the encoded /api/predict body before and after the timestamp string."""
+    return ruleset.derived('api_predict_fragments', lambda rs: tuple(_api_predict_fragments(rule) for rule in rs.rules))
+
+
+def api_predict_body(ruleset, rule_index, timestamp, population=None):
+    """
+    Splice a timestamp into the pre-serialized /api/predict response for a rule, and
+    the optional "population" object in its sorted place (just before "prediction").
+    """
+    head, tail = api_predict_fragments(ruleset)[rule_index]
+    if population is not None:
+        before, after = head.split(b',"prediction":', 1)
+        head = (before + b',"population":' + json.dumps(population, sort_keys=True, separators=(',', ':')).encode()
+                + b',"prediction":' + after)
+    return head + timestamp.encode() + tail
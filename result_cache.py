@@ -0,0 +1,171 @@
+# result_cache.py
+"""
+Result cache for /api/predict.
+
+Clinical inputs repeat heavily (integer ages, HbA1c and BMI at 0.1 precision), so
+results are cached under the normalized (Age, BMI, HbA1c) triple. The in-process
+LRU is bounded in entries and expires entries after a TTL; an optional SQLite
+file shared by all gunicorn workers sits behind it so one worker's miss becomes
+every worker's hit.
+
+Configuration: PREDICT_CACHE=memory|sqlite|off (default memory), PREDICT_CACHE_SIZE
+(entries, default 10000), PREDICT_CACHE_TTL (seconds, default 3600) and
+PREDICT_CACHE_DB (default predict_cache.db) for the shared backend.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_connections import ThreadLocalConnection
+
+PREDICT_CACHE = os.getenv('PREDICT_CACHE', 'memory').lower()
+PREDICT_CACHE_SIZE = int(os.getenv('PREDICT_CACHE_SIZE', 10000))
+PREDICT_CACHE_TTL = float(os.getenv('PREDICT_CACHE_TTL', 3600))
+PREDICT_CACHE_DB = os.getenv('PREDICT_CACHE_DB', 'predict_cache.db')
+
+
+def cache_key(*values):
+    """
+    Normalize inputs into a cache key, or None if they can't be cached (NaN/inf).
+
+    Values are compared exactly after float conversion: 25, "25" and 25.0 share a
+    key, but nothing is rounded, since a rounded key could cross a rule threshold.
+    """
+    parts = []
+    for value in values:
+        value = float(value) + 0.0  # folds -0.0 into 0.0
+        if not math.isfinite(value):
+            return None
+        parts.append(repr(value))
+    return '|'.join(parts)
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with a per-entry TTL and hit/miss counters."""
+
+    def __init__(self, maxsize=PREDICT_CACHE_SIZE, ttl=PREDICT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "size": len(self._data), "maxsize": self.maxsize,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class SQLiteCache:
+    """A cache table in an SQLite file shared by every worker process. Values are integers."""
+
+    TRIM_EVERY = 1000
+
+    def __init__(self, path=PREDICT_CACHE_DB, maxsize=PREDICT_CACHE_SIZE, ttl=PREDICT_CACHE_TTL):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._connect = ThreadLocalConnection(path, timeout=5, synchronous='OFF')
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = self.misses = 0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row[0]
+
+    def set(self, key, value):
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                     (key, value, time.time() + self.ttl))
+        with self._lock:
+            self._writes += 1
+            trim = self._writes % self.TRIM_EVERY == 0
+        if trim:
+            conn.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+            conn.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                         (self.maxsize,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache")
+
+    def stats(self):
+        size = self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        with self._lock:
+            return {"backend": "sqlite", "size": size, "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class TieredCache:
+    """The local LRU in front of a shared cache; shared hits are copied into the LRU."""
+
+    def __init__(self, local, shared):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        self.shared.set(key, value)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def stats(self):
+        return {"local": self.local.stats(), "shared": self.shared.stats()}
+
+
+def get_result_cache():
+    """Build the cache selected by PREDICT_CACHE, or None if caching is off."""
+    if PREDICT_CACHE == 'off':
+        return None
+    local = LRUCache(PREDICT_CACHE_SIZE, PREDICT_CACHE_TTL)
+    if PREDICT_CACHE == 'sqlite':
+        return TieredCache(local, SQLiteCache(PREDICT_CACHE_DB, PREDICT_CACHE_SIZE, PREDICT_CACHE_TTL))
+    if PREDICT_CACHE == 'memory':
+        return local
+    raise ValueError(f"Unknown PREDICT_CACHE backend: {PREDICT_CACHE}")
@@ -0,0 +1,401 @@
+# rules.py
+"""
+Rule engine behind the diabetes risk assessment.
+
+The rules live in rules.json (RULES_FILE): an ordered list of rules, each a set of
+interval conditions on the input features (gt/ge/lt/le bounds), plus the default
+outcome used when no rule matches (e.g. HbA1c between 6.4% and 6.5%, or missing
+values). The first matching rule wins.
+
+At load time the table is compiled into a decision table. Every threshold that
+appears for a feature is a breakpoint; a value falls in one of 2k+1 bins for k
+breakpoints (below/between them, or exactly on one) or in a NaN bin, and no
+condition can change its truth value within a bin. The winning rule is evaluated
+once per combination of bins; a single record is matched by a generated decision
+tree over that table (a handful of float comparisons however many rules there are),
+and whole columns are binned with a few vectorized comparisons and matched with a
+single fancy index.
+
+Compiling is the slow part of loading, so current() saves the table and the
+generated match() to RULES_COMPILED (python -m rules build writes it ahead of
+time) and later loads of the same rules reuse it. NumPy is only imported when a
+table is compiled or a batch is matched.
+
+current() returns the compiled RuleSet and recompiles it when rules.json changes
+(checked at most every RULES_RELOAD_INTERVAL seconds), so rules can be edited
+without restarting workers. A request should take current() once and use that
+RuleSet throughout, since rule indices only mean something within one RuleSet;
+RuleSet.version identifies the rules (e.g. in cache keys).
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RULES_FILE = os.getenv('RULES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json'))
+RULES_RELOAD_INTERVAL = float(os.getenv('RULES_RELOAD_INTERVAL', 2))
+RULES_COMPILED = os.getenv('RULES_COMPILED', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.compiled.json'))
+# Bump when the compiled table or the generated match() changes shape
+COMPILER_VERSION = 1
+
+# The inputs every caller supplies, in order.
+FEATURES = ('Age', 'BMI', 'HbA1c')
+OUTCOME_FIELDS = ('prediction', 'risk_level', 'diabetes_type', 'rec_category', 'explanation')
+BOUNDS = {'gt': float.__gt__, 'ge': float.__ge__, 'lt': float.__lt__, 'le': float.__le__}
+# Up to this many breakpoints per feature, batch binning compares against each one
+# (faster than np.searchsorted for short lists); beyond it, binary search.
+COMPARE_MAX_POINTS = 16
+
+
+class RuleSet:
+    """
+    A compiled rule table.
+
+    rules holds one (id, prediction, risk_level, diabetes_type, rec_category,
+    explanation) tuple per rule in evaluation order, with the default outcome last.
+    match(age, bmi, hba1c) returns the index of the rule matching one record, and
+    match_batch() the indices for whole columns.
+    """
+
+    def __init__(self, spec, source=None, stamp=None, compiled=None):
+        self.spec = spec
+        self.source = source
+        self.stamp = stamp
+        self.version = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+        self.features = tuple(spec['features'])
+        if self.features != FEATURES:
+            raise ValueError(f"Rules must be defined over {', '.join(FEATURES)} (got {', '.join(self.features)})")
+        entries = list(spec['rules']) + [dict(spec['default'], when={})]
+        self.rules = tuple(
+            (entry['id'], int(entry['prediction']), *(entry[field] for field in OUTCOME_FIELDS[1:])) for entry in entries
+        )
+        self.default = len(self.rules) - 1
+        conditions = [self._conditions(entry) for entry in spec['rules']]
+
+        # A prebuilt artifact (see save_compiled) skips compiling the table and the decision tree.
+        self.precompiled = (compiled is not None and compiled.get('compiler') == COMPILER_VERSION
+                            and compiled.get('version') == self.version)
+        if self.precompiled:
+            self._points, self._table, self.match_source = compiled['points'], compiled['table'], compiled['match']
+        else:
+            self._compile(conditions)
+        self.match = self._exec_match()
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+
+    def _compile(self, conditions):
+        """Build the decision table (self._table, flattened) and the source of match()."""
+        import numpy as np
+
+        # Per feature: sorted breakpoints and one representative value per bin.
+        self._points = []
+        samples = []
+        for i in range(len(self.features)):
+            points = sorted({bound for rule in conditions for feature, _, bound in rule if feature == i})
+            self._points.append(points)
+            edges = [points[0] - 1.0] + points + [points[-1] + 1.0] if points else [0.0, 0.0]
+            bins = []
+            for j in range(len(points) + 1):
+                bins.append((edges[j] + edges[j + 1]) / 2)
+                if j < len(points):
+                    bins.append(points[j])
+            samples.append(bins + [math.nan])
+
+        shape = tuple(len(bins) for bins in samples)
+        table = np.full(shape, self.default, dtype=np.intp)
+        for cell in np.ndindex(*shape):
+            values = [samples[i][j] for i, j in enumerate(cell)]
+            table[cell] = next(
+                (index for index, rule in enumerate(conditions)
+                 if all(BOUNDS[op](values[feature], bound) for feature, op, bound in rule)),
+                self.default
+            )
+        self._table = table.ravel().tolist()
+        self.match_source = self._compile_match(table)
+
+    def _batch(self):
+        """The arrays match_batch() needs, built on first use so single-record matching never imports NumPy."""
+        def build(rs):
+            import numpy as np
+            shape = [len(points) * 2 + 2 for points in rs._points]
+            table = np.array(rs._table, dtype=np.intp)
+            return {
+                'table': table,
+                'strides': [int(np.prod(shape[i + 1:], dtype=np.int64)) for i in range(len(shape))],
+                'nan_bins': [size - 1 for size in shape],
+                'bin_dtype': np.int16 if table.size < 2 ** 15 else np.intp,
+                # Breakpoints padded with NaN so an index one past the end compares unequal.
+                'padded': [np.array(points + [math.nan], dtype=np.float64) for points in rs._points],
+            }
+        return self.derived('_batch', build)
+
+    def _column(self, index, dtype):
+        def build(rs):
+            import numpy as np
+            return np.array([rule[index] for rule in rs.rules], dtype=dtype)
+        return self.derived(f'_column_{index}', build)
+
+    # Per-rule outcome columns, for indexing with match_batch() results.
+    ids = property(lambda self: self._column(0, object))
+    predictions = property(lambda self: self._column(1, 'int8'))
+    risk_levels = property(lambda self: self._column(2, object))
+    diabetes_types = property(lambda self: self._column(3, object))
+    rec_categories = property(lambda self: self._column(4, object))
+    explanations = property(lambda self: self._column(5, object))
+
+    def _conditions(self, entry):
+        conditions = []
+        for feature, bounds in entry['when'].items():
+            if feature not in self.features:
+                raise ValueError(f"Rule {entry['id']}: unknown feature {feature}")
+            for op, bound in bounds.items():
+                if op not in BOUNDS:
+                    raise ValueError(f"Rule {entry['id']}: unknown bound {op} (use {', '.join(BOUNDS)})")
+                conditions.append((self.features.index(feature), op, float(bound)))
+        return conditions
+
+    def _compile_match(self, table):
+        """
+        Generate the source of match(x0, x1, ...), a Python decision tree over the
+        table: each node is a comparison with a breakpoint, neighbouring bins that lead
+        to the same outcomes are merged, and a subtree whose outcome is fixed returns it
+        directly. The feature order giving the fewest comparisons is used.
+        """
+        names = [f"x{i}" for i in range(len(self.features))]
+        orders = itertools.permutations(range(len(names))) if len(names) <= 4 else [tuple(range(len(names)))]
+        best = None
+        for order in orders:
+            lines = self._decision_tree(table.transpose(order), [names[i] for i in order],
+                                        [self._points[i] for i in order], 1)
+            comparisons = sum(' if ' in line or ' elif ' in line for line in lines)
+            if best is None or comparisons < best[0]:
+                best = (comparisons, lines)
+        return '\n'.join([f"def match({', '.join(names)}):"] + best[1])
+
+    def _exec_match(self):
+        namespace = {}
+        exec(compile(self.match_source, f"<rules {self.version}>", 'exec'), namespace)
+        return namespace['match']
+
+    def _decision_tree(self, block, names, feature_points, depth):
+        import numpy as np
+        pad = '    ' * depth
+        first = block.flat[0]
+        if (block == first).all():
+            return [f"{pad}return {int(first)}"]
+        name, points, nan_block = names[0], feature_points[0], block[-1]
+        # Runs of adjacent bins with identical subtrees; a boundary before bin 2i
+        # + 1 is "x < points[i]", before bin 2i + 2 it is "x <= points[i]".
+        runs = [[0, 0]]
+        for j in range(1, len(block) - 1):
+            if np.array_equal(block[j], block[runs[-1][0]]):
+                runs[-1][1] = j
+            else:
+                runs.append([j, j])
+
+        def split(lo, hi, depth):
+            pad = '    ' * depth
+            if lo == hi:
+                return self._decision_tree(block[runs[lo][0]], names[1:], points_rest, depth)
+            mid = (lo + hi + 1) // 2
+            boundary = runs[mid][0]
+            op = '<' if boundary % 2 else '<='
+            return ([f"{pad}if {name} {op} {points[(boundary - 1) // 2]!r}:"] + split(lo, mid - 1, depth + 1)
+                    + [f"{pad}else:"] + split(mid, hi, depth + 1))
+
+        points_rest = feature_points[1:]
+        lines = []
+        # NaN fails every comparison and so lands in the last run; test it first
+        # only when its outcomes differ.
+        if not np.array_equal(nan_block, block[runs[-1][0]]):
+            lines += [f"{pad}if {name} != {name}:"] + self._decision_tree(nan_block, names[1:], points_rest, depth + 1)
+        return lines + split(0, len(runs) - 1, depth)
+
+    def match_batch(self, *columns):
+        """
+        Vectorized match: return an int array of rule indices, one per record.
+        Inputs are array-likes of equal length; NaN falls through to the default rule.
+        """
+        import numpy as np
+        batch = self._batch()
+        bin_dtype = batch['bin_dtype']
+        flat = None
+        for column, points, padded, stride, nan_bin in zip(columns, self._points, batch['padded'], batch['strides'], batch['nan_bins']):
+            values = np.asarray(column, dtype=np.float64)
+            if len(points) <= COMPARE_MAX_POINTS:
+                # 2 * (breakpoints below) + (on a breakpoint), from 2k cheap passes.
+                bins = np.zeros(values.shape, dtype=bin_dtype)
+                for point in points:
+                    bins += values >= point
+                    bins += values > point
+            else:
+                position = np.searchsorted(padded[:-1], values, side='left')
+                bins = (2 * position + (padded[position] == values)).astype(bin_dtype)
+            bins[np.isnan(values)] = nan_bin
+            if stride != 1:
+                bins *= stride
+            flat = bins if flat is None else flat + bins
+        return batch['table'][flat]
+
+    def outcome(self, index):
+        """Return the (prediction, risk_level, diabetes_type, rec_category, [explanation]) result for an index."""
+        _, prediction, risk_level, diabetes_type, rec_category, explanation = self.rules[index]
+        return prediction, risk_level, diabetes_type, rec_category, [explanation]
+
+    def derived(self, name, build):
+        """Compute build(self) once per RuleSet, e.g. per-rule payloads serialized up front."""
+        value = self._derived.get(name)
+        if value is None:
+            with self._derived_lock:
+                value = self._derived.get(name)
+                if value is None:
+                    value = self._derived[name] = build(self)
+        return value
+
+    def __getstate__(self):
+        # Worker processes re-exec match() and rebuild derived payloads themselves.
+        state = self.__dict__.copy()
+        state['_derived'] = {}
+        del state['_derived_lock'], state['match']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._derived_lock = threading.Lock()
+        self.match = self._exec_match()
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_compiled(path):
+    """A saved compiled rule table, or None if there is none (or it is unreadable)."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_compiled(ruleset, path):
+    """Save ruleset's compiled table and match() source, for RuleSet(compiled=...)."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'compiler': COMPILER_VERSION, 'version': ruleset.version, 'points': ruleset._points,
+                   'table': ruleset._table, 'match': ruleset.match_source}, f)
+    os.replace(tmp_path, path)
+
+
+def load_rules(path=RULES_FILE, compiled_path=None):
+    """
+    Compile a rules file. Raises OSError/ValueError/KeyError on a missing or invalid file.
+    With compiled_path, a saved compilation of the same rules is reused, and a fresh
+    compilation is saved there.
+    """
+    stamp = _file_stamp(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    ruleset = RuleSet(spec, source=path, stamp=stamp, compiled=read_compiled(compiled_path) if compiled_path else None)
+    if compiled_path and not ruleset.precompiled:
+        try:
+            save_compiled(ruleset, compiled_path)
+        except OSError as e:
+            logger.warning(f"Could not save compiled rules to {compiled_path}: {e}")
+    return ruleset
+
+
+_active = None
+_checked_at = 0.0
+_rejected_stamp = None
+_reload_lock = threading.Lock()
+
+
+def current():
+    """The active RuleSet, recompiled if RULES_FILE has changed since it was loaded."""
+    global _active, _checked_at, _rejected_stamp
+    ruleset = _active
+    if ruleset is not None and time.monotonic() - _checked_at < RULES_RELOAD_INTERVAL:
+        return ruleset
+    with _reload_lock:
+        if _active is None:
+            _active = load_rules(RULES_FILE, RULES_COMPILED)
+            logger.info(f"Loaded rule set {_active.version} from {RULES_FILE}")
+        elif time.monotonic() - _checked_at >= RULES_RELOAD_INTERVAL:
+            stamp = None
+            try:
+                stamp = _file_stamp(RULES_FILE)
+                if stamp != _active.stamp and stamp != _rejected_stamp:
+                    _active = load_rules(RULES_FILE, RULES_COMPILED)
+                    logger.info(f"Reloaded rule set {_active.version} from {RULES_FILE}")
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # Report a bad edit once, not on every check.
+                _rejected_stamp = stamp
+                logger.error(f"Keeping rule set {_active.version}; could not reload {RULES_FILE}: {e}")
+        _checked_at = time.monotonic()
+        return _active
+
+
+def match_rule(age, bmi, hba1c):
+    """Return the index of the first rule matching a single record, in current().rules."""
+    return current().match(age, bmi, hba1c)
+
+
+def match_rules_batch(age, bmi, hba1c):
+    """Vectorized match_rule over current(): an int array of rule indices, one per record."""
+    return current().match_batch(age, bmi, hba1c)
+
+
+def rule_based_predict(age, bmi, hba1c):
+    ruleset = current()
+    return ruleset.outcome(ruleset.match(age, bmi, hba1c))
+
+
+def rule_based_predict_batch(age, bmi, hba1c):
+    """
+    Score many records in one pass.
+
+    Returns a dict of equal-length arrays: rule, prediction, risk_level,
+    diabetes_type, rec_category and explanation. Row i holds the same values
+    rule_based_predict would return for record i (explanation as a string
+    rather than a one-element list).
+    """
+    ruleset = current()
+    idx = ruleset.match_batch(age, bmi, hba1c)
+    return {
+        "rule": ruleset.ids[idx],
+        "prediction": ruleset.predictions[idx],
+        "risk_level": ruleset.risk_levels[idx],
+        "diabetes_type": ruleset.diabetes_types[idx],
+        "rec_category": ruleset.rec_categories[idx],
+        "explanation": ruleset.explanations[idx],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m rules', description='Compile the rules ahead of time.')
+    parser.add_argument('command', choices=('build',))
+    parser.add_argument('--rules', default=RULES_FILE, help=f'rules file (default {RULES_FILE})')
+    parser.add_argument('-o', '--output', default=RULES_COMPILED, help=f'compiled file (default {RULES_COMPILED})')
+    args = parser.parse_args(argv)
+    try:
+        ruleset = load_rules(args.rules)
+        save_compiled(ruleset, args.output)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"Compiled rule set {ruleset.version} ({len(ruleset.rules)} rules) into {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
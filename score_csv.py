@@ -0,0 +1,189 @@
+# score_csv.py
+"""
+Offline bulk scoring of large CSV files on every core.
+
+    python -m score_csv lab_records.csv -o scored.csv
+    python -m score_csv lab_records.csv -o scored.parquet --workers 8
+
+The input is split into byte ranges aligned to line boundaries; a process pool
+scores each range with the vectorized rule engine and writes it to a part file,
+and the parts are concatenated in order, so the output rows follow the input
+rows. Each output row is the original input row followed by prediction,
+risk_level, diabetes_type, rec_category, rule and explanation. Columns are
+matched like the bulk screening API (Age/age, BMI/bmi, HbA1c/HbA1c_level...).
+
+Byte-range splitting assumes no quoted field spans several lines, which holds for
+lab exports. Parquet output needs pyarrow.
+"""
+import argparse
+import csv
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import rules
+import screening
+
+CHUNK_BYTES = 32 * 1024 * 1024
+SUB_CHUNK_ROWS = 50000
+
+
+def default_workers():
+    """Cores this process may run on (respects container CPU affinity)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def split_ranges(path, data_start, workers, chunk_bytes=CHUNK_BYTES):
+    """Split [data_start, EOF) into byte ranges that start and end on line boundaries."""
+    size = os.path.getsize(path)
+    count = max(workers, -(-(size - data_start) // chunk_bytes))
+    step = max(1, (size - data_start) // count)
+    bounds = [data_start]
+    with open(path, 'rb') as f:
+        for i in range(1, count):
+            f.seek(data_start + i * step)
+            f.readline()
+            position = f.tell()
+            if position >= size:
+                break
+            if position > bounds[-1]:
+                bounds.append(position)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _score_block(ruleset, rows, indices, width):
+    """Pad/trim rows to the header width in place and return their rule indices."""
+    for i, row in enumerate(rows):
+        if len(row) != width:
+            rows[i] = (row + [''] * width)[:width]
+    age_i, bmi_i, hba1c_i = indices
+    return screening.score_columns(ruleset, [r[age_i] for r in rows], [r[bmi_i] for r in rows], [r[hba1c_i] for r in rows])
+
+
+def _iter_row_blocks(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    rows = []
+    for row in csv.reader(io.StringIO(text, newline='')):
+        if not row:
+            continue
+        rows.append(row)
+        if len(rows) >= SUB_CHUNK_ROWS:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def score_range(ruleset, path, start, end, indices, part_path, output_format, header):
+    """Worker: score one byte range of the input into a part file. Returns the row count."""
+    count = 0
+    width = len(header)
+    values = screening.rule_result_values(ruleset)
+    if output_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([(name, pa.string()) for name in header]
+                           + [('prediction', pa.int8())] + [(name, pa.string()) for name in screening.RESULT_FIELDS[1:]])
+        with pq.ParquetWriter(part_path, schema) as writer:
+            for rows in _iter_row_blocks(path, start, end):
+                matched = _score_block(ruleset, rows, indices, width)
+                columns = [[row[i] for row in rows] for i in range(width)]
+                columns += [[values[rule][j] for rule in matched] for j in range(len(screening.RESULT_FIELDS))]
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                count += len(rows)
+        return count
+    with open(part_path, 'w', encoding='utf-8', newline='') as out:
+        writer = csv.writer(out)
+        for rows in _iter_row_blocks(path, start, end):
+            matched = _score_block(ruleset, rows, indices, width)
+            writer.writerows(row + list(values[rule]) for row, rule in zip(rows, matched))
+            count += len(rows)
+    return count
+
+
+def concat_parts(parts, output, output_format, header):
+    if output_format == 'parquet':
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for part in parts:
+                part_file = pq.ParquetFile(part)
+                if writer is None:
+                    writer = pq.ParquetWriter(output, part_file.schema_arrow)
+                for batch in part_file.iter_batches():
+                    writer.write_batch(batch)
+        finally:
+            if writer is not None:
+                writer.close()
+        return
+    with open(output, 'w', encoding='utf-8', newline='') as out:
+        csv.writer(out).writerow(header + screening.RESULT_FIELDS)
+        for part in parts:
+            with open(part, 'r', encoding='utf-8', newline='') as f:
+                shutil.copyfileobj(f, out, 1024 * 1024)
+
+
+def score_file(path, output, workers=None, output_format=None, chunk_bytes=CHUNK_BYTES, progress=None):
+    """Score path into output (CSV or Parquet); returns (rows, seconds)."""
+    started = time.perf_counter()
+    workers = workers or default_workers()
+    output_format = output_format or ('parquet' if output.endswith('.parquet') else 'csv')
+    with open(path, 'rb') as f:
+        header_line = f.readline()
+        data_start = f.tell()
+    header = next(csv.reader([header_line.decode('utf-8-sig')]), None)
+    if not header:
+        raise ValueError(f"{path} is empty")
+    header = [name.strip() for name in header]
+    indices = screening.resolve_columns(header)
+    ranges = split_ranges(path, data_start, workers, chunk_bytes)
+    # Every worker scores with the same rule set, even if rules.json changes mid-run.
+    ruleset = rules.current()
+    rows = 0
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output))) as tmp:
+        parts = [os.path.join(tmp, f"part-{i:05d}.{output_format}") for i in range(len(ranges))]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(score_range, ruleset, path, start, end, indices, part, output_format, header)
+                       for (start, end), part in zip(ranges, parts)]
+            for done, future in enumerate(futures, 1):
+                rows += future.result()
+                if progress:
+                    progress(done, len(futures), rows, time.perf_counter() - started)
+        concat_parts(parts, output, output_format, header)
+    return rows, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m score_csv', description='Score a large CSV with the diabetes rule engine on every core.')
+    parser.add_argument('input', help='CSV with Age/BMI/HbA1c columns (or age/bmi/HbA1c_level)')
+    parser.add_argument('-o', '--output', required=True, help='output .csv or .parquet file')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--format', choices=('csv', 'parquet'), help='output format (default: from the output extension)')
+    parser.add_argument('--chunk-mb', type=int, default=CHUNK_BYTES // (1024 * 1024), help='target size of each byte range')
+    args = parser.parse_args(argv)
+
+    def progress(done, total, rows, elapsed):
+        print(f"\r{done}/{total} chunks, {rows} rows, {rows / elapsed:,.0f} rows/s", end='', file=sys.stderr, flush=True)
+
+    try:
+        rows, seconds = score_file(args.input, args.output, args.workers, args.format, args.chunk_mb * 1024 * 1024, progress)
+    except (ValueError, ImportError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(file=sys.stderr)
+    print(f"Scored {rows} rows in {seconds:.2f}s ({rows / seconds:,.0f} rows/s) -> {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
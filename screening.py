@@ -0,0 +1,186 @@
+# screening.py
+"""
+Streaming bulk screening of Age/BMI/HbA1c records.
+
+Input is read and scored a chunk of rows at a time with the vectorized rule engine,
+and results are yielded chunk by chunk, so memory use stays flat whatever the size
+of the upload. Column names follow the unified schema of docs/merge_diabetes_data.py
+(Age, BMI, HbA1c) and also accept the lower-case / source spellings it maps from,
+e.g. the age, bmi and HbA1c_level columns of docs/diabetes_prediction_dataset.csv.
+"""
+import csv
+import io
+import json
+import math
+
+import numpy as np
+
+import rules
+
+CHUNK_ROWS = 5000
+
+FIELDS = ('Age', 'BMI', 'HbA1c')
+COLUMN_ALIASES = {
+    'Age': ('Age', 'age'),
+    'BMI': ('BMI', 'bmi'),
+    'HbA1c': ('HbA1c', 'hba1c', 'HbA1c_level', 'A1C'),
+}
+
+RESULT_FIELDS = ['prediction', 'risk_level', 'diabetes_type', 'rec_category', 'rule', 'explanation']
+RESULT_HEADER = ['row', 'Age', 'BMI', 'HbA1c'] + RESULT_FIELDS
+
+
+# Everything after the input values depends only on the rule that fired, so the
+# tail of each output record is built once per rule of a rule set.
+def rule_result_values(ruleset):
+    """Per rule index: the RESULT_FIELDS values."""
+    return ruleset.derived('screening_values', lambda rs: [
+        (prediction, risk_level, diabetes_type, rec_category, rule_id, explanation)
+        for rule_id, prediction, risk_level, diabetes_type, rec_category, explanation in rs.rules
+    ])
+
+
+def _ndjson_rule_tails(ruleset):
+    return ruleset.derived('screening_ndjson_tails', lambda rs: [
+        json.dumps(dict(zip(RESULT_FIELDS, values)), separators=(',', ':'))[1:]
+        for values in rule_result_values(rs)
+    ])
+
+
+def resolve_columns(header):
+    """Map each of Age/BMI/HbA1c to its index in a CSV header. Raises ValueError if one is missing."""
+    positions = {name.strip(): i for i, name in enumerate(header)}
+    indices = []
+    for field in FIELDS:
+        index = next((positions[alias] for alias in COLUMN_ALIASES[field] if alias in positions), None)
+        if index is None:
+            raise ValueError(f"Missing column for {field} (accepted names: {', '.join(COLUMN_ALIASES[field])})")
+        indices.append(index)
+    return indices
+
+
+def to_float_array(values):
+    """Convert a list of raw values to float64; blanks and unparsable values become NaN."""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (ValueError, TypeError):
+        out = np.empty(len(values), dtype=np.float64)
+        for i, value in enumerate(values):
+            try:
+                out[i] = float(value)
+            except (ValueError, TypeError):
+                out[i] = np.nan
+        return out
+
+
+def score_columns(ruleset, ages, bmis, hba1cs):
+    """Return the rule index for every row of three raw-value columns."""
+    return ruleset.match_batch(to_float_array(ages), to_float_array(bmis), to_float_array(hba1cs)).tolist()
+
+
+def csv_result_rows(ruleset, start, ages, bmis, hba1cs):
+    """Yield output CSV rows (see RESULT_HEADER) for one chunk of raw input values."""
+    values = rule_result_values(ruleset)
+    for offset, (age, bmi, hba1c, rule) in enumerate(zip(ages, bmis, hba1cs, score_columns(ruleset, ages, bmis, hba1cs))):
+        yield (start + offset, age, bmi, hba1c) + values[rule]
+
+
+def _cell(row, index):
+    return row[index] if index < len(row) else ''
+
+
+def stream_csv_results(lines, chunk_rows=CHUNK_ROWS):
+    """
+    Score CSV text (any iterable of lines) and return a generator of CSV text chunks.
+
+    The header is read and validated before this returns, so a missing column is
+    reported as a ValueError rather than in the middle of a streamed response.
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        raise ValueError("Empty CSV input")
+    age_i, bmi_i, hba1c_i = resolve_columns(header)
+    # One rule set for the whole stream, even if the rules are reloaded meanwhile.
+    ruleset = rules.current()
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(RESULT_HEADER)
+        start = 0
+        ages, bmis, hba1cs = [], [], []
+        for row in reader:
+            if not row:
+                continue
+            ages.append(_cell(row, age_i))
+            bmis.append(_cell(row, bmi_i))
+            hba1cs.append(_cell(row, hba1c_i))
+            if len(ages) >= chunk_rows:
+                writer.writerows(csv_result_rows(ruleset, start, ages, bmis, hba1cs))
+                start += len(ages)
+                ages, bmis, hba1cs = [], [], []
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if ages:
+            writer.writerows(csv_result_rows(ruleset, start, ages, bmis, hba1cs))
+        yield buffer.getvalue()
+
+    return generate()
+
+
+def _json_number(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return 'null'
+    return json.dumps(value)
+
+
+def stream_ndjson_results(lines, chunk_rows=CHUNK_ROWS):
+    """
+    Score NDJSON text (one JSON object per line) and return a generator of NDJSON
+    text chunks. Lines that are not JSON objects produce an {"row", "error"} line.
+    """
+    ruleset = rules.current()
+
+    def generate():
+        row = 0
+        pending = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("expected a JSON object")
+                values = tuple(
+                    next((record[alias] for alias in COLUMN_ALIASES[field] if alias in record), None)
+                    for field in FIELDS
+                )
+            except ValueError as e:
+                values = e
+            pending.append((row, values))
+            row += 1
+            if len(pending) >= chunk_rows:
+                yield _ndjson_chunk(ruleset, pending)
+                pending = []
+        if pending:
+            yield _ndjson_chunk(ruleset, pending)
+
+    return generate()
+
+
+def _ndjson_chunk(ruleset, pending):
+    scored = [(row, values) for row, values in pending if not isinstance(values, Exception)]
+    matched = score_columns(ruleset, *zip(*(values for _, values in scored))) if scored else []
+    rule_by_row = {row: rule for (row, _), rule in zip(scored, matched)}
+    tails = _ndjson_rule_tails(ruleset)
+    out = []
+    for row, values in pending:
+        if isinstance(values, Exception):
+            out.append(json.dumps({'row': row, 'error': f"Invalid record: {values}"}, separators=(',', ':')))
+            continue
+        age, bmi, hba1c = (_json_number(value) for value in values)
+        out.append(f'{{"row":{row},"Age":{age},"BMI":{bmi},"HbA1c":{hba1c},{tails[rule_by_row[row]]}')
+    return '\n'.join(out) + '\n'
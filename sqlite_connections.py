@@ -0,0 +1,36 @@
+# sqlite_connections.py
+"""
+Per-thread, per-process SQLite connections for the stores (users, history, result
+cache, jobs, rate limits).
+
+A store calls its ThreadLocalConnection to get the current thread's connection:
+autocommit (transactions are explicit BEGIN ... COMMIT), WAL so readers don't block
+the writer, and a busy timeout for waiting on other processes' writes. A connection
+is never shared between threads, and a process forked from one that had a
+connection (gunicorn --preload, the job pool) opens its own instead of inheriting it.
+"""
+import os
+import sqlite3
+import threading
+
+
+class ThreadLocalConnection:
+    def __init__(self, path, timeout=30, synchronous='NORMAL', row_factory=None):
+        self.path = path
+        self.timeout = timeout
+        self.synchronous = synchronous
+        self.row_factory = row_factory
+        self._local = threading.local()
+
+    def __call__(self):
+        # One connection per thread and per process: connections must not cross a fork.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
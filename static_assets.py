@@ -0,0 +1,90 @@
+# static_assets.py
+"""
+Fingerprinted URLs for the files under static/.
+
+Once init_app(app) has run, url_for('static', filename='css/style.css') builds
+/static/css/style.<digest>.css, where <digest> is the first 12 hex digits of the
+file's sha256. The URL changes whenever the file does, so a fingerprinted response
+can be cached for a year (Cache-Control: public, max-age=STATIC_MAX_AGE, immutable).
+The plain name, or a stale fingerprint, still serves the current file with Flask's
+default caching. Digests are recomputed only when a file's mtime/size changes.
+"""
+import hashlib
+import os
+import re
+import threading
+
+from werkzeug.security import safe_join
+
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', 365 * 24 * 3600))
+
+FINGERPRINTED = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<ext>\.[^./]+)$')
+
+
+class StaticFingerprints:
+    def __init__(self, folder):
+        self.folder = folder
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def digest(self, filename):
+        """The file's fingerprint, or None if it isn't a file under the folder."""
+        path = safe_join(self.folder, filename)
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            stat = None
+        if stat is None or not os.path.isfile(path):
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = self._digests.get(filename)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        fingerprint = digest.hexdigest()[:12]
+        with self._lock:
+            self._digests[filename] = (stamp, fingerprint)
+        return fingerprint
+
+    def url_filename(self, filename):
+        digest = self.digest(filename)
+        if digest is None:
+            return filename
+        stem, ext = os.path.splitext(filename)
+        return f"{stem}.{digest}{ext}"
+
+    def resolve(self, filename):
+        """Map a requested name to (file to serve, whether it carried the current fingerprint)."""
+        match = FINGERPRINTED.match(filename)
+        if match:
+            original = match['stem'] + match['ext']
+            digest = self.digest(original)
+            if digest is not None:
+                return original, digest == match['digest']
+        return filename, False
+
+
+def init_app(app):
+    """Fingerprint app's static URLs and serve fingerprinted files with long-lived cache headers."""
+    fingerprints = StaticFingerprints(app.static_folder)
+
+    @app.url_defaults
+    def fingerprint_static_url(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = fingerprints.url_filename(values['filename'])
+
+    def static(filename):
+        original, current = fingerprints.resolve(filename)
+        response = app.send_static_file(original)
+        if current:
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+        return response
+
+    app.view_functions['static'] = static
+    return fingerprints
@@ -0,0 +1,64 @@
+"""
+Tests for the batch prediction API.
+
+    python -m pytest test_batch.py
+"""
+import math
+
+RESULT_FIELDS = ("prediction", "risk_level", "diabetes_type", "explanation")
+
+RECORDS = [
+    {"Age": 25, "BMI": 28.5, "HbA1c": 6.8},
+    {"Age": 45, "BMI": 32.0, "HbA1c": 7.2},
+    {"Age": 40, "BMI": 27.5, "HbA1c": 6.0},
+    {"Age": 35, "BMI": 22.0, "HbA1c": 5.2},
+    {"Age": 50, "BMI": 27.0, "HbA1c": 5.5},
+    {"Age": 50, "BMI": 31.0, "HbA1c": 6.45},
+    # Rule boundaries
+    {"Age": 30, "BMI": 25.0, "HbA1c": 6.5},
+    {"Age": 29.9, "BMI": 30.0, "HbA1c": 6.51},
+    {"Age": 30, "BMI": 24.9, "HbA1c": 5.7},
+    {"Age": 30, "BMI": 25.0, "HbA1c": 6.4},
+    # Invalid or incomplete rows: missing fields count as 0, numeric strings as numbers
+    {"Age": 45},
+    {"HbA1c": 7.0},
+    {"Age": "45", "BMI": "32", "HbA1c": "7.2"},
+    {"Age": -5, "BMI": 0, "HbA1c": -1},
+    {"Age": 45, "BMI": math.nan, "HbA1c": 7.2},
+    {"Age": 45, "BMI": 32.0, "HbA1c": math.inf},
+    {"Age": math.nan, "BMI": math.nan, "HbA1c": math.nan},
+]
+
+
+def single_results(client, records):
+    results = []
+    for record in records:
+        response = client.post('/api/predict', json=record)
+        assert response.status_code == 200, record
+        body = response.get_json()
+        results.append({field: body[field] for field in RESULT_FIELDS})
+    return results
+
+
+def test_batch_matches_single_predictions(client):
+    response = client.post('/api/predict/batch', json=RECORDS)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['count'] == len(RECORDS)
+    assert body['results'] == single_results(client, RECORDS)
+
+
+def test_columnar_batch_matches_single_predictions(client):
+    columns = {field: [record.get(field, 0) for record in RECORDS] for field in ("Age", "BMI", "HbA1c")}
+    results = client.post('/api/predict/batch', json=columns).get_json()['results']
+    expected = single_results(client, RECORDS)
+    assert results == {field: [result[field] for result in expected] for field in RESULT_FIELDS}
+
+
+def test_batch_rejects_malformed_payloads(client):
+    assert client.post('/api/predict/batch', json=[{"Age": "old", "BMI": 30, "HbA1c": 6}]).status_code == 400
+    assert client.post('/api/predict/batch', json=[{"Age": 45}, 3]).status_code == 400
+    assert client.post('/api/predict/batch', json={"Age": [45], "BMI": [30]}).status_code == 400
+    assert client.post('/api/predict/batch', json={"Age": [45], "BMI": [30, 31], "HbA1c": [6]}).status_code == 400
+    assert client.post('/api/predict/batch', data='not json', content_type='application/json').status_code == 400
+    assert client.post('/api/predict/batch', json=[]).get_json()['count'] == 0
@@ -0,0 +1,55 @@
+"""
+Tests for the streaming export writers.
+
+    python -m pytest test_exports.py
+"""
+import io
+import math
+
+import pytest
+
+from exports import xlsx_stream
+
+
+def sheet_values(data):
+    openpyxl = pytest.importorskip('openpyxl')
+    sheet = openpyxl.load_workbook(io.BytesIO(data)).active
+    return [[cell.value for cell in row] for row in sheet.iter_rows()]
+
+
+def test_xlsx_writes_non_finite_numbers_as_empty_cells():
+    data = b''.join(xlsx_stream(['a', 'b', 'c'], [[1, math.nan, 'x'], [math.inf, -math.inf, 2.5]]))
+    assert sheet_values(data) == [['a', 'b', 'c'], [1, None, 'x'], [None, None, 2.5]]
+
+
+def test_screening_xlsx_export_with_missing_fields(client):
+    records = [{"Age": 45, "BMI": None, "HbA1c": 7.2}, {"Age": 30, "BMI": 22.0, "HbA1c": 5.1}]
+    response = client.post('/export/screening?format=xlsx', json=records)
+    assert response.status_code == 200
+    header, missing, complete = sheet_values(response.data)
+    assert missing[header.index('BMI')] is None
+    assert complete[header.index('BMI')] == 22.0
+
+
+def test_report_export(client):
+    data = {"Age": 45, "BMI": 32.0, "HbA1c": 7.2, "prediction": 1, "risk_level": "High Risk",
+            "diabetes_type": "Type 2 Diabetes", "recommendations": {"lifestyle": ["Exercise"], "dietary": []}}
+    response = client.post('/export-report', json=data)
+    assert response.status_code == 200
+    assert 'attachment' in response.headers['Content-Disposition']
+    text = response.get_data(as_text=True)
+    assert 'Lifestyle' in text and ',Exercise' in text and 'Dietary' not in text
+    without = {key: value for key, value in data.items() if key != 'recommendations'}
+    assert client.post('/export-report', json=without).status_code == 200
+
+
+@pytest.mark.parametrize('payload', [
+    [1, 2],
+    {"Age": 45, "recommendations": None},
+    {"Age": 45, "recommendations": ["Exercise"]},
+    {"Age": 45, "recommendations": {"lifestyle": 5}},
+])
+def test_report_export_rejects_malformed_data_before_streaming(client, payload):
+    response = client.post('/export-report', json=payload)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,84 @@
+"""
+Tests for the prediction history log and its API.
+
+    python -m pytest test_history.py
+"""
+import time
+
+import pytest
+
+from history import PredictionHistory, normalize_timestamp
+
+RULE = ('R2', 1, 'High Risk', 'Type 2 Diabetes')
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = PredictionHistory(str(tmp_path / 'history.db'))
+    for day in (17, 18, 19):
+        for hour in (0, 12, 23):
+            history.append('u1', 45, 32.0, 7.2, RULE[0], *RULE[1:], created_at=f"2026-10-{day}T{hour:02d}:30:00")
+    history.append('u2', 45, 32.0, 7.2, RULE[0], *RULE[1:], created_at="2026-10-18T12:00:00")
+    return history
+
+
+def test_normalize_timestamp():
+    assert normalize_timestamp('2026-10-18') == '2026-10-18T00:00:00'
+    assert normalize_timestamp('2026-10-18', end_of_day=True) == '2026-10-18T23:59:59.999999'
+    assert normalize_timestamp('2026-10-18T12:00', end_of_day=True) == '2026-10-18T12:00:00'
+    with pytest.raises(ValueError):
+        normalize_timestamp('yesterday')
+
+
+@pytest.fixture
+def utc_server(monkeypatch):
+    """Run the test with the server's local time zone set to UTC."""
+    monkeypatch.setenv('TZ', 'UTC')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_normalize_timestamp_converts_offsets_to_local_time(utc_server):
+    assert normalize_timestamp('2026-10-18T00:00:00+02:00') == '2026-10-17T22:00:00'
+    assert normalize_timestamp('2026-10-18T12:30:00Z', end_of_day=True) == '2026-10-18T12:30:00'
+    assert normalize_timestamp('2026-10-18T12:30:00-05:30') == '2026-10-18T18:00:00'
+
+
+def test_an_offset_bound_selects_by_local_time(history, utc_server):
+    items, _ = history.query('u1', since=normalize_timestamp('2026-10-19T00:00:00+12:00'),
+                             until=normalize_timestamp('2026-10-19T00:00:00+01:00'))
+    # 12:00 to 23:00 UTC: compared as strings without the conversion, 18T23:30 would be included
+    assert [item['created_at'] for item in items] == ['2026-10-18T12:30:00']
+
+
+def test_until_a_date_includes_that_day(history):
+    items, _ = history.query('u1', until=normalize_timestamp('2026-10-18', end_of_day=True))
+    assert sorted(item['created_at'] for item in items) == [
+        f"2026-10-{day}T{hour:02d}:30:00" for day in (17, 18) for hour in (0, 12, 23)]
+
+
+def test_since_and_until_select_one_day(history):
+    items, _ = history.query('u1', since=normalize_timestamp('2026-10-18'),
+                             until=normalize_timestamp('2026-10-18', end_of_day=True))
+    assert [item['created_at'] for item in items] == [f"2026-10-18T{hour:02d}:30:00" for hour in (23, 12, 0)]
+
+
+def test_cursor_pages_walk_the_whole_history_newest_first(history):
+    seen, cursor = [], None
+    while True:
+        items, cursor = history.query('u1', limit=4, cursor=cursor)
+        seen.extend(item['created_at'] for item in items)
+        if cursor is None:
+            break
+    assert len(seen) == 9
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_history_api_filters_by_date(client):
+    for age in (30, 40):
+        assert client.post('/api/predict', json={"Age": age, "BMI": 25.0, "HbA1c": 5.5}).status_code == 200
+    today = client.get('/api/history').get_json()['items'][0]['created_at'][:10]
+    assert len(client.get(f'/api/history?until={today}').get_json()['items']) >= 2
+    assert client.get('/api/history?until=not-a-date').status_code == 400
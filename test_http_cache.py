@@ -0,0 +1,107 @@
+"""
+Tests for compressed /api/predict bodies and conditional requests.
+
+    python -m pytest test_http_cache.py
+"""
+import asyncio
+import gzip
+import json
+
+import pytest
+
+import http_cache
+import rules
+
+TIMESTAMP = '2026-10-18T12:00:00.123456'
+QUERY = 'Age=45&BMI=32.0&HbA1c=7.2'
+# brotli is optional: without it the API only serves gzip
+DECODERS = {'gzip': gzip.decompress}
+if http_cache.brotli is not None:
+    DECODERS['br'] = http_cache.brotli.decompress
+BEST = 'br' if 'br' in DECODERS else 'gzip'
+
+
+def test_negotiate():
+    assert http_cache.negotiate(None) is None
+    assert http_cache.negotiate('gzip, deflate, br') == BEST
+    assert http_cache.negotiate('gzip;q=1.0, br;q=0.5') == 'gzip'
+    assert http_cache.negotiate('br;q=0, gzip;q=0') is None
+    assert http_cache.negotiate('*') == BEST
+    assert http_cache.negotiate('identity') is None
+
+
+@pytest.mark.parametrize('encoding', sorted(DECODERS))
+@pytest.mark.parametrize('population', [None, {"percentiles": {"BMI": 71.5, "HbA1c": 88.0}, "cohort_size": 1200}])
+def test_encoded_bodies_decode_to_the_plain_body(encoding, population):
+    ruleset = rules.current()
+    for rule_index in range(len(ruleset.rules)):
+        plain = http_cache.encoded_api_predict_body(ruleset, rule_index, TIMESTAMP, population)
+        encoded = http_cache.encoded_api_predict_body(ruleset, rule_index, TIMESTAMP, population, encoding)
+        assert DECODERS[encoding](encoded) == plain
+        body = json.loads(plain)
+        assert body['timestamp'] == TIMESTAMP
+        assert body['diabetes_type'] == ruleset.rules[rule_index][3]
+
+
+def test_etag_depends_on_rules_inputs_and_encoding():
+    tag = http_cache.etag('v1', 45, 32.0, 7.2)
+    assert tag == http_cache.etag('v1', '45', 32, '7.2')
+    assert len({tag, http_cache.etag('v2', 45, 32.0, 7.2), http_cache.etag('v1', 46, 32.0, 7.2),
+                http_cache.etag('v1', 45, 32.0, 7.2, encoding='gzip'),
+                http_cache.etag('v1', 45, 32.0, 7.2, {"cohort_size": 1})}) == 5
+    assert http_cache.etag('v1', float('nan'), 32.0, 7.2) is None
+    assert http_cache.if_none_match(f'"other", W/{tag}', tag)
+    assert http_cache.if_none_match('*', tag)
+    assert not http_cache.if_none_match('"other"', tag)
+
+
+def without_timestamp(body):
+    return {key: value for key, value in json.loads(body).items() if key != 'timestamp'}
+
+
+@pytest.mark.parametrize('encoding', sorted(DECODERS))
+def test_api_serves_compressed_json_and_304(client, encoding):
+    plain = client.get(f'/api/predict?{QUERY}')
+    response = client.get(f'/api/predict?{QUERY}', headers={'Accept-Encoding': encoding})
+    assert response.headers['Content-Encoding'] == encoding
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert without_timestamp(DECODERS[encoding](response.get_data())) == without_timestamp(plain.get_data())
+
+    tag = response.headers['ETag']
+    assert tag != plain.headers['ETag']
+    revalidated = client.get(f'/api/predict?{QUERY}', headers={'Accept-Encoding': encoding, 'If-None-Match': tag})
+    assert revalidated.status_code == 304
+    assert revalidated.get_data() == b''
+    assert revalidated.headers['ETag'] == tag
+    # A tag for another encoding doesn't validate this one
+    assert client.get(f'/api/predict?{QUERY}', headers={'If-None-Match': tag}).status_code == 200
+    assert 'ETag' not in client.post('/api/predict', json={"Age": 45, "BMI": 32.0, "HbA1c": 7.2}).headers
+
+
+def asgi_get(path, query, headers=()):
+    """Run one GET through the ASGI app; returns (status, headers dict, body)."""
+    import asgi
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(), 'client': ('127.0.0.1', 1),
+             'headers': [(name.lower().encode(), value.encode()) for name, value in headers]}
+    asyncio.run(asgi.app(scope, receive, send))
+    start = messages[0]
+    return (start['status'], {name.decode(): value.decode() for name, value in start['headers']},
+            b''.join(message.get('body', b'') for message in messages[1:]))
+
+
+def test_asgi_api_matches_the_flask_api(client):
+    flask_response = client.get(f'/api/predict?{QUERY}', headers={'Accept-Encoding': 'gzip'})
+    status, headers, body = asgi_get('/api/predict', QUERY, [('Accept-Encoding', 'gzip')])
+    assert status == 200
+    assert headers['etag'] == flask_response.headers['ETag']
+    assert without_timestamp(gzip.decompress(body)) == without_timestamp(gzip.decompress(flask_response.get_data()))
+    status, _, body = asgi_get('/api/predict', QUERY, [('Accept-Encoding', 'gzip'), ('If-None-Match', headers['etag'])])
+    assert (status, body) == (304, b'')
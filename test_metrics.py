@@ -0,0 +1,41 @@
+"""
+Tests for the metrics endpoints and the request profiler.
+
+    python -m pytest test_metrics.py
+"""
+import pytest
+
+import metrics
+
+TOKEN = 'profile-secret'
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    profiler = metrics.SamplingProfiler(token=TOKEN)
+    monkeypatch.setattr(metrics, 'profiler', profiler)
+    return profiler
+
+
+def test_profiles_are_not_found_when_profiling_is_off(client, monkeypatch):
+    monkeypatch.setattr(metrics, 'profiler', None)
+    response = client.get('/metrics/profiles', headers={metrics.PROFILE_HEADER: TOKEN})
+    assert response.status_code == 404
+
+
+def test_profiling_needs_the_token(client, profiler):
+    for value in ('1', 'true', TOKEN + 'x'):
+        response = client.get('/health', headers={metrics.PROFILE_HEADER: value})
+        assert 'X-Profile-Id' not in response.headers
+    assert client.get('/metrics/profiles').status_code == 404
+    assert client.get('/metrics/profiles', headers={metrics.PROFILE_HEADER: '1'}).status_code == 404
+    assert profiler.list() == []
+
+
+def test_profiles_are_served_with_the_token(client, profiler):
+    response = client.get('/health', headers={metrics.PROFILE_HEADER: TOKEN})
+    profile_id = response.headers['X-Profile-Id']
+    assert client.get(f'/metrics/profiles/{profile_id}').status_code == 404
+    listed = client.get('/metrics/profiles', headers={metrics.PROFILE_HEADER: TOKEN}).get_json()['profiles']
+    assert [profile['id'] for profile in listed] == [int(profile_id)]
+    assert client.get(f'/metrics/profiles/{profile_id}', headers={metrics.PROFILE_HEADER: TOKEN}).status_code == 200
@@ -0,0 +1,82 @@
+"""
+Tests for the prediction API's admission control.
+
+    python -m pytest test_rate_limit.py
+"""
+import pytest
+
+from rate_limit import (AdmissionControl, InvalidAPIKeyError, MemoryBuckets, OverloadedError, RateLimitedError,
+                        SQLiteBuckets)
+
+PAYLOAD = {"Age": 45, "BMI": 32.0, "HbA1c": 7.2}
+
+
+@pytest.mark.parametrize('make_buckets', [lambda tmp_path: MemoryBuckets(),
+                                          lambda tmp_path: SQLiteBuckets(str(tmp_path / 'rate_limit.db'))])
+def test_bucket_allows_a_burst_then_waits(tmp_path, make_buckets):
+    buckets = make_buckets(tmp_path)
+    assert [buckets.take('ip:1', rate=0.5, burst=2) for _ in range(2)] == [0.0, 0.0]
+    assert buckets.take('ip:1', rate=0.5, burst=2) == pytest.approx(2.0, abs=0.1)
+    assert buckets.take('ip:2', rate=0.5, burst=2) == 0.0
+
+
+def test_admission_rejects_past_the_rate():
+    control = AdmissionControl(MemoryBuckets(), max_concurrent=0, rate=0.5, burst=1)
+    control.admit(address='10.0.0.1')
+    with pytest.raises(RateLimitedError) as error:
+        control.admit(address='10.0.0.1')
+    assert (error.value.status, error.value.retry_after) == (429, 2)
+    control.admit(address='10.0.0.2')
+    assert control.metrics()['rejected']['rate'] == 1
+
+
+def test_admission_checks_api_keys():
+    control = AdmissionControl(MemoryBuckets(), max_concurrent=0, api_keys={'good'}, rate=0.5, burst=1)
+    with pytest.raises(InvalidAPIKeyError):
+        control.admit(api_key='bad')
+    for _ in range(5):
+        control.admit(api_key='good', address='10.0.0.1')
+    control.admit(address='10.0.0.1')
+
+
+def test_admission_caps_concurrent_requests():
+    control = AdmissionControl(None, max_concurrent=2)
+    control.admit(address='10.0.0.1')
+    control.admit(address='10.0.0.1')
+    with pytest.raises(OverloadedError) as error:
+        control.admit(address='10.0.0.1')
+    assert (error.value.status, error.value.retry_after) == (503, 1)
+    control.release()
+    control.admit(address='10.0.0.1')
+    assert control.metrics()['in_flight'] == 2
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    import app as webapp
+
+    def install(control):
+        monkeypatch.setattr(webapp, 'admission_control', control)
+        return control
+    return install
+
+
+def test_api_answers_429_with_retry_after(client, admission):
+    admission(AdmissionControl(MemoryBuckets(), max_concurrent=0, rate=0.5, burst=1))
+    assert client.post('/api/predict', json=PAYLOAD).status_code == 200
+    response = client.post('/api/predict', json=PAYLOAD)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+    # Pages aren't rate limited
+    assert client.get('/health').status_code == 200
+
+
+def test_api_answers_503_at_the_concurrency_cap(client, admission):
+    control = admission(AdmissionControl(None, max_concurrent=1))
+    control.admit(address='10.0.0.9')  # a request still in progress
+    response = client.post('/api/predict', json=PAYLOAD)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    control.release()
+    assert client.post('/api/predict', json=PAYLOAD).status_code == 200
+    assert control.metrics()['in_flight'] == 0
@@ -0,0 +1,67 @@
+"""
+Tests for the /api/predict result cache.
+
+    python -m pytest test_result_cache.py
+"""
+import copy
+import math
+
+import pytest
+
+import rules
+from result_cache import LRUCache, cache_key
+
+PATIENT = (45, 32.0, 7.2)
+
+
+def test_cache_key_normalizes_exactly():
+    assert cache_key(25, '32.5', 7) == cache_key(25.0, 32.5, '7.0')
+    assert cache_key(-0.0, 1, 1) == cache_key(0, 1, 1)
+    assert cache_key(25, 32.5, 7) != cache_key(25, 32.51, 7)
+    assert cache_key(25, math.nan, 7) is None
+    assert cache_key(25, 'inf', 7) is None
+
+
+def test_lru_cache_evicts_the_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    import app as webapp
+    cache = LRUCache()
+    monkeypatch.setattr(webapp, 'predict_cache', cache)
+    return cache
+
+
+def test_lookup_keys_include_the_ruleset_version(cache, monkeypatch):
+    import app as webapp
+    ruleset = rules.current()
+    assert webapp.lookup_rule(*PATIENT)[1:] == (ruleset.match(*PATIENT), 'MISS')
+    assert webapp.lookup_rule(*PATIENT)[2] == 'HIT'
+
+    # Edit the rule this patient matches so it no longer applies: a new version, and a new result
+    spec = copy.deepcopy(ruleset.spec)
+    matched = ruleset.rules[ruleset.match(*PATIENT)][0]
+    rule = next(rule for rule in spec['rules'] if rule['id'] == matched)
+    rule['when']['HbA1c'] = {'gt': 20}
+    edited = rules.RuleSet(spec)
+    assert edited.version != ruleset.version
+    monkeypatch.setattr(rules, 'current', lambda: edited)
+    returned, rule_index, status = webapp.lookup_rule(*PATIENT)
+    assert status == 'MISS'
+    assert returned is edited
+    assert edited.rules[rule_index][0] != matched
+    assert rule_index == edited.match(*PATIENT)
+
+
+def test_api_reports_cache_status(client, cache):
+    statuses = [client.post('/api/predict', json={"Age": 52, "BMI": 27.5, "HbA1c": 6.1}).headers['X-Cache']
+                for _ in range(2)]
+    assert statuses == ['MISS', 'HIT']
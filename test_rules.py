@@ -0,0 +1,111 @@
+"""
+Tests for the compiled rule engine, against the if/elif chain it replaced.
+
+    python -m pytest test_rules.py
+"""
+import itertools
+import json
+import math
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import rules
+
+THRESHOLDS = {'Age': [30], 'BMI': [25, 30], 'HbA1c': [5.7, 6.4, 6.5]}
+SPECIAL = [math.nan, math.inf, -math.inf, 0.0, -1.0, 1000.0]
+
+
+def chain_predict(age, bmi, hba1c):
+    """The hard-coded rules app.py used before rules.json."""
+    if hba1c > 6.5 and age < 30:
+        return 1, "High Risk", "Type 1 Diabetes", "Medical, Monitoring", ["Rule R1: Age < 30 and HbA1c > 6.5% suggests Type 1 Diabetes."]
+    elif hba1c > 6.5 and age >= 30:
+        return 1, "High Risk", "Type 2 Diabetes", "Medical, Lifestyle, Dietary", ["Rule R2: Age >= 30 and HbA1c > 6.5% suggests Type 2 Diabetes."]
+    elif 5.7 <= hba1c <= 6.4:
+        return 0, "Moderate Risk", "Prediabetes", "Lifestyle, Dietary, Medical", ["Rule R3: HbA1c between 5.7% and 6.4% indicates Prediabetes."]
+    elif hba1c < 5.7 and 25 <= bmi < 30:
+        return 0, "Moderate Risk", "No Diabetes", "Lifestyle, Dietary", ["Rule R4: BMI 25-29.9 and HbA1c < 5.7% indicates Moderate Risk (Overweight)."]
+    elif hba1c < 5.7 and bmi >= 30:
+        return 0, "Moderate Risk", "No Diabetes", "Lifestyle, Dietary", ["Rule R5: BMI >= 30 and HbA1c < 5.7% indicates Moderate Risk (Obese)."]
+    elif hba1c < 5.7 and bmi < 25:
+        return 0, "Low Risk", "No Diabetes", "Lifestyle, Dietary", ["Rule R6: BMI < 25 and HbA1c < 5.7% indicates Low Risk."]
+    return 0, "Low Risk", "No Diabetes", "Lifestyle, Dietary", ["Input does not match any specific rule. Defaulting to low risk."]
+
+
+def boundary_values(points):
+    """Every threshold, its float neighbours, points between and around them, and the special values."""
+    values = set(SPECIAL)
+    for point in points:
+        values.update((point, math.nextafter(point, -math.inf), math.nextafter(point, math.inf), point - 0.05, point + 0.05))
+    return sorted(values, key=lambda value: (math.isnan(value), value))
+
+
+GRID = list(itertools.product(*(boundary_values(THRESHOLDS[feature]) for feature in rules.FEATURES)))
+
+
+@pytest.fixture(scope='module')
+def ruleset():
+    return rules.load_rules(rules.RULES_FILE)
+
+
+def test_match_agrees_with_the_chain(ruleset):
+    mismatches = [record for record in GRID if ruleset.outcome(ruleset.match(*record)) != chain_predict(*record)]
+    assert mismatches == []
+
+
+def test_match_batch_agrees_with_match(ruleset):
+    columns = [np.array(column) for column in zip(*GRID)]
+    assert ruleset.match_batch(*columns).tolist() == [ruleset.match(*record) for record in GRID]
+
+
+def test_saved_compilation_is_reused(ruleset, tmp_path):
+    path = str(tmp_path / 'rules.compiled.json')
+    rules.save_compiled(ruleset, path)
+    loaded = rules.RuleSet(ruleset.spec, compiled=rules.read_compiled(path))
+    assert loaded.precompiled
+    assert [loaded.match(*record) for record in GRID] == [ruleset.match(*record) for record in GRID]
+    # A compilation of other rules is ignored
+    spec = dict(ruleset.spec, default=dict(ruleset.spec['default'], explanation='Edited.'))
+    assert not rules.RuleSet(spec, compiled=rules.read_compiled(path)).precompiled
+
+
+@pytest.fixture
+def rules_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'rules.json')
+    shutil.copy(rules.RULES_FILE, path)
+    monkeypatch.setattr(rules, 'RULES_FILE', path)
+    monkeypatch.setattr(rules, 'RULES_COMPILED', str(tmp_path / 'rules.compiled.json'))
+    monkeypatch.setattr(rules, 'RULES_RELOAD_INTERVAL', 0)
+    monkeypatch.setattr(rules, '_active', None)
+    monkeypatch.setattr(rules, '_rejected_stamp', None)
+    return path
+
+
+def edit(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    # A new mtime even on file systems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_reload_keeps_the_previous_rules_on_an_invalid_edit(rules_file):
+    original = rules.current()
+    with open(rules_file, encoding='utf-8') as f:
+        spec = json.load(f)
+
+    edit(rules_file, '{"features": ["Age", "BMI", "HbA1c"], "rules": [')
+    assert rules.current() is original
+    spec_without_default = {key: value for key, value in spec.items() if key != 'default'}
+    edit(rules_file, json.dumps(spec_without_default))
+    assert rules.current() is original
+
+    spec['rules'][0]['when']['HbA1c'] = {'gt': 7.0}
+    edit(rules_file, json.dumps(spec))
+    reloaded = rules.current()
+    assert reloaded.version != original.version
+    assert reloaded.rules[reloaded.match(25, 22.0, 6.8)][0] != 'R1'
+    assert original.rules[original.match(25, 22.0, 6.8)][0] == 'R1'
@@ -0,0 +1,96 @@
+"""
+Tests for the user stores and password hash upgrades on login.
+
+    python -m pytest test_user_store.py
+"""
+import json
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import password_hashing
+from password_hashing import PasswordHasher, canonical_method
+from user_store import JSONUserStore, SQLiteUserStore, UserExistsError, UserStore
+
+# Cheap parameters, so the tests don't spend a real scrypt per hash
+OLD_METHOD, NEW_METHOD = 'pbkdf2:sha256:1000', 'scrypt:1024:8:1'
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'json':
+        return JSONUserStore(str(tmp_path / 'users.json'))
+    return SQLiteUserStore(str(tmp_path / 'users.db'), import_from=str(tmp_path / 'missing.json'))
+
+
+def test_create_get_and_update(store):
+    first = store.create('alice', 'hash-a', 'alice@example.com')
+    second = store.create('bob', 'hash-b', 'bob@example.com')
+    assert int(second['user_id']) > int(first['user_id'])
+    with pytest.raises(UserExistsError):
+        store.create('alice', 'other', 'other@example.com')
+    store.update_password_hash('alice', 'hash-a2')
+    assert store.get('alice')['password_hash'] == 'hash-a2'
+    assert store.get('alice')['user_id'] == first['user_id']
+    assert store.get('carol') is None
+
+
+def test_sqlite_store_imports_users_json_once(tmp_path):
+    users_json = tmp_path / 'users.json'
+    users_json.write_text(json.dumps({
+        'alice': {'user_id': '7', 'password_hash': 'hash-a', 'email': 'a@example.com', 'created_at': '2026-01-01T00:00:00'},
+        'bob': {'user_id': 'x', 'password_hash': 'hash-b', 'email': 'b@example.com'},
+    }))
+    path = str(tmp_path / 'users.db')
+    store = SQLiteUserStore(path, import_from=str(users_json))
+    assert store.get('alice')['user_id'] == '7'
+    assert store.get('bob')['user_id'].isdigit()
+    store.update_password_hash('alice', 'hash-a2')
+    assert SQLiteUserStore(path, import_from=str(users_json)).get('alice')['password_hash'] == 'hash-a2'
+
+
+def test_an_incomplete_backend_fails_when_created():
+    class NoUpdates(UserStore):
+        def get(self, username):
+            return None
+
+        def create(self, username, password_hash, email):
+            return {}
+
+    with pytest.raises(TypeError):
+        NoUpdates()
+
+
+@pytest.mark.parametrize('method, expected', [
+    ('scrypt', 'scrypt:32768:8:1'),
+    ('scrypt:1024:8:1', 'scrypt:1024:8:1'),
+    ('pbkdf2', f'pbkdf2:sha256:{password_hashing.DEFAULT_PBKDF2_ITERATIONS}'),
+    ('pbkdf2:sha512:1000', 'pbkdf2:sha512:1000'),
+])
+def test_canonical_method(method, expected):
+    assert canonical_method(method) == expected
+    if method == expected:
+        # Explicit, cheap parameters: check against the prefix Werkzeug writes
+        assert generate_password_hash('', method).split('$', 1)[0] == expected
+
+
+def test_needs_rehash_does_not_hash(monkeypatch):
+    hasher = PasswordHasher(method='scrypt')
+    monkeypatch.setattr(password_hashing, 'generate_password_hash', pytest.fail)
+    assert not hasher.needs_rehash('scrypt:32768:8:1$salt$digest')
+    assert hasher.needs_rehash('scrypt:16384:8:1$salt$digest')
+    assert hasher.needs_rehash('pbkdf2:sha256:600000$salt$digest')
+
+
+def test_login_upgrades_an_outdated_hash(monkeypatch):
+    import app as webapp
+    monkeypatch.setattr(webapp, 'password_hasher', PasswordHasher(method=NEW_METHOD))
+    webapp.user_store.create('rehash-user', generate_password_hash('secret', OLD_METHOD), 'rehash@example.com')
+    client = webapp.app.test_client()
+    assert client.post('/login', data={'username': 'rehash-user', 'password': 'wrong'}).status_code == 200
+    assert webapp.user_store.get('rehash-user')['password_hash'].startswith(OLD_METHOD + '$')
+    assert client.post('/login', data={'username': 'rehash-user', 'password': 'secret'}).status_code == 302
+    upgraded = webapp.user_store.get('rehash-user')['password_hash']
+    assert upgraded.startswith(NEW_METHOD + '$')
+    assert client.post('/login', data={'username': 'rehash-user', 'password': 'secret'}).status_code == 302
+    assert webapp.user_store.get('rehash-user')['password_hash'] == upgraded
@@ -0,0 +1,291 @@
+# user_store.py
+"""
+Pluggable storage for user accounts.
+
+The default SQLite backend keeps users in a table indexed by username, so login and
+registration cost one indexed lookup/insert however many accounts exist, and user
+IDs come from an AUTOINCREMENT key instead of len(users) + 1. WAL mode lets several
+gunicorn workers read while one writes. The JSON backend keeps the original
+users.json layout for deployments that still want it.
+
+Select the backend with USER_STORE=sqlite|json (default sqlite). The SQLite
+database (USER_DB, default users.db) imports users.json once on first use; the
+import can also be run by hand:
+
+    python -m user_store import users.json
+"""
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlite_connections import ThreadLocalConnection
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+USERS_FILE = os.getenv('USERS_FILE', 'users.json')
+USER_DB = os.getenv('USER_DB', 'users.db')
+
+
+@contextmanager
+def _file_lock(path):
+    """Hold an exclusive advisory lock on path for the duration of the block."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class UserExistsError(Exception):
+    """Raised when registering a username that is already taken."""
+
+
+class UserStore(ABC):
+    """Interface shared by the storage backends. Records are dicts with user_id,
+    password_hash, email and created_at; user_id is always a string."""
+
+    @abstractmethod
+    def get(self, username):
+        """The user's record, or None."""
+
+    @abstractmethod
+    def create(self, username, password_hash, email):
+        """Add a user and return the record; raises UserExistsError if the name is taken."""
+
+    @abstractmethod
+    def update_password_hash(self, username, password_hash):
+        """Replace a user's password hash; does nothing for an unknown user."""
+
+
+class JSONUserStore(UserStore):
+    """
+    Users kept as one JSON object in a file, keyed by username.
+
+    The parsed dict is cached in process and only re-parsed when the file's
+    (mtime, size, inode) signature changes, so a login burst costs a stat() per
+    request rather than a full parse. Writes take an exclusive lock on a sidecar
+    lock file, so concurrent gunicorn workers never interleave read-modify-write
+    cycles, and replace the file atomically via a temp file and rename.
+    """
+
+    def __init__(self, path=USERS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._users = {}
+        self._signature = None
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            logger.warning(f"Error decoding JSON from {self.path}. Returning empty users dictionary.")
+            return {}
+        except Exception as e:
+            logger.error(f"Error loading users from {self.path}: {e}")
+            return {}
+
+    def load(self):
+        """Return the cached users dict, re-parsing the file only if it changed. Treat it as read-only."""
+        signature = self._stat_signature()
+        with self._lock:
+            if signature != self._signature or signature is None:
+                self._users = self._read()
+                self._signature = signature
+            return self._users
+
+    def save(self, users):
+        """Atomically replace the users file (compact JSON) and refresh the cache."""
+        with self._lock, _file_lock(self.path + '.lock'):
+            self._write_locked(users)
+
+    def get(self, username):
+        return self.load().get(username)
+
+    def create(self, username, password_hash, email):
+        with self._lock, _file_lock(self.path + '.lock'):
+            # Re-read under the cross-process lock so another worker's registration isn't lost.
+            signature = self._stat_signature()
+            users = self._read() if signature != self._signature or signature is None else self._users
+            if username in users:
+                raise UserExistsError(username)
+            # Next ID after the highest one in use, so deleted or imported records can't cause a collision.
+            user_id = str(max((int(u['user_id']) for u in users.values() if str(u.get('user_id', '')).isdigit()), default=0) + 1)
+            users = dict(users)
+            users[username] = {
+                'user_id': user_id,
+                'password_hash': password_hash,
+                'email': email,
+                'created_at': datetime.now().isoformat(),
+                'predictions': []
+            }
+            self._write_locked(users)
+            return users[username]
+
+    def update_password_hash(self, username, password_hash):
+        with self._lock, _file_lock(self.path + '.lock'):
+            signature = self._stat_signature()
+            users = self._read() if signature != self._signature or signature is None else self._users
+            if username not in users:
+                return
+            users = dict(users)
+            users[username] = dict(users[username], password_hash=password_hash)
+            self._write_locked(users)
+
+    def _write_locked(self, users):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp_path = os.path.join(directory, f".{os.path.basename(self.path)}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(users, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving users to {self.path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._users = users
+        self._signature = self._stat_signature()
+
+
+class SQLiteUserStore(UserStore):
+    """Users in an SQLite table with a unique index on username."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            email TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path=USER_DB, import_from=USERS_FILE):
+        self.path = path
+        self._connect = ThreadLocalConnection(path, timeout=30, row_factory=sqlite3.Row)
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        if import_from and conn.execute("SELECT 1 FROM meta WHERE key = 'imported_from'").fetchone() is None:
+            imported = import_users_json(self, import_from)
+            logger.info(f"Imported {imported} users from {import_from} into {self.path}")
+
+    @staticmethod
+    def _record(row):
+        if row is None:
+            return None
+        record = dict(row)
+        record['user_id'] = str(record['user_id'])
+        return record
+
+    def get(self, username):
+        row = self._connect().execute(
+            "SELECT user_id, password_hash, email, created_at FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        return self._record(row)
+
+    def create(self, username, password_hash, email):
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "INSERT INTO users (username, password_hash, email, created_at) VALUES (?, ?, ?, ?)",
+                (username, password_hash, email, datetime.now().isoformat())
+            )
+        except sqlite3.IntegrityError:
+            raise UserExistsError(username)
+        return self.get_by_id(cur.lastrowid)
+
+    def update_password_hash(self, username, password_hash):
+        self._connect().execute("UPDATE users SET password_hash = ? WHERE username = ?", (password_hash, username))
+
+    def get_by_id(self, user_id):
+        row = self._connect().execute(
+            "SELECT user_id, password_hash, email, created_at FROM users WHERE user_id = ?", (int(user_id),)
+        ).fetchone()
+        return self._record(row)
+
+
+def import_users_json(store, path=USERS_FILE):
+    """
+    Copy every user from a users.json file into an SQLite store, keeping their IDs
+    where possible. Runs in one transaction and is recorded in the meta table so it
+    happens only once. Returns the number of users imported.
+    """
+    users = JSONUserStore(path).load()
+    conn = store._connect()
+    imported = 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'imported_from'").fetchone() is not None:
+            conn.execute("ROLLBACK")
+            return 0
+        for username, user in users.items():
+            values = (username, user['password_hash'], user.get('email', ''), user.get('created_at') or datetime.now().isoformat())
+            user_id = str(user.get('user_id', ''))
+            try:
+                if user_id.isdigit():
+                    conn.execute("INSERT INTO users (user_id, username, password_hash, email, created_at) VALUES (?, ?, ?, ?, ?)",
+                                 (int(user_id),) + values)
+                else:
+                    raise sqlite3.IntegrityError("non-numeric user_id")
+            except sqlite3.IntegrityError:
+                if conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone():
+                    continue
+                logger.warning(f"User ID {user_id!r} of {username!r} is taken or invalid; allocating a new one.")
+                conn.execute("INSERT INTO users (username, password_hash, email, created_at) VALUES (?, ?, ?, ?)", values)
+            imported += 1
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('imported_from', ?)",
+                     (f"{os.path.abspath(path)} at {datetime.now().isoformat()}",))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return imported
+
+
+def get_user_store():
+    backend = os.getenv('USER_STORE', 'sqlite').lower()
+    if backend == 'json':
+        return JSONUserStore(USERS_FILE)
+    if backend == 'sqlite':
+        return SQLiteUserStore(USER_DB, import_from=USERS_FILE)
+    raise ValueError(f"Unknown USER_STORE backend: {backend}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != 'import':
+        print("Usage: python -m user_store import <users.json>")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    store = SQLiteUserStore(USER_DB, import_from=None)
+    print(f"Imported {import_users_json(store, sys.argv[2])} users into {USER_DB}")